@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+# lc_archive.py
+
+"""
+Shard files which pack many lightcurves into a single file on disk, to avoid creating huge numbers of small files in
+our lightcurve archive.
+
+Each shard file starts with a page containing a magic string, followed by an index pointer. This is followed by a
+sequence of lightcurve records in our columnar binary format (see <lc_columnar>), each starting on a page boundary,
+interleaved with JSON index segments. Each index segment lists the byte offset and metadata of the lightcurves written
+(or deleted) alongside it, and points to the previous segment; every so often, a segment containing the whole index is
+written instead, which ends the chain. The index pointer gives the position of the latest segment.
+
+The file is only ever appended to, apart from the index pointer, which is updated last, once the new records and
+index segment are safely on disk. A writer which crashes part way through therefore leaves the previous index intact.
+Writers take an exclusive lock on the shard, and readers take a shared lock while they read the index.
+"""
+
+import fcntl
+import json
+import os
+
+import numpy as np
+
+from .lc_codecs import default_filters
+from .lc_columnar import iter_columnar, json_default, page_size, read_columnar, write_columnar_to_handle
+from .lc_stream import default_chunk_length, rechunk_columns
+from .lightcurve import LightcurveArbitraryRaster, _implicit_zero_uncertainties
+from .settings import settings
+
+# Magic string at the start of every shard file
+shard_magic = b"PLATOLCA"
+
+# Magic string at the end of the index pointer
+pointer_magic = b"PLATOLCI"
+
+# The index pointer, which follows the shard magic string, contains the offset and length of the latest index segment,
+# followed by the pointer magic string
+pointer_size = 8 + 8 + len(pointer_magic)
+
+# Maximum number of index segments in a chain before the whole index is written again. The whole index is also written
+# again once the segments since it was last written list more lightcurves than it does, so that appending lightcurves
+# costs a constant amount of index-writing per lightcurve, on average.
+max_index_chain_length = 256
+
+# Cache of the indices of shard files we have already read, keyed by file path. Each entry is a tuple of the index
+# pointer it was read from, and the index.
+_index_cache = {}
+
+
+class LightcurveArchive:
+    """
+    A class representing a shard file, containing many lightcurves in our columnar binary format.
+    """
+
+    def __init__(self, directory, shard="lightcurves.shard"):
+        """
+        Open a shard file within our lightcurve archive.
+
+        :param directory:
+            The name of the directory inside the lightcurve archive where the shard file is stored.
+        :type directory:
+            str
+        :param shard:
+            The filename of the shard file.
+        :type shard:
+            str
+        """
+        self.directory = directory
+        self.shard = shard
+        self.file_path = os.path.join(settings['lcPath'], directory, shard)
+
+    @staticmethod
+    def _read_pointer(f):
+        """
+        Read the index pointer from an open shard file.
+
+        :param f:
+            File handle, opened in binary mode.
+        :return:
+            Tuple of (offset, length) of the latest index segment, or None if the shard does not yet have an index
+            pointer.
+        """
+        f.seek(len(shard_magic))
+        pointer = f.read(pointer_size)
+        if len(pointer) < pointer_size or pointer[16:] != pointer_magic:
+            return None
+        return int.from_bytes(pointer[0:8], 'little'), int.from_bytes(pointer[8:16], 'little')
+
+    @staticmethod
+    def _read_segment(f, pointer):
+        """
+        Read one index segment from an open shard file.
+
+        :param f:
+            File handle, opened in binary mode.
+        :param pointer:
+            Tuple of the (offset, length) of the segment.
+        :type pointer:
+            tuple
+        :return:
+            dict
+        """
+        f.seek(pointer[0])
+        return json.loads(f.read(pointer[1]).decode('utf-8'))
+
+    @classmethod
+    def _read_index_from_handle(cls, f, cached=None):
+        """
+        Read the index from an open shard file, by following the chain of index segments back from the index pointer.
+
+        :param f:
+            File handle, opened in binary mode.
+        :param cached:
+            Optionally, a tuple of (index pointer, index) read previously from the same file. Segments older than
+            the one this points to are not read again.
+        :type cached:
+            tuple
+        :return:
+            Tuple of (index pointer, index dictionary)
+        """
+        pointer = cls._read_pointer(f)
+        if pointer is None:
+            return None, {}
+        if cached is not None and cached[0] == pointer:
+            return cached
+
+        # Read segments, newest first, until we reach one which contains the whole index, or which we have already
+        # read
+        segments = []
+        index = {}
+        position = pointer
+        while position is not None:
+            if cached is not None and cached[0] == position:
+                index = dict(cached[1])
+                break
+            segment = cls._read_segment(f, pointer=position)
+            segments.append(segment)
+            position = tuple(segment['previous']) if segment['previous'] is not None else None
+
+        # Apply segments, oldest first. Deleted lightcurves have an entry of None.
+        for segment in reversed(segments):
+            for name, entry in segment['entries'].items():
+                if entry is None:
+                    index.pop(name, None)
+                else:
+                    index[name] = entry
+        return pointer, index
+
+    def index(self):
+        """
+        Return the index of this shard file, which maps the name of each lightcurve to its byte offset and metadata.
+        The index is cached in memory, and only the index segments written since it was cached are read.
+
+        :return:
+            dict
+        """
+        with open(self.file_path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                assert f.read(len(shard_magic)) == shard_magic, "File <{}> is not a shard file".format(self.file_path)
+                cached = self._read_index_from_handle(f, cached=_index_cache.get(self.file_path, None))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        _index_cache[self.file_path] = cached
+        return cached[1]
+
+    def names(self):
+        """
+        Return a list of the names of all the lightcurves in this shard file.
+
+        :return:
+            list
+        """
+        if not os.path.exists(self.file_path):
+            return []
+        return list(self.index().keys())
+
+    def __contains__(self, name):
+        return os.path.exists(self.file_path) and name in self.index()
+
+    def write(self, name, lightcurve, create_directory=True, codec=None, codec_level=None, shuffle=True):
+        """
+        Append a lightcurve to this shard file. If a lightcurve with the same name already exists, it is replaced in
+        the index (the space it occupied is not reclaimed).
+
+        :param name:
+            The name of the lightcurve within the shard.
+        :type name:
+            str
+        :param lightcurve:
+            The lightcurve to write.
+        :type lightcurve:
+            LightcurveArbitraryRaster
+        :param create_directory:
+            Boolean flag indicating whether we should create the parent directory, if it doesn't exist.
+        :type create_directory:
+            bool
+        :param codec:
+            The compression codec to use (see <lc_codecs>), or None to store the lightcurve uncompressed.
+        :type codec:
+            str
+        :param codec_level:
+            The compression level, or None to use the codec's default.
+        :type codec_level:
+            int
+        :param shuffle:
+            Boolean specifying whether we apply the delta and byte-shuffle pre-filters before compression.
+        :type shuffle:
+            bool
+        """
+        self.write_many(items=[(name, lightcurve, None)], create_directory=create_directory,
+                        codec=codec, codec_level=codec_level, shuffle=shuffle)
+
+    def write_many(self, items, create_directory=True, codec=None, codec_level=None, shuffle=True):
+        """
+        Append a list of lightcurves to this shard file, followed by a single index segment listing them all.
+
+        :param items:
+            List of tuples of (name, lightcurve, provenance). The provenance is an optional dictionary which is stored
+            in the index alongside the lightcurve, e.g. to record where it was converted from.
+        :type items:
+            list
+        :param create_directory:
+            Boolean flag indicating whether we should create the parent directory, if it doesn't exist.
+        :type create_directory:
+            bool
+        :param codec:
+            The compression codec to use (see <lc_codecs>), or None to store the lightcurves uncompressed.
+        :type codec:
+            str
+        :param codec_level:
+            The compression level, or None to use the codec's default.
+        :type codec_level:
+            int
+        :param shuffle:
+            Boolean specifying whether we apply the delta and byte-shuffle pre-filters before compression.
+        :type shuffle:
+            bool
+        """
+
+        if create_directory:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+
+        with open(self.file_path, "a+b") as f:
+            # Lock the shard, in case other processes are reading or writing it at the same time
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # Reopen for random-access writing; append mode would ignore our seeks
+                with open(self.file_path, "r+b") as out:
+                    self._prepare_for_writing(out=out)
+
+                    # Append the new lightcurves after everything already in the file, each starting on a page
+                    # boundary
+                    entries = {}
+                    for name, lightcurve, provenance in items:
+                        out.seek(0, os.SEEK_END)
+                        record_offset = -(-out.tell() // page_size) * page_size
+                        out.write(b'\0' * (record_offset - out.tell()))
+                        write_columnar_to_handle(out=out, columns={
+                            'times': lightcurve.times,
+                            'fluxes': lightcurve.fluxes,
+                            'flags': lightcurve.flags,
+                            'uncertainties': (lightcurve.uncertainties if lightcurve.has_uncertainties
+                                              else np.zeros_like(lightcurve.fluxes))
+                        }, codec=codec, codec_level=codec_level, filters=default_filters if shuffle else {},
+                            implicit_time=True)
+
+                        entries[name] = {
+                            'offset': record_offset,
+                            'metadata': lightcurve.metadata
+                        }
+                        if provenance is not None:
+                            entries[name]['provenance'] = provenance
+
+                    self._append_index_segment(out=out, entries=entries)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def provenance(self, name):
+        """
+        Return the provenance dictionary stored in the index alongside a lightcurve, or None if there isn't one.
+
+        :param name:
+            The name of the lightcurve within the shard.
+        :type name:
+            str
+        :return:
+            dict
+        """
+        if name not in self:
+            return None
+        return self.index()[name].get('provenance', None)
+
+    def _prepare_for_writing(self, out):
+        """
+        Write the first page of a new shard file, with an empty index. The shard must be locked for writing.
+
+        :param out:
+            File handle, opened for random-access writing in binary mode.
+        """
+        out.seek(0, os.SEEK_END)
+        if out.tell() == 0:
+            out.write(shard_magic)
+            out.write(b'\0' * (page_size - len(shard_magic)))
+            self._append_index_segment(out=out, entries={})
+
+    def _append_index_segment(self, out, entries):
+        """
+        Append an index segment to a shard file, and then point the index pointer at it. The shard must be locked for
+        writing.
+
+        :param out:
+            File handle, opened for random-access writing in binary mode.
+        :param entries:
+            The new index entries, keyed by lightcurve name. Entries of None mark deleted lightcurves.
+        :type entries:
+            dict
+        """
+        pointer = self._read_pointer(out)
+        latest = self._read_segment(out, pointer=pointer) if pointer is not None else None
+
+        # Start a new chain, containing the whole index, if the current one is getting long
+        if (latest is None or latest['chain_length'] >= max_index_chain_length or
+                latest['delta_size'] + len(entries) > latest['base_size']):
+            index = {}
+            if pointer is not None:
+                index = dict(self._read_index_from_handle(out, cached=_index_cache.get(self.file_path, None))[1])
+            for name, entry in entries.items():
+                if entry is None:
+                    index.pop(name, None)
+                else:
+                    index[name] = entry
+            segment = {
+                'entries': index,
+                'previous': None,
+                'chain_length': 1,
+                'base_size': len(index),
+                'delta_size': 0
+            }
+        else:
+            segment = {
+                'entries': entries,
+                'previous': pointer,
+                'chain_length': latest['chain_length'] + 1,
+                'base_size': latest['base_size'],
+                'delta_size': latest['delta_size'] + len(entries)
+            }
+
+        # Write the new segment after everything already in the file, and make sure it is on disk before we point to it
+        out.seek(0, os.SEEK_END)
+        segment_offset = out.tell()
+        segment_bytes = json.dumps(segment, default=json_default).encode('utf-8')
+        out.write(segment_bytes)
+        out.flush()
+        os.fsync(out.fileno())
+
+        # Finally, update the index pointer, which lies within the first page of the file
+        out.seek(len(shard_magic))
+        out.write(segment_offset.to_bytes(8, 'little'))
+        out.write(len(segment_bytes).to_bytes(8, 'little'))
+        out.write(pointer_magic)
+        out.flush()
+        os.fsync(out.fileno())
+
+    def delete(self, name):
+        """
+        Remove a lightcurve from the index of this shard file. The space it occupied is not reclaimed.
+
+        :param name:
+            The name of the lightcurve within the shard.
+        :type name:
+            str
+        """
+
+        if not os.path.exists(self.file_path):
+            return
+
+        with open(self.file_path, "r+b") as out:
+            fcntl.flock(out, fcntl.LOCK_EX)
+            try:
+                self._prepare_for_writing(out=out)
+                index = self._read_index_from_handle(out, cached=_index_cache.get(self.file_path, None))[1]
+                if name in index:
+                    self._append_index_segment(out=out, entries={name: None})
+            finally:
+                fcntl.flock(out, fcntl.LOCK_UN)
+
+    def read(self, name, cut_off_time=None, dtype_policy=None):
+        """
+        Read a lightcurve from this shard file. The lightcurve's columns are copy-on-write memory-mapped views of the
+        shard file, unless they were compressed when written.
+
+        :param name:
+            The name of the lightcurve within the shard.
+        :type name:
+            str
+        :param cut_off_time:
+            Only read lightcurve up to some cut off time
+        :type cut_off_time:
+            float
+        :param dtype_policy:
+            The numeric types used to store the lightcurve in memory (see <lc_dtype_policy>).
+        :type dtype_policy:
+            DtypePolicy
+        :return:
+            A <LightcurveArbitraryRaster> object.
+        """
+
+        index = self.index()
+        assert name in index, "Lightcurve <{}> not found in shard <{}>".format(name, self.file_path)
+        entry = index[name]
+
+        header, columns = read_columnar(file_path=self.file_path, cut_off_time=cut_off_time,
+                                        base_offset=entry['offset'])
+
+        metadata = {
+            **entry['metadata'],
+            'directory': self.directory,
+            'shard': self.shard,
+            'filename': name
+        }
+
+        # The lightcurve owns the arrays we have just read. Memory-mapped columns are private copy-on-write mappings,
+        # so updating them in place never modifies the shard file.
+        return LightcurveArbitraryRaster._from_adopted_arrays(times=columns['times'],
+                                                              fluxes=columns['fluxes'],
+                                                              uncertainties=_implicit_zero_uncertainties(
+                                                                  columns['uncertainties']),
+                                                              flags=columns['flags'],
+                                                              metadata=metadata,
+                                                              dtype_policy=dtype_policy
+                                                              )
+
+    def iter_read(self, name, chunk_length=None, chunk_duration=None, cut_off_time=None, dtype_policy=None):
+        """
+        Read a lightcurve from this shard file as a sequence of chunks, each of which is a <LightcurveArbitraryRaster>
+        object, so that the whole lightcurve never needs to be held in memory.
+
+        :param name:
+            The name of the lightcurve within the shard.
+        :type name:
+            str
+        :param chunk_length:
+            The number of samples in each chunk.
+        :type chunk_length:
+            int
+        :param chunk_duration:
+            Alternatively, the time span of each chunk (days).
+        :type chunk_duration:
+            float
+        :param cut_off_time:
+            Only read lightcurve up to some cut off time
+        :type cut_off_time:
+            float
+        :param dtype_policy:
+            The numeric types used to store each chunk in memory (see <lc_dtype_policy>).
+        :type dtype_policy:
+            DtypePolicy
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects.
+        """
+
+        index = self.index()
+        assert name in index, "Lightcurve <{}> not found in shard <{}>".format(name, self.file_path)
+        entry = index[name]
+
+        metadata = {
+            **entry['metadata'],
+            'directory': self.directory,
+            'shard': self.shard,
+            'filename': name
+        }
+
+        blocks = ([chunk['times'], chunk['fluxes'], chunk['flags'], chunk['uncertainties']]
+                  for chunk in iter_columnar(file_path=self.file_path, base_offset=entry['offset'],
+                                             chunk_length=chunk_length or default_chunk_length))
+
+        for times, fluxes, flags, uncertainties in rechunk_columns(blocks=blocks, chunk_length=chunk_length,
+                                                                   chunk_duration=chunk_duration,
+                                                                   cut_off_time=cut_off_time):
+            yield LightcurveArbitraryRaster(times=times,
+                                            fluxes=fluxes,
+                                            uncertainties=uncertainties,
+                                            flags=flags,
+                                            metadata={**metadata},
+                                            dtype_policy=dtype_policy
+                                            )
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# lc_batch.py
+
+"""
+A container for many lightcurves which are sampled on the same raster of times, such as the grids of lightcurves
+generated by injection-recovery experiments. The fluxes, uncertainties and flags of all the lightcurves are stored as
+contiguous 2-D arrays, with one row per lightcurve, so that operations can be applied to every lightcurve at once.
+"""
+
+import numpy as np
+
+from .lc_dtype_policy import default_dtype_policy
+from .lightcurve import LightcurveArbitraryRaster
+from .lightcurve_resample import ResamplingPlan
+
+
+class LightcurveBatch:
+    """
+    A class representing many lightcurves which share a single raster of times.
+    """
+
+    def __init__(self, times, fluxes, uncertainties=None, flags=None, metadata=None, dtype_policy=None):
+        """
+        Create a batch of lightcurves on a shared raster of times.
+
+        :param times:
+            The times of the data points (days), shared by every lightcurve in the batch.
+        :type times:
+            np.ndarray
+        :param fluxes:
+            2-D array of the light fluxes, with one row per lightcurve and one column per data point.
+        :type fluxes:
+            np.ndarray
+        :param uncertainties:
+            2-D array of the uncertainty in each data point.
+        :type uncertainties:
+            np.ndarray
+        :param flags:
+            2-D array of the flag associated with each data point.
+        :type flags:
+            np.ndarray
+        :param metadata:
+            List of the metadata dictionaries of each lightcurve.
+        :type metadata:
+            list
+        :param dtype_policy:
+            The numeric types used to store the fluxes, uncertainties and flags (see <lc_dtype_policy>). If None,
+            everything is stored at double precision.
+        :type dtype_policy:
+            DtypePolicy
+        """
+
+        # Check inputs
+        assert isinstance(times, np.ndarray) and times.ndim == 1, "Times must be a one-dimensional array"
+        assert isinstance(fluxes, np.ndarray) and fluxes.ndim == 2, "Fluxes must be a two-dimensional array"
+        assert fluxes.shape[1] == len(times), "Fluxes must have one column per time point"
+
+        if dtype_policy is None:
+            dtype_policy = default_dtype_policy
+
+        # Make uncertainty zero and unset all flags if not specified
+        if uncertainties is None:
+            uncertainties = np.zeros(fluxes.shape, dtype=dtype_policy.flux_dtype)
+        if flags is None:
+            flags = np.zeros(fluxes.shape, dtype=dtype_policy.flag_dtype)
+        assert uncertainties.shape == fluxes.shape, "Uncertainties must have the same shape as the fluxes"
+        assert flags.shape == fluxes.shape, "Flags must have the same shape as the fluxes"
+
+        # Make empty metadata dictionaries if none were specified
+        if metadata is None:
+            metadata = [{} for i in range(fluxes.shape[0])]
+        assert len(metadata) == fluxes.shape[0], "Must have one metadata dictionary per lightcurve"
+
+        # Store the data, making sure each row is contiguous in memory
+        self.dtype_policy = dtype_policy
+        self.times = times  # days
+        self.fluxes = np.ascontiguousarray(dtype_policy.cast_fluxes(fluxes))
+        self.uncertainties = np.ascontiguousarray(dtype_policy.cast_fluxes(uncertainties))
+        self.flags = np.ascontiguousarray(dtype_policy.cast_flags(flags))
+        self.metadata = list(metadata)
+
+    @classmethod
+    def from_lightcurves(cls, lightcurves):
+        """
+        Pack a list of lightcurves, which must all be sampled on the same raster of times, into a batch. The batch
+        uses the dtype policy of the first lightcurve.
+
+        :param lightcurves:
+            The lightcurves to pack.
+        :type lightcurves:
+            list of <LightcurveArbitraryRaster>
+        :return:
+            LightcurveBatch
+        """
+        assert len(lightcurves) > 0, "Cannot create an empty batch of lightcurves"
+        times = lightcurves[0].times
+        for lightcurve in lightcurves[1:]:
+            assert lightcurve.times is times or np.array_equal(lightcurve.times, times), \
+                "All the lightcurves in a batch must be sampled on the same raster of times"
+
+        dtype_policy = lightcurves[0].dtype_policy
+        fluxes = np.stack([lightcurve.fluxes for lightcurve in lightcurves])
+        uncertainties = np.zeros(fluxes.shape, dtype=dtype_policy.flux_dtype)
+        for index, lightcurve in enumerate(lightcurves):
+            if lightcurve.has_uncertainties:
+                uncertainties[index] = lightcurve.uncertainties
+
+        return cls(times=times,
+                   fluxes=fluxes,
+                   uncertainties=uncertainties,
+                   flags=np.stack([dtype_policy.cast_flags(lightcurve.flags) for lightcurve in lightcurves]),
+                   metadata=[{**lightcurve.metadata} for lightcurve in lightcurves],
+                   dtype_policy=dtype_policy)
+
+    def __len__(self):
+        return self.fluxes.shape[0]
+
+    def __getitem__(self, index):
+        return self.row(index=index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index=index)
+
+    def row(self, index):
+        """
+        Return one lightcurve from this batch. Its arrays are read-only views of the rows of the batch, and its
+        metadata is the batch's own dictionary, so nothing is copied, and changes to its metadata are made to the batch.
+
+        :param index:
+            The row number of the lightcurve.
+        :type index:
+            int
+        :return:
+            LightcurveArbitraryRaster
+        """
+        assert isinstance(index, (int, np.integer)), "Lightcurves must be selected from a batch by row number"
+        return LightcurveArbitraryRaster(times=self.times,
+                                         fluxes=self.fluxes[index],
+                                         uncertainties=self.uncertainties[index],
+                                         flags=self.flags[index],
+                                         metadata=self.metadata[index],
+                                         dtype_policy=self.dtype_policy)
+
+    def metadata_column(self, key, default=np.nan):
+        """
+        Return one metadata field of every lightcurve in this batch, as an array, e.g. to select rows.
+
+        :param key:
+            The metadata field to return.
+        :type key:
+            str
+        :param default:
+            The value to use for lightcurves which do not have this metadata field.
+        :return:
+            np.ndarray
+        """
+        return np.array([item.get(key, default) for item in self.metadata])
+
+    def statistics(self):
+        """
+        Return summary statistics of the fluxes of every lightcurve in this batch.
+
+        :return:
+            Dictionary of arrays, each with one entry per lightcurve.
+        """
+        return {
+            'mean': np.mean(self.fluxes, axis=1),
+            'median': np.median(self.fluxes, axis=1),
+            'std': np.std(self.fluxes, axis=1),
+            'min': np.min(self.fluxes, axis=1),
+            'max': np.max(self.fluxes, axis=1)
+        }
+
+    def subtract_median(self):
+        """
+        Subtract the median flux of each lightcurve in this batch from its fluxes. The batch's flux array is replaced
+        with a new one, rather than being modified in place, since it may be shared with the array passed to the
+        constructor, or with lightcurves returned by <row>.
+
+        :return:
+            Array of the median flux of each lightcurve.
+        """
+        medians = np.median(self.fluxes, axis=1)
+        self.fluxes = np.subtract(self.fluxes, medians[:, np.newaxis], out=np.empty_like(self.fluxes))
+        return medians
+
+    def normalise(self):
+        """
+        Divide the fluxes and uncertainties of each lightcurve in this batch by its mean flux. The batch's arrays are
+        replaced with new ones, rather than being modified in place (see <subtract_median>).
+
+        :return:
+            Array of the mean flux of each lightcurve.
+        """
+        means = np.mean(self.fluxes, axis=1)
+        self.fluxes = np.divide(self.fluxes, means[:, np.newaxis], out=np.empty_like(self.fluxes))
+        self.uncertainties = np.divide(self.uncertainties, np.abs(means[:, np.newaxis]),
+                                       out=np.empty_like(self.uncertainties))
+        return means
+
+    def onto_raster(self, output_raster, resample_flags=True):
+        """
+        Resample every lightcurve in this batch onto a new raster of times, conserving the integrated flux in the same
+        way as <LightcurveResampler>. Because the input and output rasters are the same for every lightcurve, they are
+        planned only once (see <ResamplingPlan>).
+
+        :param output_raster:
+            The raster we should resample the lightcurves onto.
+        :type output_raster:
+            np.ndarray
+        :param resample_flags:
+            Should we bother resampling the lightcurves' flags as the data itself? If not, the flags will be cleared.
+        :type resample_flags:
+            bool
+        :return:
+            LightcurveBatch
+        """
+        output_raster = np.asarray(output_raster)
+        plan = ResamplingPlan(input_raster=self.times, output_raster=output_raster)
+
+        return LightcurveBatch(times=output_raster,
+                               fluxes=plan.apply(values=self.fluxes),
+                               uncertainties=plan.apply(values=self.uncertainties),
+                               flags=(plan.apply(values=self.flags) > 0.5).astype(self.flags.dtype)
+                               if resample_flags else None,
+                               metadata=[{**item} for item in self.metadata],
+                               dtype_policy=self.dtype_policy)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# lc_codecs.py
+
+"""
+Compression codecs, and lossless numerical pre-filters, used to store the columns of binary lightcurves.
+
+Each column is split into blocks of a fixed number of samples, and each block is filtered and compressed separately, so
+that a time window can be read without decompressing the whole column. The available filters are:
+
+* <delta> -- replace each value by its difference from the previous value, computed on the integer representation of
+  the bytes, so that it is exactly reversible. Slowly varying columns, such as time, become runs of near-identical small
+  numbers.
+
+* <shuffle> -- transpose the bytes of the values, so that all the first bytes are stored together, then all the
+  second bytes, etc. Floating-point exponents and high-order mantissa bytes are highly repetitive, and compress much
+  better once grouped together.
+"""
+
+import bz2
+import lzma
+import zlib
+
+import numpy as np
+
+# Number of samples in each independently compressed block of a column
+default_block_length = 65536
+
+# Compression codecs, each defined by a compression function (taking data and compression level), a decompression
+# function, and a default compression level
+codecs = {
+    'none': {
+        'compress': lambda data, level: bytes(data),
+        'decompress': lambda data: data,
+        'default_level': None
+    },
+    'zlib': {
+        'compress': lambda data, level: zlib.compress(data, level),
+        'decompress': lambda data: zlib.decompress(data),
+        'default_level': 6
+    },
+    'lzma': {
+        'compress': lambda data, level: lzma.compress(data, preset=level),
+        'decompress': lambda data: lzma.decompress(data),
+        'default_level': 6
+    },
+    'bz2': {
+        'compress': lambda data, level: bz2.compress(data, compresslevel=level),
+        'decompress': lambda data: bz2.decompress(data),
+        'default_level': 9
+    }
+}
+
+# Filters which are applied by default to each column when <shuffle> is requested
+default_filters = {
+    'times': ['delta', 'shuffle'],
+    'fluxes': ['shuffle']
+}
+
+
+def _integer_view(values):
+    """
+    View an array as unsigned integers of the same width, so that arithmetic on it is exactly reversible.
+
+    :param values:
+        Contiguous numpy array
+    :type values:
+        np.ndarray
+    :return:
+        np.ndarray
+    """
+    return values.view(np.dtype('<u{:d}'.format(values.dtype.itemsize)))
+
+
+def apply_filters(values, filters):
+    """
+    Apply a sequence of pre-filters to an array of values, returning the filtered bytes.
+
+    :param values:
+        Contiguous numpy array of values.
+    :type values:
+        np.ndarray
+    :param filters:
+        List of the names of the filters to apply, in order.
+    :type filters:
+        list
+    :return:
+        bytes-like object
+    """
+    for item in filters:
+        if item == 'delta':
+            integers = _integer_view(values)
+            deltas = np.empty_like(integers)
+            deltas[:1] = integers[:1]
+            np.subtract(integers[1:], integers[:-1], out=deltas[1:])
+            values = deltas.view(values.dtype)
+        elif item == 'shuffle':
+            values = np.ascontiguousarray(values.view(np.uint8).reshape((-1, values.dtype.itemsize)).T)
+        else:
+            raise ValueError("Unknown filter <{}>".format(item))
+    return values.data
+
+
+def reverse_filters(data, dtype, filters):
+    """
+    Reverse a sequence of pre-filters which were applied to an array of values.
+
+    :param data:
+        The filtered bytes.
+    :type data:
+        bytes
+    :param dtype:
+        The data type of the original array.
+    :type dtype:
+        np.dtype
+    :param filters:
+        List of the names of the filters which were applied, in order.
+    :type filters:
+        list
+    :return:
+        np.ndarray
+    """
+    values = np.frombuffer(data, dtype=dtype)
+    for item in reversed(filters):
+        if item == 'delta':
+            # Cumulative sums wrap around on overflow, exactly undoing the wrapped differences
+            values = np.cumsum(_integer_view(values), dtype=_integer_view(values).dtype).view(dtype)
+        elif item == 'shuffle':
+            values = np.ascontiguousarray(np.frombuffer(values.data, dtype=np.uint8).reshape((dtype.itemsize, -1)).T)
+            values = values.view(dtype).reshape(-1)
+        else:
+            raise ValueError("Unknown filter <{}>".format(item))
+    return values
+
+
+def encode_column(values, codec, level=None, filters=(), block_length=default_block_length):
+    """
+    Filter and compress a column of data, in independent blocks.
+
+    :param values:
+        Contiguous one-dimensional numpy array.
+    :type values:
+        np.ndarray
+    :param codec:
+        The name of the compression codec to use.
+    :type codec:
+        str
+    :param level:
+        The compression level, or None to use the codec's default.
+    :type level:
+        int
+    :param filters:
+        List of the names of the filters to apply before compression.
+    :type filters:
+        list
+    :param block_length:
+        Number of samples in each independently compressed block.
+    :type block_length:
+        int
+    :return:
+        Tuple of (list of compressed blocks as bytes, description of encoding as a dictionary)
+    """
+    assert codec in codecs, "Unknown compression codec <{}>".format(codec)
+    if level is None:
+        level = codecs[codec]['default_level']
+
+    blocks = []
+    for start in range(0, len(values), block_length):
+        filtered = apply_filters(values=values[start:start + block_length], filters=filters)
+        blocks.append(codecs[codec]['compress'](filtered, level))
+
+    encoding = {
+        'codec': codec,
+        'level': level,
+        'filters': list(filters),
+        'block_length': block_length,
+        'block_sizes': [len(block) for block in blocks]
+    }
+    return blocks, encoding
+
+
+def decode_column(data, dtype, length, encoding, block_range=None):
+    """
+    Decompress a column of data which was encoded by <encode_column>.
+
+    :param data:
+        The compressed blocks, concatenated, as a bytes-like object.
+    :type data:
+        memoryview
+    :param dtype:
+        The data type of the column.
+    :type dtype:
+        np.dtype
+    :param length:
+        The number of samples in the column.
+    :type length:
+        int
+    :param encoding:
+        The description of the encoding returned by <encode_column>.
+    :type encoding:
+        dict
+    :param block_range:
+        Optionally, a tuple of the (first, last+1) blocks to decode. If None, the whole column is decoded.
+    :type block_range:
+        tuple
+    :return:
+        np.ndarray
+    """
+    dtype = np.dtype(dtype)
+    decompress = codecs[encoding['codec']]['decompress']
+    block_length = encoding['block_length']
+    block_sizes = encoding['block_sizes']
+    block_offsets = np.concatenate([[0], np.cumsum(block_sizes, dtype=np.int64)])
+
+    if block_range is None:
+        block_range = (0, len(block_sizes))
+    first_block, end_block = block_range
+
+    output = np.empty(max(0, min(length, end_block * block_length) - first_block * block_length), dtype=dtype)
+    for block in range(first_block, end_block):
+        raw = decompress(data[block_offsets[block]:block_offsets[block + 1]])
+        values = reverse_filters(data=raw, dtype=dtype, filters=encoding['filters'])
+        position = (block - first_block) * block_length
+        output[position:position + len(values)] = values
+    return output
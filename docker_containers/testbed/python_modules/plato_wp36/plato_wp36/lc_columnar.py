@@ -0,0 +1,581 @@
+# -*- coding: utf-8 -*-
+# lc_columnar.py
+
+"""
+Read and write lightcurves in a columnar binary format, which can be memory-mapped.
+
+Each file starts with an 8-byte magic string, followed by the length of a JSON header as an 8-byte little-endian
+integer, and then the JSON header itself. The header describes the data type, offset and length of each column of
+data. Each column is stored contiguously, starting on a page boundary, so that reading a time window from a
+memory-mapped file only touches the pages which contain that window.
+
+Columns may optionally be compressed, using one of the codecs in <lc_codecs>. Compressed columns are stored as a
+sequence of independently compressed blocks, so that a time window can still be read without decompressing the whole
+file, but they are decompressed into memory rather than being memory-mapped.
+
+If the time axis lies on a fixed step, it may be stored implicitly, as a start time, a step, and a packed bit mask of
+which time steps are present (see <lc_time_axis>). Floating-point columns may be stored at single precision, in which
+case the largest rounding error is recorded in the header, and they are converted back to double precision when read.
+
+The header may also contain the lightcurve's metadata, so that the whole lightcurve can be read with a single open.
+"""
+
+import json
+
+import numpy as np
+
+from .lc_codecs import decode_column, encode_column
+from .lc_time_axis import ImplicitTimeAxis
+
+# Magic string at the start of every columnar lightcurve file
+magic = b"PLATOLC1"
+
+# Version number of the file format. Version 2 added compressed columns, and version 3 added implicit time axes and
+# single-precision storage. Files are written with the lowest version number which supports the features they use.
+format_version = 3
+
+# Columns are aligned to multiples of this many bytes within the file
+page_size = 4096
+
+
+def json_default(item):
+    """
+    Convert numpy types, which the JSON encoder does not understand, into native Python types.
+
+    :param item:
+        The object which could not be serialised.
+    :return:
+        A JSON-serialisable object
+    """
+    if isinstance(item, np.generic):
+        return item.item()
+    if isinstance(item, np.ndarray):
+        return item.tolist()
+    return str(item)
+
+
+def _align(position):
+    """
+    Round a byte position within a file up to the next page boundary.
+
+    :param position:
+        Byte position within a file
+    :type position:
+        int
+    :return:
+        int
+    """
+    return -(-position // page_size) * page_size
+
+
+def is_columnar(file_path):
+    """
+    Test whether a file is a lightcurve stored in our columnar binary format.
+
+    :param file_path:
+        The path of the file to test.
+    :type file_path:
+        str
+    :return:
+        bool
+    """
+    with open(file_path, "rb") as f:
+        return f.read(len(magic)) == magic
+
+
+def write_columnar(file_path, columns, time_column="times", codec=None, codec_level=None, filters=None,
+                   implicit_time=False, float32_columns=(), metadata=None):
+    """
+    Write columns of data to a file in our columnar binary format.
+
+    :param file_path:
+        The path of the file to write.
+    :type file_path:
+        str
+    :param columns:
+        Dictionary of the columns of data to write, each a one-dimensional numpy array of the same length.
+    :type columns:
+        dict
+    :param time_column:
+        The name of the column which contains the time axis.
+    :type time_column:
+        str
+    :param codec:
+        The name of the compression codec to use (see <lc_codecs>), or None to store columns uncompressed.
+    :type codec:
+        str
+    :param codec_level:
+        The compression level, or None to use the codec's default.
+    :type codec_level:
+        int
+    :param filters:
+        Dictionary of the lists of pre-filters to apply to each column before compression, e.g. {'times': ['delta']}.
+    :type filters:
+        dict
+    :param implicit_time:
+        Boolean flag indicating whether we store the time axis as a start time, step and mask of missing samples, if
+        this reproduces it exactly.
+    :type implicit_time:
+        bool
+    :param float32_columns:
+        List of the names of the columns which we store at single precision.
+    :type float32_columns:
+        list
+    :param metadata:
+        Dictionary of metadata to embed in the header, or None.
+    :type metadata:
+        dict
+    """
+    with open(file_path, "wb") as out:
+        write_columnar_to_handle(out=out, columns=columns, time_column=time_column,
+                                 codec=codec, codec_level=codec_level, filters=filters,
+                                 implicit_time=implicit_time, float32_columns=float32_columns, metadata=metadata)
+
+
+def write_columnar_to_handle(out, columns, time_column="times", codec=None, codec_level=None, filters=None,
+                             implicit_time=False, float32_columns=(), metadata=None):
+    """
+    Write columns of data in our columnar binary format to an open file handle, starting at its current position.
+    The current position should be on a page boundary. Column offsets are recorded relative to the start of the
+    record, so that records can be embedded within larger files.
+
+    :param out:
+        The file handle, opened for writing in binary mode.
+    :param columns:
+        Dictionary of the columns of data to write, each a one-dimensional numpy array of the same length.
+    :type columns:
+        dict
+    :param time_column:
+        The name of the column which contains the time axis. We record whether it is sorted, which allows time windows
+        to be located by binary search when the file is read.
+    :type time_column:
+        str
+    :param codec:
+        The name of the compression codec to use (see <lc_codecs>), or None to store columns uncompressed.
+    :type codec:
+        str
+    :param codec_level:
+        The compression level, or None to use the codec's default.
+    :type codec_level:
+        int
+    :param filters:
+        Dictionary of the lists of pre-filters to apply to each column before compression, e.g. {'times': ['delta']}.
+    :type filters:
+        dict
+    :param implicit_time:
+        Boolean flag indicating whether we store the time axis as a start time, step and mask of missing samples, if
+        this reproduces it exactly.
+    :type implicit_time:
+        bool
+    :param float32_columns:
+        List of the names of the columns which we store at single precision.
+    :type float32_columns:
+        list
+    :param metadata:
+        Dictionary of metadata to embed in the header, or None.
+    :type metadata:
+        dict
+    """
+
+    # All columns are stored as little-endian contiguous arrays
+    columns = {name: np.ascontiguousarray(values, dtype=np.asarray(values).dtype.newbyteorder('<'))
+               for name, values in columns.items()}
+
+    length = len(columns[time_column])
+    for name, values in columns.items():
+        assert values.ndim == 1, "Column <{}> should have exactly one dimension".format(name)
+        assert len(values) == length, "Column <{}> has a different length to the time axis".format(name)
+
+    times = columns[time_column]
+    time_sorted = bool(np.all(times[1:] >= times[:-1]))
+
+    # Replace the time column with an implicit time axis, if it lies exactly on a fixed step
+    time_axis = ImplicitTimeAxis.detect(times=times) if implicit_time else None
+    if time_axis is not None:
+        del columns[time_column]
+        if time_axis.mask is not None:
+            columns['time_mask'] = time_axis.mask
+
+    # Store columns at single precision, if requested, recording the largest rounding error
+    column_extras = {}
+    for name in float32_columns:
+        values = columns[name].astype('<f4')
+        column_extras[name] = {
+            'upcast_dtype': columns[name].dtype.str,
+            'max_error': float(np.max(np.abs(values - columns[name]))) if length > 0 else 0
+        }
+        columns[name] = values
+
+    # Compress each column, if requested
+    if filters is None:
+        filters = {}
+    encoded = {}
+    if codec is not None:
+        for name, values in columns.items():
+            encoded[name] = encode_column(values=values, codec=codec, level=codec_level,
+                                          filters=filters.get(name, []))
+
+    if time_axis is not None or column_extras:
+        version = 3
+    elif encoded:
+        version = 2
+    else:
+        version = 1
+
+    header = {
+        'version': version,
+        'length': length,
+        'time_column': time_column,
+        'time_unit': 'days',
+        'time_sorted': time_sorted,
+        'columns': []
+    }
+    if time_axis is not None:
+        header['time_axis'] = {
+            **time_axis.to_dict(),
+            'mask_column': 'time_mask' if time_axis.mask is not None else None
+        }
+    if metadata is not None:
+        header['metadata'] = metadata
+
+    # The column offsets depend on the size of the header, so iterate until the header's size is stable
+    data_start = page_size
+    while True:
+        position = data_start
+        header['columns'] = []
+        for name, values in columns.items():
+            column = {
+                'name': name,
+                'dtype': values.dtype.str,
+                'offset': position,
+                'nbytes': values.nbytes,
+                **column_extras.get(name, {})
+            }
+            if len(values) != length:
+                column['length'] = len(values)
+            if name in encoded:
+                column['nbytes'] = sum(len(block) for block in encoded[name][0])
+                column['encoding'] = encoded[name][1]
+            header['columns'].append(column)
+            position = _align(position + column['nbytes'])
+
+        header_bytes = json.dumps(header, default=json_default).encode('utf-8')
+        required_start = _align(len(magic) + 8 + len(header_bytes))
+        if required_start <= data_start:
+            break
+        data_start = required_start
+
+    # Write the record
+    record_start = out.tell()
+    out.write(magic)
+    out.write(len(header_bytes).to_bytes(8, 'little'))
+    out.write(header_bytes)
+    for column, (name, values) in zip(header['columns'], columns.items()):
+        out.write(b'\0' * (record_start + column['offset'] - out.tell()))
+        if name in encoded:
+            for block in encoded[name][0]:
+                out.write(block)
+        else:
+            out.write(values.data)
+
+
+def read_columnar_header(file_path, base_offset=0):
+    """
+    Read the JSON header at the start of a file in our columnar binary format.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :return:
+        dict
+    """
+    if isinstance(file_path, str):
+        with open(file_path, "rb") as f:
+            return read_columnar_header(file_path=f, base_offset=base_offset)
+
+    # We have been passed a file handle which is already open
+    f = file_path
+    f.seek(base_offset)
+    assert f.read(len(magic)) == magic, "File <{}> is not a columnar lightcurve".format(f.name)
+    header_length = int.from_bytes(f.read(8), 'little')
+    header = json.loads(f.read(header_length).decode('utf-8'))
+
+    assert header['version'] <= format_version, \
+        "File <{}> has columnar format version {}, newer than we understand".format(f.name, header['version'])
+    return header
+
+
+def _read_encoded_column(file_path, column, length, base_offset=0, block_range=None):
+    """
+    Read and decompress a compressed column from a file in our columnar binary format.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param column:
+        The description of the column, from the file's header.
+    :type column:
+        dict
+    :param length:
+        The number of samples in the column.
+    :type length:
+        int
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :param block_range:
+        Optionally, a tuple of the (first, last+1) compressed blocks to decode. If None, the whole column is decoded.
+    :type block_range:
+        tuple
+    :return:
+        np.ndarray
+    """
+    data = np.memmap(file_path, dtype=np.uint8, mode='r', offset=base_offset + column['offset'],
+                     shape=(column['nbytes'],))
+    return decode_column(data=memoryview(data), dtype=column['dtype'], length=length, encoding=column['encoding'],
+                         block_range=block_range)
+
+
+def _read_column(file_path, header, name, base_offset=0, block_range=None):
+    """
+    Read a single column from a file in our columnar binary format, either as a memory-mapped view or by
+    decompressing it.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param header:
+        The file's header.
+    :type header:
+        dict
+    :param name:
+        The name of the column to read.
+    :type name:
+        str
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :param block_range:
+        Optionally, a tuple of the (first, last+1) compressed blocks to decode. If None, the whole column is read.
+        Ignored for uncompressed columns.
+    :type block_range:
+        tuple
+    :return:
+        np.ndarray
+    """
+    column = [item for item in header['columns'] if item['name'] == name][0]
+    column_length = column.get('length', header['length'])
+    if column_length == 0:
+        return np.zeros(0, dtype=np.dtype(column['dtype']))
+    elif 'encoding' in column:
+        return _read_encoded_column(file_path=file_path, column=column, length=column_length,
+                                    base_offset=base_offset, block_range=block_range)
+    else:
+        # Return a plain ndarray view onto the memory map, rather than the <np.memmap> subclass
+        return np.asarray(np.memmap(file_path, dtype=np.dtype(column['dtype']), mode='c',
+                                    offset=base_offset + column['offset'], shape=(column_length,)))
+
+
+def _read_time_axis(file_path, header, base_offset=0):
+    """
+    Reconstruct the implicit time axis of a file in our columnar binary format, if it has one.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param header:
+        The file's header.
+    :type header:
+        dict
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :return:
+        Tuple of (ImplicitTimeAxis or None, name of the column containing the time axis's mask, or None)
+    """
+    if 'time_axis' not in header:
+        return None, None
+
+    time_axis_info = header['time_axis']
+    mask_column = time_axis_info['mask_column']
+    mask = None
+    if mask_column is not None:
+        mask = _read_column(file_path=file_path, header=header, name=mask_column, base_offset=base_offset)
+    time_axis = ImplicitTimeAxis(start=time_axis_info['start'], step=time_axis_info['step'],
+                                 scale=time_axis_info['scale'], slots=time_axis_info['slots'], mask=mask)
+    return time_axis, mask_column
+
+
+def read_columnar(file_path, cut_off_time=None, base_offset=0):
+    """
+    Open a file in our columnar binary format, returning memory-mapped views of each column. The views are
+    copy-on-write, so modifying them never alters the file on disk. Compressed columns are decompressed into memory, and
+    an implicit time axis is returned as an <ImplicitTimeAxis> object, which is only expanded when it is needed.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param cut_off_time:
+        Only return data up to some cut off time (days).
+    :type cut_off_time:
+        float
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :return:
+        Tuple of (header dictionary, dictionary of column arrays)
+    """
+
+    header = read_columnar_header(file_path=file_path, base_offset=base_offset)
+    length = header['length']
+    column_info = {column['name']: column for column in header['columns']}
+
+    def read_column(name, block_range=None):
+        return _read_column(file_path=file_path, header=header, name=name, base_offset=base_offset,
+                            block_range=block_range)
+
+    # Reconstruct an implicit time axis, if there is one
+    time_axis, mask_column = _read_time_axis(file_path=file_path, header=header, base_offset=base_offset)
+
+    # Work out how many samples precede the cut-off time, if this can be done without reading every column
+    end = None
+    decoded = {}
+    if cut_off_time is not None and time_axis is not None:
+        end = time_axis.searchsorted(cut_off_time)
+    elif cut_off_time is not None and header['time_sorted'] and length > 0:
+        time_info = column_info[header['time_column']]
+        if 'encoding' in time_info:
+            # The time axis is compressed, so only decompress the blocks we need to reach the cut-off time
+            block_count = len(time_info['encoding']['block_sizes'])
+            blocks = []
+            for block in range(block_count):
+                blocks.append(read_column(name=header['time_column'], block_range=(block, block + 1)))
+                if blocks[-1][-1] > cut_off_time:
+                    break
+            decoded[header['time_column']] = np.concatenate(blocks)
+            end = int(np.searchsorted(decoded[header['time_column']], cut_off_time, side='right'))
+        else:
+            # A binary search only touches a handful of pages of the memory-mapped time column
+            times = read_column(name=header['time_column'])
+            decoded[header['time_column']] = times
+            end = int(np.searchsorted(times, cut_off_time, side='right'))
+
+    columns = {}
+    for name, column in column_info.items():
+        if name == mask_column:
+            continue
+        if name in decoded:
+            columns[name] = decoded[name]
+        elif end is not None and 'encoding' in column:
+            # Compressed columns share the same block boundaries, so only decompress the blocks before the cut-off
+            block_length = column['encoding']['block_length']
+            columns[name] = read_column(name=name, block_range=(0, -(-end // block_length)))
+        else:
+            columns[name] = read_column(name=name)
+
+    if time_axis is not None:
+        columns[header['time_column']] = time_axis
+
+    # Truncate at the cut-off time
+    if end is not None:
+        columns = {name: values.truncate(end) if isinstance(values, ImplicitTimeAxis) else values[:end]
+                   for name, values in columns.items()}
+    elif cut_off_time is not None:
+        selection = columns[header['time_column']] <= cut_off_time
+        columns = {name: values[selection] for name, values in columns.items()}
+
+    # Convert columns stored at single precision back to double precision
+    for name, column in column_info.items():
+        if 'upcast_dtype' in column:
+            columns[name] = columns[name].astype(column['upcast_dtype'])
+
+    return header, columns
+
+
+def iter_columnar(file_path, chunk_length, base_offset=0):
+    """
+    Iterate over a file in our columnar binary format in chunks of a fixed number of samples, so that compressed files
+    and implicit time axes can be read without ever expanding the whole lightcurve into memory.
+
+    :param file_path:
+        The path of the file to read, or a file handle which is already open for reading in binary mode.
+    :type file_path:
+        str
+    :param chunk_length:
+        The number of samples in each chunk (the final chunk may be shorter).
+    :type chunk_length:
+        int
+    :param base_offset:
+        The byte offset of the start of the lightcurve record within the file.
+    :type base_offset:
+        int
+    :return:
+        Generator of dictionaries of column arrays
+    """
+
+    header = read_columnar_header(file_path=file_path, base_offset=base_offset)
+    length = header['length']
+    time_axis, mask_column = _read_time_axis(file_path=file_path, header=header, base_offset=base_offset)
+    time_chunks = time_axis.iter_materialise(chunk_length=chunk_length) if time_axis is not None else None
+
+    # Uncompressed columns are memory-mapped once, and then sliced
+    mapped = {column['name']: _read_column(file_path=file_path, header=header, name=column['name'],
+                                           base_offset=base_offset)
+              for column in header['columns'] if 'encoding' not in column and column['name'] != mask_column}
+
+    # The most recently decoded run of blocks of each compressed column, as (first block, last block + 1, values).
+    # Chunks which are shorter than a compressed block, or which straddle a block boundary, reuse these rather than
+    # decompressing the same block again.
+    decoded = {}
+
+    for start in range(0, length, chunk_length):
+        end = min(start + chunk_length, length)
+        chunk = {}
+        for column in header['columns']:
+            name = column['name']
+            if name == mask_column:
+                continue
+            elif name in mapped:
+                values = mapped[name][start:end]
+            else:
+                # Only decompress the blocks which overlap this chunk, and which we have not already decompressed
+                block_length = column['encoding']['block_length']
+                first_block = start // block_length
+                last_block = -(-end // block_length)
+                cached_first, cached_last, cached_values = decoded.get(name, (0, 0, None))
+                if not (cached_first <= first_block and last_block <= cached_last):
+                    if cached_first <= first_block < cached_last:
+                        new_values = _read_column(file_path=file_path, header=header, name=name,
+                                                  base_offset=base_offset, block_range=(cached_last, last_block))
+                        cached_values = np.concatenate([
+                            cached_values[(first_block - cached_first) * block_length:], new_values])
+                    else:
+                        cached_values = _read_column(file_path=file_path, header=header, name=name,
+                                                     base_offset=base_offset, block_range=(first_block, last_block))
+                    # Chunks share this buffer, so make sure that none of them can modify it
+                    cached_values.setflags(write=False)
+                    cached_first, cached_last = first_block, last_block
+                    decoded[name] = (cached_first, cached_last, cached_values)
+                values = cached_values[start - cached_first * block_length:end - cached_first * block_length]
+
+            if 'upcast_dtype' in column:
+                values = values.astype(column['upcast_dtype'])
+            chunk[name] = values
+
+        if time_chunks is not None:
+            chunk[header['time_column']] = next(time_chunks)
+
+        yield chunk
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# lc_dtype_policy.py
+
+"""
+Policies describing the numeric types used to store the columns of lightcurves in memory. By default, fluxes,
+uncertainties and flags are all stored at double precision. The compact policy stores fluxes and uncertainties at
+single precision, and flags as an 8-bit bitmask, which are combined with bitwise-or rather than in quadrature. This
+reduces the memory used by each lightcurve from 32 bytes per sample to 17, including the time axis.
+"""
+
+import numpy as np
+
+
+class DtypePolicy:
+    """
+    A class describing the numeric types used to store the fluxes, uncertainties and flags of lightcurves.
+    """
+
+    def __init__(self, flux_dtype=np.float64, flag_dtype=np.float64):
+        """
+        Create a dtype policy.
+
+        :param flux_dtype:
+            The floating-point type used to store fluxes and uncertainties.
+        :type flux_dtype:
+            np.dtype
+        :param flag_dtype:
+            The type used to store flags. If this is an integer type, flags are treated as bitmasks.
+        :type flag_dtype:
+            np.dtype
+        """
+        self.flux_dtype = np.dtype(flux_dtype)
+        self.flag_dtype = np.dtype(flag_dtype)
+
+        assert np.issubdtype(self.flux_dtype, np.floating), "Fluxes must be stored as floating-point numbers"
+        assert np.issubdtype(self.flag_dtype, np.floating) or np.issubdtype(self.flag_dtype, np.unsignedinteger), \
+            "Flags must be stored as floating-point numbers or unsigned integer bitmasks"
+
+    def __eq__(self, other):
+        return (isinstance(other, DtypePolicy) and
+                self.flux_dtype == other.flux_dtype and self.flag_dtype == other.flag_dtype)
+
+    def __repr__(self):
+        return "DtypePolicy(flux_dtype={}, flag_dtype={})".format(self.flux_dtype.name, self.flag_dtype.name)
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Create a dtype policy from its specification in a task description: either the name of one of the standard
+        policies, 'default' or 'compact', or a dictionary of the keyword arguments to the constructor.
+
+        :param spec:
+            The specification of the policy. If None, the default policy is returned.
+        :return:
+            DtypePolicy
+        """
+        if spec is None or isinstance(spec, DtypePolicy):
+            return spec if spec is not None else default_dtype_policy
+        if isinstance(spec, dict):
+            return cls(**spec)
+        assert spec in named_dtype_policies, "Unknown dtype policy <{}>".format(spec)
+        return named_dtype_policies[spec]
+
+    @property
+    def bitmask_flags(self):
+        """
+        Boolean indicating whether flags are stored as integer bitmasks.
+
+        :return:
+            bool
+        """
+        return np.issubdtype(self.flag_dtype, np.integer)
+
+    def cast_fluxes(self, values):
+        """
+        Convert an array of fluxes or uncertainties to the type used by this policy. Arrays which are already of the
+        right type are returned unchanged, without copying.
+
+        :param values:
+            The values to convert.
+        :type values:
+            np.ndarray
+        :return:
+            np.ndarray
+        """
+        return values.astype(self.flux_dtype, copy=False)
+
+    def cast_flags(self, values):
+        """
+        Convert an array of flags to the type used by this policy. Arrays which are already of the right type are
+        returned unchanged, without copying.
+
+        :param values:
+            The values to convert.
+        :type values:
+            np.ndarray
+        :return:
+            np.ndarray
+        """
+        return to_flag_dtype(values=values, dtype=self.flag_dtype)
+
+
+def to_flag_dtype(values, dtype):
+    """
+    Convert an array of flags to a given type. Floating-point flags are rounded to the nearest integer when they are
+    converted into bitmasks.
+
+    :param values:
+        The flags to convert.
+    :type values:
+        np.ndarray
+    :param dtype:
+        The type to convert them to.
+    :type dtype:
+        np.dtype
+    :return:
+        np.ndarray
+    """
+    if values.dtype == dtype:
+        return values
+    if np.issubdtype(dtype, np.integer) and not np.issubdtype(values.dtype, np.integer):
+        return np.rint(values).astype(dtype)
+    return values.astype(dtype)
+
+
+def combine_flags(flags_1, flags_2, out=None):
+    """
+    Combine the flags of two lightcurves. If the first lightcurve (or the output) stores its flags as an integer
+    bitmask, the flags are combined with bitwise-or; otherwise they are combined in quadrature.
+
+    :param flags_1:
+        The flags of the first lightcurve.
+    :type flags_1:
+        np.ndarray
+    :param flags_2:
+        The flags of the second lightcurve.
+    :type flags_2:
+        np.ndarray
+    :param out:
+        Optionally, an array to write the result into.
+    :type out:
+        np.ndarray
+    :return:
+        np.ndarray
+    """
+    dtype = flags_1.dtype if out is None else out.dtype
+    if np.issubdtype(dtype, np.integer):
+        return np.bitwise_or(to_flag_dtype(values=flags_1, dtype=dtype), to_flag_dtype(values=flags_2, dtype=dtype),
+                             out=out)
+    return np.hypot(flags_1, flags_2, out=out)
+
+
+# The policy used for lightcurves which do not specify one, which stores everything at double precision
+default_dtype_policy = DtypePolicy()
+
+# A policy which stores fluxes at single precision and flags as an 8-bit bitmask
+compact_dtype_policy = DtypePolicy(flux_dtype=np.float32, flag_dtype=np.uint8)
+
+# Standard policies, which can be referred to by name in task descriptions
+named_dtype_policies = {
+    'default': default_dtype_policy,
+    'compact': compact_dtype_policy
+}
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# lc_expression.py
+
+"""
+Lazy arithmetic on lightcurves. An expression such as "noise * transit + systematics" is recorded as a tree of
+operations, rather than being evaluated one binary operation at a time. When it is evaluated, each input lightcurve is
+resampled onto the target raster only once, and the whole tree is then evaluated in a single pass over chunks of
+samples, so that no full-length temporary arrays are created for intermediate results.
+"""
+
+import ast
+
+import numpy as np
+
+from .lc_dtype_policy import to_flag_dtype
+from .lightcurve import LightcurveArbitraryRaster
+
+# Default number of samples evaluated in each pass over the expression tree. This is small enough that the temporary
+# arrays for each chunk stay in cache.
+default_expression_chunk_length = 65536
+
+# The operations which may appear in an expression, and the numpy functions which apply them to fluxes
+expression_operations = {
+    'add': np.add,
+    'subtract': np.subtract,
+    'multiply': np.multiply
+}
+
+
+class LightcurveExpression:
+    """
+    A node in a tree of arithmetic operations on lightcurves, which is only evaluated when <evaluate> is called. As with
+    the arithmetic operators of <LightcurveArbitraryRaster>, every input is resampled onto the time raster of the
+    left-most lightcurve in the expression. The uncertainties of the inputs are combined in quadrature, and so are their
+    flags, unless they are bitmasks, in which case they are combined with bitwise-or.
+    """
+
+    def __init__(self, operation=None, left=None, right=None, lightcurve=None):
+        """
+        Create a node in a lightcurve expression. Leaf nodes wrap a single lightcurve; other nodes apply an operation
+        to two sub-expressions.
+
+        :param operation:
+            The operation this node applies: 'add', 'subtract' or 'multiply'. None for leaf nodes.
+        :type operation:
+            str
+        :param left:
+            The left-hand operand.
+        :type left:
+            LightcurveExpression
+        :param right:
+            The right-hand operand.
+        :type right:
+            LightcurveExpression
+        :param lightcurve:
+            The lightcurve wrapped by a leaf node.
+        :type lightcurve:
+            LightcurveArbitraryRaster
+        """
+        if operation is None:
+            assert isinstance(lightcurve, LightcurveArbitraryRaster), "Leaf nodes must wrap a lightcurve"
+        else:
+            assert operation in expression_operations, "Unknown operation <{}>".format(operation)
+            assert isinstance(left, LightcurveExpression) and isinstance(right, LightcurveExpression)
+
+        self.operation = operation
+        self.left = left
+        self.right = right
+        self.lightcurve = lightcurve
+
+    @staticmethod
+    def _wrap(operand):
+        """
+        Turn a lightcurve into a leaf node, leaving expressions unchanged.
+
+        :param operand:
+            A lightcurve or an expression.
+        :return:
+            LightcurveExpression
+        """
+        if isinstance(operand, LightcurveExpression):
+            return operand
+        return LightcurveExpression(lightcurve=operand)
+
+    def __add__(self, other):
+        return LightcurveExpression(operation='add', left=self, right=self._wrap(other))
+
+    def __sub__(self, other):
+        return LightcurveExpression(operation='subtract', left=self, right=self._wrap(other))
+
+    def __mul__(self, other):
+        return LightcurveExpression(operation='multiply', left=self, right=self._wrap(other))
+
+    def __radd__(self, other):
+        return LightcurveExpression(operation='add', left=self._wrap(other), right=self)
+
+    def __rsub__(self, other):
+        return LightcurveExpression(operation='subtract', left=self._wrap(other), right=self)
+
+    def __rmul__(self, other):
+        return LightcurveExpression(operation='multiply', left=self._wrap(other), right=self)
+
+    def leaves(self):
+        """
+        Return the lightcurves in this expression, from left to right, including any repeats.
+
+        :return:
+            list of <LightcurveArbitraryRaster>
+        """
+        if self.operation is None:
+            return [self.lightcurve]
+        return self.left.leaves() + self.right.leaves()
+
+    def operations(self):
+        """
+        Return the set of operations which appear in this expression.
+
+        :return:
+            set
+        """
+        if self.operation is None:
+            return set()
+        return {self.operation} | self.left.operations() | self.right.operations()
+
+    def metadata(self):
+        """
+        Return the metadata of the result of this expression. Following the arithmetic operators of
+        <LightcurveArbitraryRaster>, sums take the metadata of whichever operand has the strongest transit signal, and
+        differences and products merge the metadata of both operands.
+
+        :return:
+            dict
+        """
+        if self.operation is None:
+            return {**self.lightcurve.metadata}
+
+        left = self.left.metadata()
+        right = self.right.metadata()
+        if self.operation != 'add':
+            return {**left, **right}
+        elif left['mes'] > right['mes']:
+            return left
+        else:
+            return right
+
+    def _evaluate_fluxes(self, fluxes, window):
+        """
+        Evaluate the fluxes of this expression within one chunk of samples.
+
+        :param fluxes:
+            Dictionary of the flux arrays of each input lightcurve, resampled onto the target raster, keyed by id().
+        :type fluxes:
+            dict
+        :param window:
+            The slice of samples to evaluate.
+        :type window:
+            slice
+        :return:
+            np.ndarray
+        """
+        if self.operation is None:
+            return fluxes[id(self.lightcurve)][window]
+        return expression_operations[self.operation](self.left._evaluate_fluxes(fluxes=fluxes, window=window),
+                                                     self.right._evaluate_fluxes(fluxes=fluxes, window=window))
+
+    def evaluate(self, chunk_length=default_expression_chunk_length, out=None):
+        """
+        Evaluate this expression. If it contains any multiplications, the first and last data points are removed from
+        the result, due to edge effects, as with the product of two lightcurves.
+
+        :param chunk_length:
+            The number of samples evaluated in each pass over the expression tree.
+        :type chunk_length:
+            int
+        :param out:
+            Optionally, a lightcurve with the same number of samples as the left-most lightcurve in the expression,
+            whose flux, uncertainty and flag arrays are overwritten with the result, rather than allocating new
+            arrays. This may be one of the lightcurves in the expression.
+        :type out:
+            LightcurveArbitraryRaster
+        :return:
+            LightcurveArbitraryRaster
+        """
+        leaves = self.leaves()
+        target = leaves[0]
+        length = len(target.times)
+
+        # Resample each distinct input lightcurve onto the target raster, once
+        inputs = {}
+        for leaf in leaves:
+            if id(leaf) not in inputs:
+                inputs[id(leaf)] = target._other_on_same_raster(other=leaf)
+        fluxes = {key: item[0] for key, item in inputs.items()}
+        multiplicity = {key: sum(id(leaf) == key for leaf in leaves) for key in inputs}
+
+        # Remove first and last data points of products due to edge effects
+        edge = 1 if 'multiply' in self.operations() else 0
+        trim = slice(edge, length - edge)
+        times = target.times[trim] if edge else target.times
+
+        # Uncertainties are only computed if at least one input has them
+        with_uncertainties = [key for key in inputs if inputs[key][1] is not None]
+
+        policy = target.dtype_policy if out is None else out.dtype_policy
+        if out is None:
+            out_fluxes = np.empty(length, dtype=policy.flux_dtype)
+            out_flags = np.empty(length, dtype=policy.flag_dtype)
+            out_uncertainties = None
+        else:
+            assert out._buffers_writable(length=length), \
+                "Output lightcurve must have distinct, writable arrays of the same length as the input"
+            out_fluxes, out_flags, out_uncertainties = out.fluxes, out.flags, out._uncertainties
+        if with_uncertainties and out_uncertainties is None:
+            out_uncertainties = np.empty(length, dtype=policy.flux_dtype)
+
+        # Evaluate the expression one chunk at a time. Each column of each chunk is evaluated in full before it is
+        # written, so the output may share buffers with the inputs
+        for start in range(trim.start, trim.stop, chunk_length):
+            window = slice(start, min(start + chunk_length, trim.stop))
+
+            out_fluxes[window] = self._evaluate_fluxes(fluxes=fluxes, window=window)
+
+            # Combine uncertainties in quadrature. Each input contributes once for every time it appears
+            if with_uncertainties:
+                sum_squares = np.zeros(window.stop - window.start)
+                for key in with_uncertainties:
+                    sum_squares += np.square(inputs[key][1][window]) * multiplicity[key]
+                np.sqrt(sum_squares, out=out_uncertainties[window])
+
+            # Combine flags with bitwise-or if they are bitmasks, or otherwise in quadrature
+            if np.issubdtype(out_flags.dtype, np.integer):
+                combined = np.zeros(window.stop - window.start, dtype=out_flags.dtype)
+                for key in inputs:
+                    combined |= to_flag_dtype(values=inputs[key][2][window], dtype=out_flags.dtype)
+                out_flags[window] = combined
+            else:
+                sum_squares = np.zeros(window.stop - window.start)
+                for key, count in multiplicity.items():
+                    sum_squares += np.square(inputs[key][2][window]) * count
+                np.sqrt(sum_squares, out=out_flags[window])
+
+        # Create output lightcurve
+        if out is None:
+            out = LightcurveArbitraryRaster(times=times, fluxes=out_fluxes[trim], flags=out_flags[trim],
+                                            dtype_policy=policy)
+        elif out.times is not times:
+            out.times = times
+
+        # The results were allocated for the output lightcurve alone, or are (possibly trimmed) views of its own
+        # arrays, so it may go on updating them in place
+        out._adopt_arrays(fluxes=out_fluxes[trim],
+                          uncertainties=out_uncertainties[trim] if with_uncertainties else None,
+                          flags=out_flags[trim])
+        out.metadata = self.metadata()
+        return out
+
+
+def parse_expression(expression, lightcurves):
+    """
+    Parse a string such as "noise * transit + systematics" into a lazy <LightcurveExpression>. Only the operators +, -
+    and *, parentheses and the names of lightcurves are allowed.
+
+    :param expression:
+        The expression to parse.
+    :type expression:
+        str
+    :param lightcurves:
+        Dictionary of the lightcurves which may be referred to in the expression, keyed by name.
+    :type lightcurves:
+        dict
+    :return:
+        LightcurveExpression
+    """
+
+    operators = {
+        ast.Add: 'add',
+        ast.Sub: 'subtract',
+        ast.Mult: 'multiply'
+    }
+
+    def build(node):
+        if isinstance(node, ast.BinOp) and type(node.op) in operators:
+            return LightcurveExpression(operation=operators[type(node.op)], left=build(node.left),
+                                        right=build(node.right))
+        if isinstance(node, ast.Name):
+            assert node.id in lightcurves, "Unknown lightcurve <{}> in expression <{}>".format(node.id, expression)
+            return LightcurveExpression(lightcurve=lightcurves[node.id])
+        raise ValueError("Unsupported syntax in lightcurve expression <{}>".format(expression))
+
+    return build(ast.parse(expression.strip(), mode='eval').body)
@@ -10,18 +10,57 @@ import os
 import re
 import gzip
 
+from .lc_stream import rechunk_columns
+from .lc_text_columns import iter_text_blocks, stack_blocks
 from .lightcurve import LightcurveArbitraryRaster
 from .settings import settings
 
 
-def read_lcsg_lightcurve(filename, gzipped=True, cut_off_time=None, directory="lightcurves_v2"):
+def _read_lcsg_header(file):
     """
-    Read a lightcurve from an ASCII data file.
+    Read the block of "# #key=value" comment lines, and any blank lines, at the top of an LCSG lightcurve file.
+
+    :param file:
+        File handle, opened in binary mode, positioned at the start of the file.
+    :return:
+        Tuple of (metadata dictionary, the first line after the header, as bytes, and its line number)
+    """
+    metadata = {}
+    line_number = 1
+    line = file.readline()
+    while line.startswith(b'#') or (len(line) > 0 and line.isspace()):
+        # Check for metadata item
+        test = re.match(r"# #(.*)=(.*)", line.decode('utf-8'))
+        if test is not None:
+            metadata_key = test.group(1).strip()
+            metadata_value = test.group(2).strip()
+
+            # If metadata value is a float, convert it to a float. Otherwise keep it as string.
+            try:
+                metadata_value = float(metadata_value)
+            except ValueError:
+                pass
+
+            metadata[metadata_key] = metadata_value
+
+        line = file.readline()
+        line_number += 1
+    return metadata, line, line_number
+
+
+def read_lcsg_lightcurve(filename, gzipped=True, cut_off_time=None, directory="lightcurves_v2", dtype_policy=None):
+    """
+    Read a lightcurve from an ASCII data file. Metadata is read from the block of "# #key=value" lines at the top of
+    the file, and the comma-separated body of the file is then parsed in bulk.
 
     :param filename:
         The filename of the input data file.
     :type filename:
         str
+    :param gzipped:
+        Boolean flag indicating whether the input data file is gzipped.
+    :type gzipped:
+        bool
     :param cut_off_time:
         Only read lightcurve up to some cut off time
     :type cut_off_time:
@@ -30,14 +69,14 @@ def read_lcsg_lightcurve(filename, gzipped=True, cut_off_time=None, directory="l
         The directory in which the LCSG lightcurves are stored.
     :type directory:
         str
+    :param dtype_policy:
+        The numeric types used to store the lightcurve in memory (see <lc_dtype_policy>).
+    :type dtype_policy:
+        DtypePolicy
     :return:
         A <LightcurveArbitraryRaster> object.
     """
 
-    times = []
-    fluxes = []
-    uncertainties = []
-    flags = []
     metadata = {
         'directory': directory,
         'filename': filename
@@ -49,52 +88,106 @@ def read_lcsg_lightcurve(filename, gzipped=True, cut_off_time=None, directory="l
     # Look up file open function
     file_opener = gzip.open if gzipped else open
 
-    # Loop over lines of input file
-    with file_opener(file_path, "rt") as file:
-        for line in file:
-            # Ignore blank lines and comment lines
-            if len(line) == 0 or line[0] == '#':
-                # Check for metadata item
-                test = re.match(r"# #(.*)=(.*)", line)
-                if test is not None:
-                    metadata_key = test.group(1).strip()
-                    metadata_value = test.group(2).strip()
-
-                    # If metadata value is a float, convert it to a float. Otherwise keep it as string.
-                    try:
-                        metadata_value = float(metadata_value)
-                    except ValueError:
-                        pass
-
-                    metadata[metadata_key] = metadata_value
-
-                # ... otherwise ignore this line
-                continue
-
-            # Unpack data
-            words = line.split(',')
-            time = float(words[0])
-            flux = float(words[1])
-            flag = float(words[2])
-            uncertainty = 0
-
-            # Check we have not exceeded cut-off time
-            if cut_off_time is not None and time > cut_off_time:
-                continue
-
-            # Read three columns of data
-            times.append(time)
-            fluxes.append(flux)
-            flags.append(flag)
-            uncertainties.append(uncertainty)
-
-    # Convert into a Lightcurve object
-    lightcurve = LightcurveArbitraryRaster(times=np.asarray(times),
-                                           fluxes=np.asarray(fluxes),
-                                           uncertainties=np.asarray(uncertainties),
-                                           flags=np.asarray(flags),
-                                           metadata=metadata
-                                           )
+    blocks = []
+    with file_opener(file_path, "rb") as file:
+        # Read the block of comment lines at the top of the file, which contains the lightcurve's metadata
+        header_metadata, line, line_number = _read_lcsg_header(file=file)
+        metadata.update(header_metadata)
+
+        # Parse the body of the file as blocks of comma-separated values, starting with the first line of data
+        for block in iter_text_blocks(file_handle=file, delimiter=b',', initial=line, file_name=file_path,
+                                      first_line_number=line_number):
+            blocks.append(block)
+
+            # Lightcurves are stored in time order, so stop reading once we've passed the cut-off time
+            if cut_off_time is not None and block[-1, 0] > cut_off_time:
+                break
+
+    # Columns are time, flux, flag
+    data = stack_blocks(blocks=blocks, column_count=3)
+    times, fluxes, flags = data[:3]
+
+    # Truncate lightcurve at the cut-off time
+    if cut_off_time is not None:
+        end = np.searchsorted(times, cut_off_time, side='right')
+        times, fluxes, flags = times[:end], fluxes[:end], flags[:end]
+
+    # Convert into a Lightcurve object, which owns the arrays we have just read. LCSG lightcurves have no
+    # uncertainties.
+    lightcurve = LightcurveArbitraryRaster._from_adopted_arrays(times=times,
+                                                                fluxes=fluxes,
+                                                                flags=flags,
+                                                                metadata=metadata,
+                                                                dtype_policy=dtype_policy
+                                                                )
 
     # Return lightcurve
     return lightcurve
+
+
+def iter_lcsg_lightcurve(filename, gzipped=True, cut_off_time=None, directory="lightcurves_v2", chunk_length=None,
+                         chunk_duration=None, dtype_policy=None):
+    """
+    Read a lightcurve from an ASCII data file as a sequence of chunks, each of which is a <LightcurveArbitraryRaster>
+    object, so that the whole lightcurve never needs to be held in memory.
+
+    :param filename:
+        The filename of the input data file.
+    :type filename:
+        str
+    :param gzipped:
+        Boolean flag indicating whether the input data file is gzipped.
+    :type gzipped:
+        bool
+    :param cut_off_time:
+        Only read lightcurve up to some cut off time
+    :type cut_off_time:
+        float
+    :param directory:
+        The directory in which the LCSG lightcurves are stored.
+    :type directory:
+        str
+    :param chunk_length:
+        The number of samples in each chunk.
+    :type chunk_length:
+        int
+    :param chunk_duration:
+        Alternatively, the time span of each chunk (days).
+    :type chunk_duration:
+        float
+    :param dtype_policy:
+        The numeric types used to store each chunk in memory (see <lc_dtype_policy>).
+    :type dtype_policy:
+        DtypePolicy
+    :return:
+        Generator of <LightcurveArbitraryRaster> objects.
+    """
+
+    metadata = {
+        'directory': directory,
+        'filename': filename
+    }
+
+    # Full path for this lightcurve
+    file_path = os.path.join(settings['lcPath'], directory, filename)
+
+    # Look up file open function
+    file_opener = gzip.open if gzipped else open
+
+    with file_opener(file_path, "rb") as file:
+        header_metadata, line, line_number = _read_lcsg_header(file=file)
+        metadata.update(header_metadata)
+
+        # Columns are time, flux, flag
+        blocks = (list(np.ascontiguousarray(block.T)[:3])
+                  for block in iter_text_blocks(file_handle=file, delimiter=b',', initial=line, file_name=file_path,
+                                                first_line_number=line_number))
+
+        for times, fluxes, flags in rechunk_columns(blocks=blocks, chunk_length=chunk_length,
+                                                    chunk_duration=chunk_duration, cut_off_time=cut_off_time):
+            yield LightcurveArbitraryRaster(times=times,
+                                            fluxes=fluxes,
+                                            flags=flags,
+                                            metadata={**metadata},
+                                            dtype_policy=dtype_policy
+                                            )
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# lc_stream.py
+
+"""
+Utilities for streaming lightcurves in chunks, so that very long lightcurves can be processed without ever holding all
+of their samples in memory at once.
+"""
+
+import numpy as np
+
+# Default number of samples in each chunk of a streamed lightcurve
+default_chunk_length = 1048576
+
+
+def rechunk_columns(blocks, chunk_length=None, chunk_duration=None, cut_off_time=None):
+    """
+    Take a sequence of blocks of columns of data, of arbitrary lengths, and regroup them into chunks of a fixed number
+    of samples, or spanning fixed intervals of time. The blocks must be in time order.
+
+    :param blocks:
+        Iterable of lists of one-dimensional numpy arrays. The first array in each list is the time axis (days).
+    :param chunk_length:
+        The number of samples in each chunk (the final chunk may be shorter).
+    :type chunk_length:
+        int
+    :param chunk_duration:
+        Alternatively, the time span of each chunk (days). Chunks start at integer multiples of this interval after the
+        first sample, and intervals which contain no samples are skipped.
+    :type chunk_duration:
+        float
+    :param cut_off_time:
+        Stop after this time (days); no samples after it are returned, and no blocks are read after the one which
+        passes it.
+    :type cut_off_time:
+        float
+    :return:
+        Generator of lists of one-dimensional numpy arrays
+    """
+    assert chunk_length is None or chunk_duration is None, "Cannot specify both a chunk length and duration"
+    if chunk_length is None and chunk_duration is None:
+        chunk_length = default_chunk_length
+
+    pending = None
+    first_time = None
+    finished = False
+
+    for block in blocks:
+        # Truncate at the cut-off time
+        if cut_off_time is not None and len(block[0]) > 0 and block[0][-1] > cut_off_time:
+            end = int(np.searchsorted(block[0], cut_off_time, side='right'))
+            block = [column[:end] for column in block]
+            finished = True
+
+        if pending is None:
+            pending = list(block)
+        else:
+            pending = [np.concatenate([old, new]) for old, new in zip(pending, block)]
+
+        # Yield all the complete chunks we have accumulated
+        while len(pending[0]) > 0:
+            if chunk_length is not None:
+                if len(pending[0]) < chunk_length:
+                    break
+                split = chunk_length
+            else:
+                if first_time is None:
+                    first_time = pending[0][0]
+                chunk_index = np.floor((pending[0][0] - first_time) / chunk_duration)
+                chunk_end = first_time + (chunk_index + 1) * chunk_duration
+                if pending[0][-1] < chunk_end:
+                    break
+                # Always make progress, even if rounding errors place the first sample after the chunk's end
+                split = max(int(np.searchsorted(pending[0], chunk_end, side='left')), 1)
+
+            yield [column[:split] for column in pending]
+            pending = [column[split:] for column in pending]
+
+        if finished:
+            break
+
+    # Yield whatever remains as a final, shorter, chunk
+    if pending is not None and len(pending[0]) > 0:
+        yield pending
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+# lc_text_columns.py
+
+"""
+Bulk parsing and formatting of the columns of numbers in textual lightcurve files. Rather than splitting or formatting
+each line of a file in Python, we read and write the file in large blocks of bytes, each processed in a single call.
+"""
+
+import gzip
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Number of bytes of (decompressed) text we parse in the first block. Subsequent blocks double in size up to the
+# maximum, so that reading only the start of a file (e.g. up to a cut-off time) is cheap.
+initial_block_size = 1024 * 1024
+
+# Default maximum number of bytes of (decompressed) text we parse in each block
+default_block_size = 16 * 1024 * 1024
+
+# Number of rows of text we format in each block when writing
+default_rows_per_block = 65536
+
+# Format of each number we write, which matches the default used by <np.savetxt>
+default_number_format = '%.18e'
+
+
+def _count_columns(line, delimiter):
+    """
+    Count the number of columns of data on a single line of text.
+
+    :param line:
+        A single line of text, as bytes.
+    :type line:
+        bytes
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :return:
+        int
+    """
+    if delimiter is None:
+        return len(line.split())
+    return len(_strip_trailing_fields(line=line, delimiter=delimiter).split(delimiter))
+
+
+def _strip_trailing_fields(line, delimiter):
+    """
+    Remove any empty fields, and whitespace, from the end of a line of text, e.g. a trailing comma.
+
+    :param line:
+        A single line of text, as bytes.
+    :type line:
+        bytes
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :return:
+        bytes
+    """
+    return line.rstrip(b' \t\r' + (delimiter or b''))
+
+
+def _first_line(block):
+    """
+    Return the first non-blank line in a block of text, or None if there are no non-blank lines.
+
+    :param block:
+        A block of text, as bytes.
+    :type block:
+        bytes
+    :return:
+        bytes
+    """
+    start = 0
+    while start < len(block):
+        end = block.find(b'\n', start)
+        if end < 0:
+            end = len(block)
+        line = block[start:end]
+        if len(line.strip()) > 0:
+            return line
+        start = end + 1
+    return None
+
+
+def _strip_comment_lines(block):
+    """
+    Remove any comment lines (starting with a #) from a block of text.
+
+    :param block:
+        A block of text, as bytes, consisting of whole lines.
+    :type block:
+        bytes
+    :return:
+        bytes
+    """
+    if b'#' not in block:
+        return block
+    return b'\n'.join([line for line in block.split(b'\n') if not line.startswith(b'#')])
+
+
+def _parse_values(block, delimiter):
+    """
+    Parse a block of text, consisting of whole lines containing columns of numbers, into a flat numpy array.
+
+    :param block:
+        A block of text, as bytes, consisting of whole lines.
+    :type block:
+        bytes
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :return:
+        np.ndarray, or None if the block could not be parsed to its end
+    """
+    # Older versions of numpy warn, and return the values parsed so far, if they meet text they cannot parse; newer
+    # versions raise an exception
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            if delimiter is None:
+                return np.fromstring(block, sep=' ')
+
+            # numpy requires every value to be followed by the same separator, so turn newlines into delimiters
+            return np.fromstring(block.replace(b'\r', b'').replace(b'\n', delimiter), sep=delimiter.decode('ascii'))
+        except (ValueError, DeprecationWarning):
+            return None
+
+
+def _ragged_line_error(block, delimiter, column_count, first_line_number, file_name):
+    """
+    Find the first line in a block of text which does not contain the expected number of columns of numbers, and
+    return an exception describing it.
+
+    :param block:
+        A block of text, as bytes, consisting of whole lines, including any comment lines.
+    :type block:
+        bytes
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :param column_count:
+        The number of columns of data expected on each line.
+    :type column_count:
+        int
+    :param first_line_number:
+        The line number, within the file, of the first line of the block.
+    :type first_line_number:
+        int
+    :param file_name:
+        The name of the file, used in the error message.
+    :type file_name:
+        str
+    :return:
+        ValueError
+    """
+    for index, line in enumerate(block.split(b'\n')):
+        if len(line.strip()) == 0 or line.startswith(b'#'):
+            continue
+        line = _strip_trailing_fields(line=line, delimiter=delimiter)
+        fields = line.split() if delimiter is None else line.split(delimiter)
+        try:
+            numbers = [float(item) for item in fields]
+        except ValueError:
+            numbers = []
+        if len(numbers) != column_count:
+            return ValueError("Line {:d} of lightcurve file <{}> should contain {:d} columns of numbers: <{}>".format(
+                first_line_number + index, file_name, column_count, line.decode('utf-8', 'replace')))
+    return ValueError("Could not parse lines {:d}-{:d} of lightcurve file <{}>".format(
+        first_line_number, first_line_number + block.count(b'\n'), file_name))
+
+
+def _parse_block(block, delimiter, column_count):
+    """
+    Parse a block of text, consisting of whole lines containing columns of numbers, into a 2D numpy array. Empty
+    fields at the ends of lines, such as trailing commas, are ignored.
+
+    :param block:
+        A block of text, as bytes, consisting of whole lines.
+    :type block:
+        bytes
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :param column_count:
+        The number of columns of data on each line.
+    :type column_count:
+        int
+    :return:
+        np.ndarray, with shape (rows, columns), or None if the block contains lines which could not be parsed
+    """
+
+    values = _parse_values(block=block, delimiter=delimiter)
+
+    # If the fast path fails, remove empty fields and blank lines, which it cannot handle, and try again
+    if values is None or len(values) % column_count != 0:
+        lines = [_strip_trailing_fields(line=line, delimiter=delimiter) for line in block.split(b'\n')]
+        values = _parse_values(block=b'\n'.join([line for line in lines if len(line.strip()) > 0]),
+                               delimiter=delimiter)
+        if values is None or len(values) % column_count != 0:
+            return None
+
+    return values.reshape((-1, column_count))
+
+
+def iter_text_blocks(file_handle, delimiter=None, column_count=None, block_size=default_block_size, initial=b'',
+                     file_name=None, first_line_number=1):
+    """
+    Iterate over a textual data file containing columns of numbers, yielding blocks of rows as 2D numpy arrays.
+    Blank lines, lines beginning with a #, and empty fields at the ends of lines, are ignored. A ValueError, naming the
+    file and line, is raised if any line contains a different number of columns.
+
+    :param file_handle:
+        A file handle, opened in binary mode, from which we read the data. This may be a gzip file handle.
+    :param delimiter:
+        The delimiter between columns, or None if columns are separated by whitespace.
+    :type delimiter:
+        bytes
+    :param column_count:
+        The number of columns of data on each line. If None, this is inferred from the first line of data.
+    :type column_count:
+        int
+    :param block_size:
+        The maximum number of bytes of text we parse in each block.
+    :type block_size:
+        int
+    :param initial:
+        Bytes which have already been read from the file handle (e.g. while reading a header), and which should be
+        parsed before the rest of the file.
+    :type initial:
+        bytes
+    :param file_name:
+        The name of the file, used in error messages.
+    :type file_name:
+        str
+    :param first_line_number:
+        The line number, within the file, of the first line of <initial>, or of the data read from the file handle.
+    :type first_line_number:
+        int
+    :return:
+        Generator of np.ndarray objects, each with shape (rows, columns)
+    """
+
+    remainder = initial
+    read_size = min(initial_block_size, block_size)
+
+    while True:
+        data = file_handle.read(read_size)
+        read_size = min(read_size * 2, block_size)
+        final_block = len(data) == 0
+
+        # Only parse whole lines; keep any partial line at the end of the block until we've read the rest of it
+        data = remainder + data
+        if final_block:
+            block, remainder = data, b''
+        else:
+            split_point = data.rfind(b'\n') + 1
+            block, remainder = data[:split_point], data[split_point:]
+
+        raw_block = block
+        block = _strip_comment_lines(block)
+
+        # Skip blocks which contain nothing but whitespace
+        if len(block) > 0 and not block.isspace():
+            # Work out how many columns there are from the first line of data
+            if column_count is None:
+                column_count = _count_columns(line=_first_line(block), delimiter=delimiter)
+
+            rows = _parse_block(block=block, delimiter=delimiter, column_count=column_count)
+            if rows is None:
+                raise _ragged_line_error(block=raw_block, delimiter=delimiter, column_count=column_count,
+                                         first_line_number=first_line_number, file_name=file_name)
+            yield rows
+
+        first_line_number += raw_block.count(b'\n')
+
+        if final_block:
+            break
+
+
+def stack_blocks(blocks, column_count):
+    """
+    Merge a list of blocks of rows returned by <iter_text_blocks> into a list of contiguous column arrays.
+
+    :param blocks:
+        List of np.ndarray objects, each with shape (rows, columns)
+    :type blocks:
+        list
+    :param column_count:
+        The number of columns of data we expect.
+    :type column_count:
+        int
+    :return:
+        np.ndarray, with shape (columns, rows). Each row of the output is contiguous in memory.
+    """
+
+    if len(blocks) == 0:
+        return np.zeros((column_count, 0))
+
+    merged = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+    # Transpose into column-major order, so that each column is contiguous
+    return np.ascontiguousarray(merged.T)
+
+
+def format_text_block(rows, number_format=default_number_format, delimiter=' '):
+    """
+    Format a block of rows of numbers as text, with a single string-formatting operation. The output is identical to
+    that produced by <np.savetxt> with the same format.
+
+    :param rows:
+        np.ndarray, with shape (rows, columns)
+    :type rows:
+        np.ndarray
+    :param number_format:
+        The printf-style format used for each number.
+    :type number_format:
+        str
+    :param delimiter:
+        The delimiter between columns.
+    :type delimiter:
+        str
+    :return:
+        bytes
+    """
+    row_format = delimiter.join([number_format] * rows.shape[1]) + '\n'
+    return ((row_format * rows.shape[0]) % tuple(rows.ravel().tolist())).encode('ascii')
+
+
+def iter_formatted_blocks(columns, rows_per_block=default_rows_per_block, number_format=default_number_format):
+    """
+    Iterate over a list of columns of numbers, yielding blocks of rows formatted as text.
+
+    :param columns:
+        List of one-dimensional numpy arrays, all of the same length.
+    :type columns:
+        list
+    :param rows_per_block:
+        The number of rows to format in each block.
+    :type rows_per_block:
+        int
+    :param number_format:
+        The printf-style format used for each number.
+    :type number_format:
+        str
+    :return:
+        Generator of bytes objects
+    """
+    length = len(columns[0])
+    for start in range(0, length, rows_per_block):
+        rows = np.stack([column[start:start + rows_per_block] for column in columns], axis=1)
+        yield format_text_block(rows=rows, number_format=number_format)
+
+
+def write_text_columns(file_path, columns, gzipped=True, compress_level=6, threads=0, header=b'',
+                       rows_per_block=default_rows_per_block):
+    """
+    Write columns of numbers to a text file, formatting and compressing them in large blocks.
+
+    :param file_path:
+        The path of the file to write.
+    :type file_path:
+        str
+    :param columns:
+        List of one-dimensional numpy arrays, all of the same length.
+    :type columns:
+        list
+    :param gzipped:
+        Boolean specifying whether we gzip the output.
+    :type gzipped:
+        bool
+    :param compress_level:
+        The gzip compression level.
+    :type compress_level:
+        int
+    :param threads:
+        The number of threads used to compress blocks in parallel. If zero, blocks are compressed sequentially into
+        a single gzip stream. Otherwise, each block is compressed as a separate gzip member; the concatenated members
+        form a valid gzip file, which decompresses to the same text.
+    :type threads:
+        int
+    :param header:
+        Text to write before the first row, e.g. comment lines.
+    :type header:
+        bytes
+    :param rows_per_block:
+        The number of rows to format and compress in each block.
+    :type rows_per_block:
+        int
+    """
+    blocks = iter_formatted_blocks(columns=columns, rows_per_block=rows_per_block)
+
+    if not gzipped:
+        with open(file_path, "wb") as out:
+            out.write(header)
+            for block in blocks:
+                out.write(block)
+    elif threads <= 0:
+        with gzip.open(file_path, "wb", compresslevel=compress_level) as out:
+            out.write(header)
+            for block in blocks:
+                out.write(block)
+    else:
+        # zlib releases the GIL while compressing, so blocks are compressed in parallel with each other, and with the
+        # formatting of the next block. Limit the number of blocks in flight to bound memory usage.
+        with open(file_path, "wb") as out, ThreadPoolExecutor(max_workers=threads) as executor:
+            pending = []
+            if len(header) > 0:
+                pending.append(executor.submit(gzip.compress, header, compress_level, mtime=0))
+            for block in blocks:
+                pending.append(executor.submit(gzip.compress, block, compress_level, mtime=0))
+                while len(pending) > 2 * threads:
+                    out.write(pending.pop(0).result())
+            for item in pending:
+                out.write(item.result())
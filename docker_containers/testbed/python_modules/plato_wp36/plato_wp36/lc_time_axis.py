@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# lc_time_axis.py
+
+"""
+An implicit representation of the time axis of a lightcurve which is sampled on a fixed time step, possibly with some
+samples missing. Rather than storing a time for every sample, we store the time of the first sample, the time step, and
+a mask indicating which time steps are present.
+"""
+
+import numpy as np
+
+
+class ImplicitTimeAxis:
+    """
+    A class representing the time axis of a lightcurve sampled at times (start + i * step) / scale, for the integers i
+    which are set in a bit mask. The scale factor allows the start time and step to be exact in the units the
+    lightcurve was generated in (e.g. seconds, for PSLS), even though the times themselves are in days.
+    """
+
+    def __init__(self, start, step, scale, slots, mask=None, length=None):
+        """
+        Create an implicit time axis.
+
+        :param start:
+            The time of the first time step, multiplied by <scale>.
+        :type start:
+            float
+        :param step:
+            The interval between time steps, multiplied by <scale>.
+        :type step:
+            float
+        :param scale:
+            The factor by which times in days are multiplied to give the units of <start> and <step>.
+        :type scale:
+            float
+        :param slots:
+            The total number of time steps spanned by the lightcurve, including any which are missing.
+        :type slots:
+            int
+        :param mask:
+            Bit mask, packed with <np.packbits>, indicating which time steps are present. If None, all are present.
+        :type mask:
+            np.ndarray
+        :param length:
+            Only include the first <length> samples which are present. If None, all are included.
+        :type length:
+            int
+        """
+        self.start = float(start)
+        self.step = float(step)
+        self.scale = float(scale)
+        self.slots = int(slots)
+        self.mask = mask
+
+        total_length = self.slots if mask is None else int(np.count_nonzero(self._unpacked_mask()))
+        self.length = total_length if length is None else min(int(length), total_length)
+
+    def __len__(self):
+        return self.length
+
+    def _unpacked_mask(self, count=None):
+        """
+        Return the mask of which time steps are present, as an array of booleans.
+
+        :param count:
+            The number of time steps to return; defaults to all of them.
+        :type count:
+            int
+        :return:
+            np.ndarray
+        """
+        return np.unpackbits(self.mask, count=self.slots if count is None else count).view(bool)
+
+    def _slot_time(self, slot):
+        """
+        Return the time of a single time step, computed in exactly the same way as <materialise>.
+
+        :param slot:
+            The index of the time step.
+        :type slot:
+            int
+        :return:
+            float
+        """
+        return (np.float64(self.start) + np.float64(slot) * np.float64(self.step)) / np.float64(self.scale)
+
+    def slot_indices(self):
+        """
+        Return the indices of the time steps which are present.
+
+        :return:
+            np.ndarray
+        """
+        if self.mask is None:
+            return np.arange(self.length)
+        return np.flatnonzero(self._unpacked_mask())[:self.length]
+
+    def materialise(self):
+        """
+        Return the time of every sample, as an explicit array.
+
+        :return:
+            np.ndarray (days)
+        """
+        return (self.start + self.slot_indices() * self.step) / self.scale
+
+    def iter_materialise(self, chunk_length):
+        """
+        Iterate over the times of the samples in chunks, without ever expanding the whole time axis into memory. The
+        concatenation of the chunks is identical to the output of <materialise>.
+
+        :param chunk_length:
+            The number of samples in each chunk (the final chunk may be shorter).
+        :type chunk_length:
+            int
+        :return:
+            Generator of np.ndarray (days)
+        """
+        if self.mask is None:
+            for start in range(0, self.length, chunk_length):
+                yield (self.start + np.arange(start, min(start + chunk_length, self.length)) * self.step) / self.scale
+            return
+
+        # Unpack the mask a piece at a time, accumulating the indices of the time steps which are present
+        pending = np.zeros(0, dtype=np.int64)
+        produced = 0
+        bytes_per_piece = max(chunk_length // 8, 1)
+        for byte_start in range(0, len(self.mask), bytes_per_piece):
+            slot_start = byte_start * 8
+            bits = np.unpackbits(self.mask[byte_start:byte_start + bytes_per_piece],
+                                 count=min(bytes_per_piece * 8, self.slots - slot_start))
+            pending = np.concatenate([pending, np.flatnonzero(bits) + slot_start])
+
+            while len(pending) >= chunk_length or (byte_start + bytes_per_piece >= len(self.mask) and len(pending)):
+                count = min(chunk_length, len(pending), self.length - produced)
+                if count <= 0:
+                    return
+                yield (self.start + pending[:count] * self.step) / self.scale
+                produced += count
+                pending = pending[count:]
+
+    def truncate(self, length):
+        """
+        Return a new time axis containing only the first <length> samples of this one.
+
+        :param length:
+            The number of samples to keep.
+        :type length:
+            int
+        :return:
+            ImplicitTimeAxis
+        """
+        return ImplicitTimeAxis(start=self.start, step=self.step, scale=self.scale, slots=self.slots,
+                                mask=self.mask, length=min(length, self.length))
+
+    def searchsorted(self, value):
+        """
+        Return the number of samples whose time is less than or equal to <value>, without materialising the time axis.
+
+        :param value:
+            The time to search for (days).
+        :type value:
+            float
+        :return:
+            int
+        """
+
+        # Estimate the number of time steps before the cut-off, then correct for rounding errors
+        slot_count = (value * self.scale - self.start) / self.step + 1
+        slot_count = int(min(max(np.floor(slot_count), 0), self.slots))
+        while slot_count < self.slots and self._slot_time(slot_count) <= value:
+            slot_count += 1
+        while slot_count > 0 and self._slot_time(slot_count - 1) > value:
+            slot_count -= 1
+
+        if self.mask is None:
+            return min(slot_count, self.length)
+        return min(int(np.count_nonzero(self._unpacked_mask(count=slot_count))), self.length)
+
+    def to_dict(self):
+        """
+        Return a dictionary describing this time axis, excluding the mask, for storage in a JSON header.
+
+        :return:
+            dict
+        """
+        return {
+            'start': self.start,
+            'step': self.step,
+            'scale': self.scale,
+            'slots': self.slots,
+            'length': self.length
+        }
+
+    @classmethod
+    def detect(cls, times, max_gap_fraction=1):
+        """
+        Test whether an array of times lies on a fixed time step, with some samples possibly missing. We try to find a
+        start time and step which reproduce the times exactly, working both in days and in seconds.
+
+        :param times:
+            The times of the samples (days).
+        :type times:
+            np.ndarray
+        :param max_gap_fraction:
+            The maximum number of missing time steps we permit, as a fraction of the number of samples present.
+        :type max_gap_fraction:
+            float
+        :return:
+            ImplicitTimeAxis, or None if the times do not lie on a fixed step
+        """
+        times = np.asarray(times)
+        if len(times) < 2 or times.dtype != np.float64:
+            return None
+
+        differences = np.diff(times)
+        if not np.all(differences > 0):
+            return None
+        median_difference = float(np.median(differences))
+
+        # Candidate (scale, start, step) combinations; synthetic lightcurves are typically generated either in days
+        # (e.g. by <np.arange>), or in whole seconds (e.g. PSLS)
+        candidates = [
+            (1, times[0], differences[0]),
+            (1, times[0], median_difference),
+            (86400, round(times[0] * 86400, 6), round(median_difference * 86400, 6))
+        ]
+
+        for scale, start, step in candidates:
+            if step <= 0:
+                continue
+            slots = np.rint((times * scale - start) / step)
+            if slots[0] != 0 or slots[-1] + 1 > len(times) * (1 + max_gap_fraction):
+                continue
+            slots = slots.astype(np.int64)
+            if not np.all(slots[1:] > slots[:-1]):
+                continue
+
+            slot_count = int(slots[-1]) + 1
+            if slot_count == len(times):
+                mask = None
+            else:
+                present = np.zeros(slot_count, dtype=bool)
+                present[slots] = True
+                mask = np.packbits(present)
+
+            time_axis = cls(start=start, step=step, scale=scale, slots=slot_count, mask=mask)
+            if np.array_equal(time_axis.materialise(), times):
+                return time_axis
+
+        return None
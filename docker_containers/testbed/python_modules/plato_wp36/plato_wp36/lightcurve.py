@@ -6,27 +6,186 @@ Classes for representing light curves, either on arbitrary time rasters, or on r
 """
 
 import gzip
+import json
 import logging
-import math
 import os
 import re
 
 import numpy as np
 
+from .lc_codecs import default_filters
+from .lc_columnar import iter_columnar, json_default, magic as columnar_magic, read_columnar, read_columnar_header
+from .lc_columnar import write_columnar
+from .lc_dtype_policy import combine_flags, default_dtype_policy, to_flag_dtype
+from .lc_stream import default_chunk_length, rechunk_columns
+from .lc_text_columns import iter_text_blocks, stack_blocks, write_text_columns
+from .lc_time_axis import ImplicitTimeAxis
 from .settings import settings
 
+# Prefix of the comment line at the start of textual lightcurve files which contains their metadata, as JSON
+text_metadata_prefix = b"# metadata="
+
+# Columns of the table of gaps returned by <LightcurveArbitraryRaster.analyse_gaps>
+gap_table_dtype = np.dtype([
+    ('start_index', np.int64),  # Index of the input sample before the gap
+    ('start_time', np.float64),  # Time of the input sample before the gap (days)
+    ('step', np.float64),  # Time step from the sample before the gap to the sample after it (days)
+    ('missing_count', np.int64),  # Number of points of the fixed-step raster in the gap with no input sample
+    ('step_error', bool),  # True if the time step differs from the expected spacing
+    ('unexpected_step', bool)  # True if the time step is not a whole number of times the expected spacing
+])
+
+
+def _read_text_columns(file_handle, cut_off_time=None, initial=b''):
+    """
+    Read the columns of a textual lightcurve file, in which the columns are time (seconds), flux, flag and uncertainty.
+
+    :param file_handle:
+        A file handle, opened in binary mode, from which we read the data. This may be a gzip file handle.
+    :param cut_off_time:
+        Only read lightcurve up to some cut off time (days).
+    :type cut_off_time:
+        float
+    :param initial:
+        Bytes which have already been read from the file handle, and which should be parsed before the rest of it.
+    :type initial:
+        bytes
+    :return:
+        List of arrays of [times (days), fluxes, flags, uncertainties]
+    """
+
+    # Parse the file in large blocks, rather than line by line
+    blocks = []
+    for block in iter_text_blocks(file_handle=file_handle, initial=initial):
+        blocks.append(block)
+
+        # Lightcurves are written in time order, so stop reading once we've passed the cut-off time
+        if cut_off_time is not None and block[-1, 0] / 86400 > cut_off_time:
+            break
+
+    # Columns are time, flux, flag, uncertainty
+    data = stack_blocks(blocks=blocks, column_count=4)
+    data[0] /= 86400  # Times stored on disk in seconds; but Lightcurve objects use days
+    times, fluxes, flags, uncertainties = data[:4]
+
+    # Truncate lightcurve at the cut-off time
+    if cut_off_time is not None:
+        end = np.searchsorted(times, cut_off_time, side='right')
+        times, fluxes, flags, uncertainties = (times[:end], fluxes[:end], flags[:end], uncertainties[:end])
+
+    return [times, fluxes, flags, uncertainties]
+
+
+def _text_block_to_columns(block):
+    """
+    Convert a block of rows read from a textual lightcurve file into columns of time (days), flux, flag and
+    uncertainty.
+
+    :param block:
+        np.ndarray, with shape (rows, 4), with times in seconds.
+    :type block:
+        np.ndarray
+    :return:
+        List of arrays of [times (days), fluxes, flags, uncertainties]
+    """
+    data = np.ascontiguousarray(block.T)
+    data[0] /= 86400  # Times stored on disk in seconds; but Lightcurve objects use days
+    return list(data[:4])
+
+
+def _read_sidecar_metadata(file_path):
+    """
+    Read the metadata associated with a lightcurve from the <.metadata> sidecar file written alongside it by older
+    versions of this code, if it exists.
+
+    :param file_path:
+        The path of the lightcurve data file (not of the sidecar file).
+    :type file_path:
+        str
+    :return:
+        dict
+    """
+    metadata = {}
+    file_path_metadata = "{}.metadata".format(file_path)
+    if not os.path.exists(file_path_metadata):
+        return metadata
+
+    with open(file_path_metadata) as f:
+        for line in f:
+            test = re.match(r"(.*)=(.*)", line)
+            if test is not None:
+                metadata_key = test.group(1).strip()
+                metadata_value = test.group(2).strip()
+
+                # If metadata value is a float, convert it to a float. Otherwise keep it as string.
+                try:
+                    metadata_value = float(metadata_value)
+                except ValueError:
+                    pass
+
+                metadata[metadata_key] = metadata_value
+    return metadata
+
+
+def _implicit_zero_uncertainties(uncertainties):
+    """
+    Replace an array of uncertainties which are all zero with None, so that the lightcurve they belong to does not
+    need to hold it in memory. Arrays which are memory-mapped from a file are left unchanged, since they occupy no
+    memory until they are read.
+
+    :param uncertainties:
+        The uncertainty in each data point.
+    :type uncertainties:
+        np.ndarray
+    :return:
+        np.ndarray, or None
+    """
+    if isinstance(uncertainties.base, np.memmap) or np.any(uncertainties):
+        return uncertainties
+    return None
+
+
+def _read_only(values):
+    """
+    Return a read-only view of an array, so that a lightcurve can share it with other lightcurves, or with the code
+    which created it, without any of them being able to modify the data underneath the others. The array passed in is
+    itself left writable.
+
+    :param values:
+        The array to protect.
+    :type values:
+        np.ndarray
+    :return:
+        np.ndarray
+    """
+    if values is None or not isinstance(values, np.ndarray) or not values.flags.writeable:
+        return values
+    view = values.view()
+    view.flags.writeable = False
+    return view
+
 
 class LightcurveArbitraryRaster:
     """
     A class representing a lightcurve which is sampled on an arbitrary raster of times.
+
+    The arrays of a lightcurve are read-only, so that many lightcurves -- for example, the windows of one lightcurve
+    held in memory which are passed to several transit searches -- can share the same data without copying it. Code
+    which needs to modify a lightcurve should take a <copy_on_write> copy of it, and then request each array it
+    modifies with <writable>, which copies that array only.
+
+    Lightcurves read from files, and the results of arithmetic on lightcurves, own their arrays, which nothing else
+    refers to. They may overwrite them with the results of further arithmetic, until they share them with another
+    lightcurve.
     """
 
-    def __init__(self, times, fluxes, uncertainties=None, flags=None, metadata=None):
+    def __init__(self, times, fluxes, uncertainties=None, flags=None, metadata=None, dtype_policy=None):
         """
         Create a lightcurve which is sampled on an arbitrary raster of times.
 
         :param times:
-            The times of the data points (days).
+            The times of the data points (days). This may be an <ImplicitTimeAxis>, which is only expanded into an
+            array of times when they are first accessed.
         :type times:
             np.ndarray
         :param fluxes:
@@ -34,7 +193,8 @@ class LightcurveArbitraryRaster:
         :type fluxes:
             np.ndarray
         :param uncertainties:
-            The uncertainty in each data point.
+            The uncertainty in each data point. If not specified, the uncertainties are zero, and an array of zeros is
+            only created if they are accessed.
         :type uncertainties:
             np.ndarray
         :param flags:
@@ -45,17 +205,26 @@ class LightcurveArbitraryRaster:
             The metadata associated with this lightcurve.
         :type metadata:
             dict
+        :param dtype_policy:
+            The numeric types used to store the fluxes, uncertainties and flags (see <lc_dtype_policy>). Arrays are
+            converted to these types, if they are not already of them. If None, everything is stored at double
+            precision.
+        :type dtype_policy:
+            DtypePolicy
         """
 
         # Check inputs
-        assert isinstance(times, np.ndarray)
+        assert isinstance(times, (np.ndarray, ImplicitTimeAxis))
         assert isinstance(fluxes, np.ndarray)
 
+        if dtype_policy is None:
+            dtype_policy = default_dtype_policy
+
         # Unset all flags if none were specified
         if flags is not None:
             assert isinstance(flags, np.ndarray)
         else:
-            flags = np.zeros_like(times)
+            flags = np.zeros(len(times), dtype=dtype_policy.flag_dtype)
 
         # Make an empty metadata dictionary if none was specified
         if metadata is not None:
@@ -63,24 +232,242 @@ class LightcurveArbitraryRaster:
         else:
             metadata = {}
 
-        # Make uncertainty zero if not specified
+        # Uncertainties are zero if not specified
         if uncertainties is not None:
             assert isinstance(uncertainties, np.ndarray)
-        else:
-            uncertainties = np.zeros_like(fluxes)
+            uncertainties = dtype_policy.cast_fluxes(uncertainties)
 
         # Store the data
+        self.dtype_policy = dtype_policy
         self.times = times  # days
-        self.fluxes = fluxes
+        self.fluxes = dtype_policy.cast_fluxes(fluxes)
         self.uncertainties = uncertainties
-        self.flags = flags
+        self.flags = dtype_policy.cast_flags(flags)
         self.flags_set = True
         self.metadata = metadata
 
-    def to_file(self, directory, filename, binary=False, gzipped=True, overwrite=True, create_directory=True):
+    @property
+    def uncertainties(self):
+        """
+        The uncertainty in each data point. If this lightcurve has no uncertainties, an array of zeros is created the
+        first time they are accessed.
+
+        :return:
+            np.ndarray
+        """
+        if self._uncertainties is None:
+            self._uncertainties = _read_only(np.zeros(len(self.fluxes), dtype=self.dtype_policy.flux_dtype))
+        return self._uncertainties
+
+    @uncertainties.setter
+    def uncertainties(self, uncertainties):
+        self._uncertainties = _read_only(uncertainties)
+
+    @property
+    def has_uncertainties(self):
+        """
+        Boolean indicating whether this lightcurve has an array of uncertainties, rather than being implicitly zero.
+
+        :return:
+            bool
+        """
+        return self._uncertainties is not None
+
+    @property
+    def fluxes(self):
+        """
+        The light fluxes at each data point. This array is read-only, unless it has been replaced with a private copy
+        by <writable>.
+
+        :return:
+            np.ndarray
+        """
+        return self._fluxes
+
+    @fluxes.setter
+    def fluxes(self, fluxes):
+        self._fluxes = _read_only(fluxes)
+
+    @property
+    def flags(self):
+        """
+        The flag associated with each data point. This array is read-only, unless it has been replaced with a private
+        copy by <writable>.
+
+        :return:
+            np.ndarray
+        """
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = _read_only(flags)
+
+    def writable(self, column):
+        """
+        Return a writable version of one of this lightcurve's arrays. The first time an array is requested, it is
+        copied, and the copy replaces the lightcurve's own array, so that any other lightcurves which share the
+        original are unaffected. Later requests return the same copy, without copying again.
+
+        This modifies this lightcurve, so to modify a lightcurve which belongs to somebody else, such as one passed to
+        a transit-detection code, first take a <copy_on_write> copy of it.
+
+        :param column:
+            The array to return: 'fluxes', 'uncertainties' or 'flags'.
+        :type column:
+            str
+        :return:
+            np.ndarray
+        """
+        assert column in ('fluxes', 'uncertainties', 'flags'), "Unknown lightcurve column <{}>".format(column)
+        values = getattr(self, column)
+        if not values.flags.writeable:
+            values = values.copy()
+            setattr(self, '_' + column, values)
+        return values
+
+    def _adopt_arrays(self, **columns):
+        """
+        Store arrays which were allocated for this lightcurve alone, such as the results of arithmetic, without making
+        them read-only, so that this lightcurve may update them in place.
+
+        :param columns:
+            The arrays to store, keyed by column name: 'fluxes', 'uncertainties' or 'flags'.
+        :return:
+            None
+        """
+        for column, values in columns.items():
+            setattr(self, '_' + column, values)
+
+    @classmethod
+    def _from_adopted_arrays(cls, times, fluxes, uncertainties=None, flags=None, metadata=None, dtype_policy=None):
+        """
+        Create a lightcurve which owns its flux, uncertainty and flag arrays (see <_adopt_arrays>). This is used by
+        readers to hand over the arrays they have just parsed from a file, which nothing else refers to.
+
+        :param times:
+            The times of the data points (days).
+        :type times:
+            np.ndarray
+        :param fluxes:
+            The light fluxes at each data point.
+        :type fluxes:
+            np.ndarray
+        :param uncertainties:
+            The uncertainty in each data point, or None if the uncertainties are zero.
+        :type uncertainties:
+            np.ndarray
+        :param flags:
+            The flag associated with each data point.
+        :type flags:
+            np.ndarray
+        :param metadata:
+            The metadata associated with this lightcurve.
+        :type metadata:
+            dict
+        :param dtype_policy:
+            The numeric types used to store the fluxes, uncertainties and flags (see <lc_dtype_policy>).
+        :type dtype_policy:
+            DtypePolicy
+        :return:
+            LightcurveArbitraryRaster
+        """
+        if dtype_policy is None:
+            dtype_policy = default_dtype_policy
+
+        # Convert the arrays before creating the lightcurve, so that it stores the same arrays we adopt
+        fluxes = dtype_policy.cast_fluxes(fluxes)
+        uncertainties = None if uncertainties is None else dtype_policy.cast_fluxes(uncertainties)
+        flags = (np.zeros(len(times), dtype=dtype_policy.flag_dtype) if flags is None
+                 else dtype_policy.cast_flags(flags))
+
+        lightcurve = cls(times=times, fluxes=fluxes, uncertainties=uncertainties, flags=flags, metadata=metadata,
+                         dtype_policy=dtype_policy)
+        lightcurve._adopt_arrays(fluxes=fluxes, uncertainties=uncertainties, flags=flags)
+        return lightcurve
+
+    def _share_arrays(self):
+        """
+        Make this lightcurve's arrays read-only before they are shared with another lightcurve, so that this
+        lightcurve can no longer modify them underneath it.
+
+        :return:
+            None
+        """
+        for values in (self._fluxes, self._uncertainties, self._flags):
+            if values is not None and values.flags.writeable:
+                values.flags.writeable = False
+
+    def copy_on_write(self):
+        """
+        Return a copy of this lightcurve which shares all of its arrays, so that nothing is copied until the copy
+        requests a writable array with <writable>. The copy has its own metadata dictionary.
+
+        :return:
+            LightcurveArbitraryRaster
+        """
+        self._share_arrays()
+        return LightcurveArbitraryRaster(times=self._time_axis if self._times is None else self._times,
+                                         fluxes=self.fluxes,
+                                         uncertainties=self._uncertainties,
+                                         flags=self.flags,
+                                         metadata={**self.metadata},
+                                         dtype_policy=self.dtype_policy)
+
+    def with_dtype_policy(self, dtype_policy):
         """
-        Write a lightcurve out to a text data file. The time axis is multiplied by a factor 86400 to convert
-        from days into seconds.
+        Return this lightcurve with its data stored using a different dtype policy. Arrays which are already of the
+        right type are shared with this lightcurve, rather than being copied.
+
+        :param dtype_policy:
+            The numeric types used to store the fluxes, uncertainties and flags.
+        :type dtype_policy:
+            DtypePolicy
+        :return:
+            LightcurveArbitraryRaster
+        """
+        if dtype_policy == self.dtype_policy:
+            return self
+        self._share_arrays()
+        return LightcurveArbitraryRaster(times=self._time_axis if self._times is None else self._times,
+                                         fluxes=self.fluxes,
+                                         uncertainties=self._uncertainties,
+                                         flags=self.flags,
+                                         metadata=self.metadata,
+                                         dtype_policy=dtype_policy)
+
+    @property
+    def times(self):
+        """
+        The times of the data points (days). If this lightcurve has an implicit time axis, it is expanded into an
+        array the first time it is accessed.
+
+        :return:
+            np.ndarray
+        """
+        if self._times is None:
+            self._times = _read_only(self._time_axis.materialise())
+        return self._times
+
+    @times.setter
+    def times(self, times):
+        if isinstance(times, ImplicitTimeAxis):
+            self._times = None
+            self._time_axis = times
+        else:
+            self._times = _read_only(times)
+            self._time_axis = None
+
+        # Discard the gap index, which was computed from the old time axis
+        self._gap_index_cache = {}
+
+    def to_file(self, directory, filename, binary=False, gzipped=True, overwrite=True, create_directory=True,
+                codec=None, codec_level=None, shuffle=True, implicit_time=True, float32=False,
+                metadata_format="sidecar", compress_level=6, compression_threads=0):
+        """
+        Write a lightcurve out to a data file. In plain-text files, the time axis is multiplied by a factor 86400 to
+        convert from days into seconds. Binary files use our columnar format (see <lc_columnar>), which stores times in
+        days so that they can be memory-mapped without conversion, or may optionally be compressed.
 
         :param filename:
             The filename of the lightcurve (within our local lightcurve archive).
@@ -95,7 +482,7 @@ class LightcurveArbitraryRaster:
         :type binary:
             bool
         :param gzipped:
-            Boolean specifying whether we gzip plain-text lightcurves.
+            Boolean specifying whether we gzip plain-text lightcurves. Binary lightcurves are never gzipped.
         :type gzipped:
             bool
         :param overwrite:
@@ -106,6 +493,48 @@ class LightcurveArbitraryRaster:
             Boolean flag indicating whether we should create the parent directory, if it doesn't exist.
         :type create_directory:
             bool
+        :param codec:
+            The compression codec used for binary lightcurves -- 'none', 'zlib', 'lzma' or 'bz2' -- or None to store
+            the columns uncompressed, so that they can be memory-mapped (see <lc_codecs>).
+        :type codec:
+            str
+        :param codec_level:
+            The compression level, or None to use the codec's default.
+        :type codec_level:
+            int
+        :param shuffle:
+            Boolean specifying whether we apply the delta and byte-shuffle pre-filters to the time and flux columns of
+            compressed binary lightcurves.
+        :type shuffle:
+            bool
+        :param implicit_time:
+            Boolean specifying whether binary lightcurves on a fixed time step (with some samples possibly missing)
+            store only the start time, step and a mask of missing samples, rather than the time of every sample. This
+            is only done if it reproduces the time axis exactly.
+        :type implicit_time:
+            bool
+        :param float32:
+            Boolean specifying whether binary lightcurves store fluxes and uncertainties at single precision. The
+            largest rounding error is recorded in the file header, under <max_error>. Flags are also stored at single
+            precision, if this is exact.
+        :type float32:
+            bool
+        :param metadata_format:
+            Either 'sidecar', to store the lightcurve's metadata in a separate <.metadata> file, which older versions
+            of this code require, or 'embedded', to store it as JSON in the same file as the data, so that it can be
+            read with a single open. Both are read by <from_file>.
+        :type metadata_format:
+            str
+        :param compress_level:
+            The compression level used for gzipped plain-text lightcurves.
+        :type compress_level:
+            int
+        :param compression_threads:
+            The number of threads used to compress gzipped plain-text lightcurves. If zero, they are compressed
+            sequentially into a single gzip stream; otherwise they are compressed in parallel blocks, producing a
+            multi-member gzip file.
+        :type compression_threads:
+            int
         """
 
         # Make sure target directory exists
@@ -120,31 +549,63 @@ class LightcurveArbitraryRaster:
             assert not os.path.exists(target_path), \
                 "Attempting to overwrite existing lightcurve <{}>".format(target_path)
 
-        # Pick the writer for this lightcurve
-        if not gzipped:
-            opener = open
-        else:
-            opener = gzip.open
+        # Binary lightcurves are memory-mapped when they are read, so they cannot be compressed
+        if binary:
+            gzipped = False
+
+        assert metadata_format in ('embedded', 'sidecar'), "Unknown metadata format <{}>".format(metadata_format)
 
         # Write lightcurve metadata
         target_path_metadata = "{}.metadata".format(target_path)
-        with open(target_path_metadata, "w") as out:
-            out.write("{}={}\n".format("binary", int(binary)))
-            out.write("{}={}\n".format("gzipped", int(gzipped)))
-            # Include metadata in text file
-            for key, value in self.metadata.items():
-                out.write("{}={}\n".format(key, value))
+        if metadata_format == 'sidecar':
+            with open(target_path_metadata, "w") as out:
+                out.write("{}={}\n".format("binary", int(binary)))
+                out.write("{}={}\n".format("gzipped", int(gzipped)))
+                if binary:
+                    out.write("{}={}\n".format("binary_format", "columnar"))
+                    out.write("{}={}\n".format("codec", codec if codec is not None else "none"))
+                # Include metadata in text file
+                for key, value in self.metadata.items():
+                    out.write("{}={}\n".format(key, value))
+        elif os.path.exists(target_path_metadata):
+            # Remove any stale sidecar, left behind by a previous lightcurve with the same filename
+            os.unlink(target_path_metadata)
+
+        # Lightcurves without uncertainties are written with a column of zeros, without attaching it to this lightcurve
+        uncertainties = self._uncertainties if self.has_uncertainties else np.zeros_like(self.fluxes)
 
         # Write this lightcurve output into lightcurve archive (store times in seconds)
         if not binary:
-            with opener(target_path, "wt") as out:
-                # Output the lightcurve itself
-                np.savetxt(out, np.transpose([self.times * 86400, self.fluxes, self.flags, self.uncertainties]))
+            # Embed the metadata in a comment line at the top of the file
+            header = b''
+            if metadata_format == 'embedded':
+                header = text_metadata_prefix + json.dumps(self.metadata, default=json_default).encode('utf-8') + b'\n'
+
+            # Output the lightcurve itself, formatted and compressed in large blocks. The text is identical to the
+            # output of <np.savetxt>.
+            write_text_columns(file_path=target_path,
+                               columns=[self.times * 86400, self.fluxes, self.flags, uncertainties],
+                               gzipped=gzipped, compress_level=compress_level, threads=compression_threads,
+                               header=header)
         else:
-            np.save(target_path, np.transpose([self.times * 86400, self.fluxes, self.flags, self.uncertainties]))
+            float32_columns = []
+            if float32:
+                float32_columns = ['fluxes', 'uncertainties']
+                if (np.issubdtype(self.flags.dtype, np.floating) and
+                        np.array_equal(self.flags.astype(np.float32), self.flags)):
+                    float32_columns.append('flags')
+
+            write_columnar(file_path=target_path, columns={
+                'times': self.times,
+                'fluxes': self.fluxes,
+                'flags': self.flags,
+                'uncertainties': uncertainties
+            }, codec=codec, codec_level=codec_level, filters=default_filters if shuffle else {},
+                implicit_time=implicit_time, float32_columns=float32_columns,
+                metadata=self.metadata if metadata_format == 'embedded' else None)
 
     @classmethod
-    def from_file(cls, directory, filename, cut_off_time=None):
+    def from_file(cls, directory, filename, cut_off_time=None, dtype_policy=None):
         """
         Read a lightcurve from a data file in our lightcurve archive.
 
@@ -161,14 +622,15 @@ class LightcurveArbitraryRaster:
         :type directory:
             str
         :return:
-            A <LightcurveArbitraryRaster> object.
+            A <LightcurveArbitraryRaster> object. Binary lightcurves are returned as copy-on-write memory-mapped views
+            of the file, so only the pages which are actually used are read from disk. Metadata is read from the data
+            file itself if it is embedded there, or otherwise from the <.metadata> sidecar file.
+        :param dtype_policy:
+            The numeric types used to store the lightcurve in memory (see <lc_dtype_policy>).
+        :type dtype_policy:
+            DtypePolicy
         """
 
-        times = []  # Times stored as days, but data files contain seconds
-        fluxes = []
-        uncertainties = []
-        flags = []
-
         metadata = {
             'directory': directory,
             'filename': filename
@@ -176,176 +638,403 @@ class LightcurveArbitraryRaster:
         # Full path for this lightcurve
         file_path = os.path.join(settings['lcPath'], directory, filename)
 
-        # Read all lightcurve metadata
-        file_path_metadata = "{}.metadata".format(file_path)
-        with open(file_path_metadata) as f:
-            for line in f:
-                test = re.match(r"(.*)=(.*)", line)
-                if test is not None:
-                    metadata_key = test.group(1).strip()
-                    metadata_value = test.group(2).strip()
-
-                    # If metadata value is a float, convert it to a float. Otherwise keep it as string.
-                    try:
-                        metadata_value = float(metadata_value)
-                    except ValueError:
-                        pass
-
-                    metadata[metadata_key] = metadata_value
-
-        # Read file format of lightcurve from metadata
-        assert 'binary' in metadata
-        binary = bool(metadata['binary'])
-        assert 'gzipped' in metadata
-        gzipped = bool(metadata['gzipped'])
-
-        # Look up file open function
-        file_opener = gzip.open if gzipped else open
-
-        if binary:
-            # Read binary lightcurve file
-            time, flux, flag, uncertainties = np.load(file_path)
-            time /= 86400  # Times stored in seconds; but Lightcurve objects use days
+        # Legacy binary lightcurve files were written by <np.save>, which appends a .npy suffix to the filename
+        if not os.path.exists(file_path) and os.path.exists("{}.npy".format(file_path)):
+            file_path = "{}.npy".format(file_path)
+
+        # Work out the format of the data file from its first few bytes, so that we only need to open it once
+        embedded_metadata = None
+        with open(file_path, "rb") as f:
+            file_start = f.read(len(columnar_magic))
+            f.seek(0)
+
+            if file_start == columnar_magic:
+                # Memory-map columnar binary lightcurve file. The codec of each column is recorded in the file's header.
+                header, columns = read_columnar(file_path=f, cut_off_time=cut_off_time)
+                embedded_metadata = header.get('metadata', None)
+                times, fluxes, flags, uncertainties = (columns['times'], columns['fluxes'],
+                                                       columns['flags'], columns['uncertainties'])
+            elif file_start.startswith(b"\x93NUMPY"):
+                # Read legacy binary lightcurve file, written by <np.save>
+                times, fluxes, flags, uncertainties = np.ascontiguousarray(np.load(f).T)
+                times /= 86400  # Times stored in seconds; but Lightcurve objects use days
+
+                # Truncate lightcurve at the cut-off time
+                if cut_off_time is not None:
+                    selection = times <= cut_off_time
+                    times, fluxes, flags, uncertainties = (times[selection], fluxes[selection],
+                                                           flags[selection], uncertainties[selection])
+            else:
+                # Textual lightcurve, which may be gzipped
+                file = gzip.GzipFile(fileobj=f, mode="rb") if file_start.startswith(b"\x1f\x8b") else f
+
+                # Read metadata from the first line, if it is embedded there
+                first_line = file.readline()
+                if first_line.startswith(text_metadata_prefix):
+                    embedded_metadata = json.loads(first_line[len(text_metadata_prefix):].decode('utf-8'))
+                    first_line = b''
+
+                times, fluxes, flags, uncertainties = _read_text_columns(file_handle=file, cut_off_time=cut_off_time,
+                                                                         initial=first_line)
+
+        if embedded_metadata is not None:
+            metadata.update(embedded_metadata)
         else:
-            # Textual lightcurve: loop over lines of input file
-            with file_opener(file_path, "rt") as file:
-                for line in file:
-                    # Ignore blank lines and comment lines
-                    if len(line) == 0 or line[0] == '#':
-                        continue
-
-                    # Unpack data
-                    words = line.split()
-                    time = float(words[0]) / 86400  # Times stored on disk in seconds; but Lightcurve objects use days
-                    flux = float(words[1])
-                    flag = float(words[2])
-                    uncertainty = float(words[3])
-
-                    # Check we have not exceeded cut-off time
-                    if cut_off_time is not None and time > cut_off_time:
-                        continue
-
-                    # Read three columns of data
-                    times.append(time)
-                    fluxes.append(flux)
-                    flags.append(flag)
-                    uncertainties.append(uncertainty)
-
-        # Convert into a Lightcurve object
-        lightcurve = LightcurveArbitraryRaster(times=np.asarray(times),
-                                               fluxes=np.asarray(fluxes),
-                                               uncertainties=np.asarray(uncertainties),
-                                               flags=np.asarray(flags),
-                                               metadata=metadata
-                                               )
+            # Read all lightcurve metadata from the sidecar file written by older versions of this code
+            metadata.update(_read_sidecar_metadata(file_path=os.path.join(settings['lcPath'], directory, filename)))
+
+        # Convert into a Lightcurve object, which owns the arrays we have just read
+        lightcurve = LightcurveArbitraryRaster._from_adopted_arrays(times=times,
+                                                                    fluxes=fluxes,
+                                                                    uncertainties=_implicit_zero_uncertainties(
+                                                                        uncertainties),
+                                                                    flags=flags,
+                                                                    metadata=metadata,
+                                                                    dtype_policy=dtype_policy
+                                                                    )
 
         # Return lightcurve
         return lightcurve
 
-    def __add__(self, other):
+    @classmethod
+    def iter_from_file(cls, directory, filename, chunk_length=None, chunk_duration=None, cut_off_time=None,
+                       dtype_policy=None):
         """
-        Add two lightcurves together.
+        Read a lightcurve from a data file in our lightcurve archive as a sequence of chunks, each of which is a
+        <LightcurveArbitraryRaster> object. Only one chunk (plus one block of the file) is held in memory at a time, so
+        this can be used to process lightcurves which are too large to load in one go.
+
+        :param directory:
+            The directory in which the lightcurve is stored.
+        :type directory:
+            str
+        :param filename:
+            The filename of the input data file.
+        :type filename:
+            str
+        :param chunk_length:
+            The number of samples in each chunk. Defaults to <lc_stream.default_chunk_length>.
+        :type chunk_length:
+            int
+        :param chunk_duration:
+            Alternatively, the time span of each chunk (days).
+        :type chunk_duration:
+            float
+        :param cut_off_time:
+            Only read lightcurve up to some cut off time
+        :type cut_off_time:
+            float
+        :param dtype_policy:
+            The numeric types used to store each chunk in memory (see <lc_dtype_policy>).
+        :type dtype_policy:
+            DtypePolicy
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects
+        """
+
+        metadata = {
+            'directory': directory,
+            'filename': filename
+        }
+        # Full path for this lightcurve
+        file_path = os.path.join(settings['lcPath'], directory, filename)
 
+        # Legacy binary lightcurve files were written by <np.save>, which appends a .npy suffix to the filename
+        if not os.path.exists(file_path) and os.path.exists("{}.npy".format(file_path)):
+            file_path = "{}.npy".format(file_path)
+
+        # Work out the format of the data file from its first few bytes
+        embedded_metadata = None
+        with open(file_path, "rb") as f:
+            file_start = f.read(len(columnar_magic))
+            f.seek(0)
+
+            if file_start == columnar_magic:
+                # Columnar binary lightcurve file
+                embedded_metadata = read_columnar_header(file_path=f).get('metadata', None)
+                blocks = ([chunk['times'], chunk['fluxes'], chunk['flags'], chunk['uncertainties']]
+                          for chunk in iter_columnar(file_path=f,
+                                                     chunk_length=chunk_length or default_chunk_length))
+            elif file_start.startswith(b"\x93NUMPY"):
+                # Legacy binary lightcurve file, written by <np.save>, with times in seconds
+                data = np.load(file_path, mmap_mode='r')
+                block_length = chunk_length or default_chunk_length
+                blocks = ([data[start:start + block_length, 0] / 86400] +
+                          [np.array(data[start:start + block_length, i]) for i in (1, 2, 3)]
+                          for start in range(0, len(data), block_length))
+            else:
+                # Textual lightcurve, which may be gzipped
+                file = gzip.GzipFile(fileobj=f, mode="rb") if file_start.startswith(b"\x1f\x8b") else f
+
+                # Read metadata from the first line, if it is embedded there
+                first_line = file.readline()
+                if first_line.startswith(text_metadata_prefix):
+                    embedded_metadata = json.loads(first_line[len(text_metadata_prefix):].decode('utf-8'))
+                    first_line = b''
+
+                blocks = (_text_block_to_columns(block=block)
+                          for block in iter_text_blocks(file_handle=file, initial=first_line))
+
+            if embedded_metadata is not None:
+                metadata.update(embedded_metadata)
+            else:
+                # Read all lightcurve metadata from the sidecar file written by older versions of this code
+                metadata.update(_read_sidecar_metadata(file_path=os.path.join(settings['lcPath'], directory, filename)))
+
+            for times, fluxes, flags, uncertainties in rechunk_columns(blocks=blocks, chunk_length=chunk_length,
+                                                                       chunk_duration=chunk_duration,
+                                                                       cut_off_time=cut_off_time):
+                yield LightcurveArbitraryRaster(times=times,
+                                                fluxes=fluxes,
+                                                uncertainties=uncertainties,
+                                                flags=flags,
+                                                metadata={**metadata},
+                                                dtype_policy=dtype_policy
+                                                )
+
+    def _other_on_same_raster(self, other):
+        """
+        Return the fluxes, uncertainties and flags of another lightcurve on the time raster of this one. If the other
+        lightcurve is sampled at exactly the same times as this one, or on a longer raster of which this one is a
+        contiguous part, its arrays are used directly. Otherwise it is resampled onto the raster of this lightcurve.
+
+        :param other:
+            The other lightcurve.
         :type other:
             LightcurveArbitraryRaster
+        :return:
+            Tuple of (fluxes, uncertainties, flags). The uncertainties are None if the other lightcurve has none.
         """
 
         # Avoid circular import
         from .lightcurve_resample import LightcurveResampler
 
+        # Look for the start of this lightcurve's raster within the other lightcurve's raster
+        length = len(self.times)
+        if other.times is self.times:
+            return other.fluxes, other._uncertainties, other.flags
+        offset = int(np.searchsorted(other.times, self.times[0])) if length > 0 else 0
+        if offset + length <= len(other.times) and np.array_equal(other.times[offset:offset + length], self.times):
+            return (other.fluxes[offset:offset + length],
+                    other._uncertainties[offset:offset + length] if other.has_uncertainties else None,
+                    other.flags[offset:offset + length])
+
         # Resample other lightcurve onto same time raster as this
         resampler = LightcurveResampler(input_lc=other)
         other_resampled = resampler.match_to_other_lightcurve(other=self)
+        return (other_resampled.fluxes, other_resampled._uncertainties,
+                to_flag_dtype(values=other_resampled.mask, dtype=self.flags.dtype))
 
-        # Take metadata from the lightcurve with the strongest transit signal
-        if self.metadata['mes'] > other.metadata['mes']:
-            output_metadata = {**self.metadata}
-        else:
-            output_metadata = {**other.metadata}
-
-        # Create output lightcurve
-        result = LightcurveArbitraryRaster(
-            times=self.times,
-            fluxes=self.fluxes + other_resampled.fluxes,
-            uncertainties=np.hypot(self.uncertainties, other_resampled.uncertainties),
-            flags=np.hypot(self.flags, other_resampled.flags),
-            metadata=output_metadata
-        )
+    def _buffers_writable(self, length):
+        """
+        Test whether the flux, uncertainty and flag arrays of this lightcurve can be overwritten with the result of an
+        arithmetic operation on lightcurves with a given number of samples. Only arrays which belong to this
+        lightcurve alone are writable (see <writable>).
 
-        return result
+        :param length:
+            The number of samples in the lightcurves being combined.
+        :type length:
+            int
+        :return:
+            bool
+        """
+        buffers = [self.fluxes, self.flags] + ([self._uncertainties] if self.has_uncertainties else [])
+        return (all(buffer.flags.writeable and len(buffer) == length for buffer in buffers) and
+                np.issubdtype(self.fluxes.dtype, np.floating) and
+                len(set(id(buffer) for buffer in buffers)) == len(buffers))
 
-    def __sub__(self, other):
+    def _combine(self, other, operation, out=None):
         """
-        Subtract one lightcurve from another.
+        Combine this lightcurve with another, sample by sample.
 
+        :param other:
+            The other lightcurve.
         :type other:
             LightcurveArbitraryRaster
+        :param operation:
+            The operation to apply to the fluxes: 'add', 'subtract' or 'multiply'.
+        :type operation:
+            str
+        :param out:
+            Optionally, a lightcurve with the same number of samples as this one, whose flux, uncertainty and flag
+            arrays are overwritten with the result, rather than allocating new arrays. This may be this lightcurve
+            itself.
+        :type out:
+            LightcurveArbitraryRaster
+        :return:
+            LightcurveArbitraryRaster
         """
+        flux_operation = {'add': np.add, 'subtract': np.subtract, 'multiply': np.multiply}[operation]
 
-        # Avoid circular import
-        from .lightcurve_resample import LightcurveResampler
+        other_fluxes, other_uncertainties, other_flags = self._other_on_same_raster(other=other)
 
-        # Resample other lightcurve onto same time raster as this
-        resampler = LightcurveResampler(input_lc=other)
-        other_resampled = resampler.match_to_other_lightcurve(other=self)
+        # Take metadata from the lightcurve with the strongest transit signal when adding; otherwise merge metadata
+        # from the two input lightcurves
+        if operation != 'add':
+            output_metadata = {**self.metadata, **other.metadata}
+        elif self.metadata['mes'] > other.metadata['mes']:
+            output_metadata = {**self.metadata}
+        else:
+            output_metadata = {**other.metadata}
 
-        # Merge metadata from the two input lightcurves
-        output_metadata = {**self.metadata, **other.metadata}
+        # Remove first and last data points of products due to edge effects
+        trim = slice(1, -1) if operation == 'multiply' else slice(None)
+        times = self.times[trim] if operation == 'multiply' else self.times
+
+        if out is None:
+            buffers = (None, None, None)
+        else:
+            assert out._buffers_writable(length=len(self.times)), \
+                "Output lightcurve must have distinct, writable arrays of the same length as the input"
+            buffers = (out.fluxes[trim], out._uncertainties[trim] if out.has_uncertainties else None, out.flags[trim])
+
+        fluxes = flux_operation(self.fluxes[trim], other_fluxes[trim], out=buffers[0])
+        flags = combine_flags(self.flags[trim], other_flags[trim], out=buffers[2])
+
+        # Combine uncertainties in quadrature, unless neither lightcurve has any
+        if not self.has_uncertainties and other_uncertainties is None:
+            uncertainties = None
+        elif other_uncertainties is None:
+            uncertainties = np.abs(self._uncertainties[trim], out=buffers[1])
+        elif not self.has_uncertainties:
+            uncertainties = np.abs(other_uncertainties[trim], out=buffers[1])
+        else:
+            uncertainties = np.hypot(self._uncertainties[trim], other_uncertainties[trim], out=buffers[1])
 
         # Create output lightcurve
-        result = LightcurveArbitraryRaster(
-            times=self.times,
-            fluxes=self.fluxes - other_resampled.fluxes,
-            uncertainties=np.hypot(self.uncertainties, other_resampled.uncertainties),
-            flags=np.hypot(self.flags, other_resampled.flags),
-            metadata=output_metadata
-        )
+        if out is None:
+            out = LightcurveArbitraryRaster(times=times, fluxes=fluxes, flags=flags, metadata=output_metadata,
+                                            dtype_policy=self.dtype_policy)
+        elif out.times is not times:
+            out.times = times
+
+        # The results were allocated for the output lightcurve alone, or are (possibly trimmed) views of its own
+        # arrays, so it may go on updating them in place
+        policy = out.dtype_policy
+        out._adopt_arrays(fluxes=policy.cast_fluxes(fluxes),
+                          uncertainties=None if uncertainties is None else policy.cast_fluxes(uncertainties),
+                          flags=policy.cast_flags(flags))
+        out.metadata = output_metadata
+        return out
+
+    def add(self, other, out=None):
+        """
+        Add two lightcurves together.
 
-        return result
+        :param other:
+            The lightcurve to add to this one.
+        :type other:
+            LightcurveArbitraryRaster
+        :param out:
+            Optionally, a lightcurve with the same number of samples as this one, whose arrays are overwritten with
+            the result, rather than allocating new arrays.
+        :type out:
+            LightcurveArbitraryRaster
+        :return:
+            LightcurveArbitraryRaster
+        """
+        return self._combine(other=other, operation='add', out=out)
 
-    def __mul__(self, other):
+    def subtract(self, other, out=None):
         """
-        Multiply two lightcurves together.
+        Subtract one lightcurve from another.
 
+        :param other:
+            The lightcurve to subtract from this one.
         :type other:
             LightcurveArbitraryRaster
+        :param out:
+            Optionally, a lightcurve with the same number of samples as this one, whose arrays are overwritten with
+            the result, rather than allocating new arrays.
+        :type out:
+            LightcurveArbitraryRaster
+        :return:
+            LightcurveArbitraryRaster
+        """
+        return self._combine(other=other, operation='subtract', out=out)
+
+    def multiply(self, other, out=None):
+        """
+        Multiply two lightcurves together. The first and last data points are removed from the result, due to edge
+        effects.
+
+        :param other:
+            The lightcurve to multiply this one by.
+        :type other:
+            LightcurveArbitraryRaster
+        :param out:
+            Optionally, a lightcurve with the same number of samples as this one, whose arrays are overwritten with
+            the result, rather than allocating new arrays. Its arrays are left as views of all but the first and last
+            elements of the original arrays.
+        :type out:
+            LightcurveArbitraryRaster
+        :return:
+            LightcurveArbitraryRaster
+        """
+        return self._combine(other=other, operation='multiply', out=out)
+
+    def lazy(self):
+        """
+        Wrap this lightcurve in a lazy expression, so that a chain of arithmetic operations on it is recorded, and
+        only evaluated in a single fused pass when <evaluate> is called. See <lc_expression>.
+
+        :return:
+            LightcurveExpression
         """
 
         # Avoid circular import
-        from .lightcurve_resample import LightcurveResampler
+        from .lc_expression import LightcurveExpression
 
-        # Resample other lightcurve onto same time raster as this
-        resampler = LightcurveResampler(input_lc=other)
-        other_resampled = resampler.match_to_other_lightcurve(other=self)
+        return LightcurveExpression(lightcurve=self)
 
-        # Merge metadata from the two input lightcurves
-        output_metadata = {**self.metadata, **other.metadata}
+    def __add__(self, other):
+        return self.add(other=other)
 
-        # Create output lightcurve. Remove first and last data points due to edge effects
-        result = LightcurveArbitraryRaster(
-            times=self.times[1:-1],
-            fluxes=(self.fluxes * other_resampled.fluxes)[1:-1],
-            uncertainties=np.hypot(self.uncertainties, other_resampled.uncertainties)[1:-1],
-            flags=np.hypot(self.flags, other_resampled.flags)[1:-1],
-            metadata=output_metadata
-        )
+    def __sub__(self, other):
+        return self.subtract(other=other)
+
+    def __mul__(self, other):
+        return self.multiply(other=other)
+
+    def __iadd__(self, other):
+        # Reuse this lightcurve's arrays if we can; otherwise fall back to allocating a new lightcurve
+        return self.add(other=other, out=self if self._buffers_writable(length=len(self.times)) else None)
 
-        return result
+    def __isub__(self, other):
+        return self.subtract(other=other, out=self if self._buffers_writable(length=len(self.times)) else None)
+
+    def __imul__(self, other):
+        return self.multiply(other=other, out=self if self._buffers_writable(length=len(self.times)) else None)
 
     def estimate_sampling_interval(self):
         """
-        Estimate the time step on which this light curve is sampled, with robustness against missing points.
+        Estimate the time step on which this light curve is sampled, with robustness against missing points. The
+        estimate is cached in this lightcurve's gap index.
+
+        :return:
+            Time step
+        """
+
+        if 'spacing' not in self._gap_index_cache:
+            self._gap_index_cache['spacing'] = self._estimate_sampling_interval()
+        return self._gap_index_cache['spacing']
+
+    def _estimate_sampling_interval(self):
+        """
+        Estimate the time step on which this light curve is sampled, without using the cached value.
 
         :return:
             Time step
         """
 
         differences = np.diff(self.times)
-        differences_sorted = np.sort(differences)
 
+        # Only the values within the interquartile range are needed, not their order, so a partial sort is enough
         interquartile_range_start = int(len(differences) * 0.25)
         interquartile_range_end = int(len(differences) * 0.75)
-        interquartile_data = differences_sorted[interquartile_range_start:interquartile_range_end]
+        if interquartile_range_end > interquartile_range_start:
+            differences = np.partition(differences, (interquartile_range_start, interquartile_range_end - 1))
+        interquartile_data = differences[interquartile_range_start:interquartile_range_end]
 
         interquartile_mean = np.mean(interquartile_data)
 
@@ -354,9 +1043,268 @@ class LightcurveArbitraryRaster:
 
         return float(interquartile_mean)
 
-    def check_fixed_step(self, verbose=True, max_errors=6):
+    def _first_samples_near(self, times, abs_tol):
+        """
+        For each of an ascending array of times, find the first sample in this lightcurve which is not more than
+        <abs_tol> before it.
+
+        :param times:
+            The times to search for, in ascending order (days).
+        :type times:
+            np.ndarray
+        :param abs_tol:
+            The tolerance on matching samples to times (days).
+        :type abs_tol:
+            float
+        :return:
+            np.ndarray of sample indices
+        """
+        positions = np.minimum(np.searchsorted(self.times, times - abs_tol, side='left'), len(self.times) - 1)
+
+        # Correct for rounding errors in <times - abs_tol>, so that we apply exactly the test <time - input_time <=
+        # abs_tol> to each sample
+        while True:
+            too_early = (times - self.times[positions] > abs_tol) & (positions < len(self.times) - 1)
+            too_late = (positions > 0) & (times - self.times[positions - 1] <= abs_tol)
+            if not (np.any(too_early) or np.any(too_late)):
+                break
+            positions += too_early
+            positions -= too_late
+        return positions
+
+    def _match_to_raster(self, raster, spacing, abs_tol):
+        """
+        Match each time point in a fixed-step raster to the first sample in this lightcurve which lies within
+        <abs_tol> of it, if there is one.
+
+        :param raster:
+            The times of the points in the raster, as returned by <np.arange> (days).
+        :type raster:
+            np.ndarray
+        :param spacing:
+            The time step of the raster (days).
+        :type spacing:
+            float
+        :param abs_tol:
+            The tolerance on matching samples to the raster (days).
+        :type abs_tol:
+            float
+        :return:
+            Tuple of (index of matched sample for each time point, which is undefined for time points with no match;
+            boolean mask of time points with no matching sample)
+        """
+
+        if len(raster) == 0 or abs_tol >= 0.4 * spacing:
+            # The tolerance is so wide that a sample may match several time points, so we search for each one
+            positions = self._first_samples_near(times=raster, abs_tol=abs_tol)
+            return positions, np.abs(raster - self.times[positions]) > abs_tol
+
+        # Each sample can only match the nearest time point in the raster, so we don't need to search
+        nearest = np.rint((self.times - raster[0]) / spacing).astype(np.int64)
+        np.clip(nearest, 0, len(raster) - 1, out=nearest)
+        matches = np.flatnonzero(np.abs(raster[nearest] - self.times) <= abs_tol)
+        matched_points = nearest[matches]
+
+        # If several samples match the same time point, use the first
+        first = np.ones(len(matches), dtype=bool)
+        first[1:] = matched_points[1:] != matched_points[:-1]
+
+        positions = np.zeros(len(raster), dtype=np.int64)
+        positions[matched_points[first]] = matches[first]
+        gap_mask = np.ones(len(raster), dtype=bool)
+        gap_mask[matched_points[first]] = False
+        return positions, gap_mask
+
+    def _log_raster_gaps(self, raster, gap_mask, abs_tol, max_errors):
+        """
+        Log the time points in a raster which have no matching sample in this lightcurve, together with the closest
+        sample to each, searching the samples between it and the previous point in the raster.
+
+        :param raster:
+            The times of the points in the raster (days).
+        :type raster:
+            np.ndarray
+        :param gap_mask:
+            Boolean mask of the time points with no matching sample, as returned by <_match_to_raster>.
+        :type gap_mask:
+            np.ndarray
+        :param abs_tol:
+            The tolerance on matching samples to the raster (days).
+        :type abs_tol:
+            float
+        :param max_errors:
+            The number of missing time points to log, less one, or None to log them all.
+        :type max_errors:
+            int
+        """
+        gap_indices = np.flatnonzero(gap_mask)
+        if max_errors is not None:
+            gap_indices = gap_indices[:max_errors + 1]
+        for index in gap_indices:
+            last = self._first_samples_near(times=raster[index:index + 1], abs_tol=abs_tol)[0]
+            first = self._first_samples_near(times=raster[index - 1:index], abs_tol=abs_tol)[0] if index > 0 else 0
+            candidates = self.times[first:last + 1]
+            closest_time_point = candidates[np.argmin(np.abs(candidates - raster[index]))]
+            logging.info("index {:5d} - Point missing at time {:.15f}. Closest time was {:.15f}.".
+                         format(index, raster[index], closest_time_point))
+
+    def analyse_gaps(self, spacing=None, abs_tol=1e-4, raster_origin=None):
+        """
+        Find all the gaps in this light curve, in a single vectorised pass. Two kinds of gap are found: time steps
+        which differ from the expected spacing, and points on a fixed-step raster from the first sample to the last
+        which have no matching sample. The number of errors reported by <check_fixed_step> is the number of rows with
+        <step_error> set, and the number reported by <check_fixed_step_v2> is the sum of <missing_count>. The times
+        of the samples must be in ascending order.
+
+        :param spacing:
+            The expected time step (days). If None, it is estimated from this lightcurve.
+        :type spacing:
+            float
+        :param abs_tol:
+            The tolerance on time steps, and on matching samples to the fixed-step raster (days).
+        :type abs_tol:
+            float
+        :param raster_origin:
+            The time of the first point of the fixed-step raster (days). If None, the raster starts at the first sample
+            of this lightcurve. See <fixed_step_raster_match>.
+        :type raster_origin:
+            float
+        :return:
+            np.ndarray, with data type <gap_table_dtype>, with one row for each time step which contains a gap
+        """
+
+        if spacing is None:
+            spacing = self.estimate_sampling_interval()
+
+        cache_key = ('gaps', spacing, abs_tol, raster_origin)
+        if cache_key not in self._gap_index_cache:
+            self._gap_index_cache[cache_key] = self._analyse_gaps(spacing=spacing, abs_tol=abs_tol,
+                                                                      raster_origin=raster_origin)
+        return self._gap_index_cache[cache_key].copy()
+
+    def _analyse_gaps(self, spacing, abs_tol, raster_origin=None):
+        """
+        Find all the gaps in this light curve, without using the cached gap table. See <analyse_gaps>.
+
+        :param spacing:
+            The expected time step (days).
+        :type spacing:
+            float
+        :param abs_tol:
+            The tolerance on time steps, and on matching samples to the fixed-step raster (days).
+        :type abs_tol:
+            float
+        :param raster_origin:
+            The time of the first point of the fixed-step raster (days), or None to start it at the first sample.
+        :type raster_origin:
+            float
+        :return:
+            np.ndarray, with data type <gap_table_dtype>
+        """
+
+        differences = np.diff(self.times)
+        step_errors = np.abs(differences - spacing) > abs_tol
+
+        # Count the points on the fixed-step raster with no matching sample, within each time step
+        raster, positions, raster_gaps = self.fixed_step_raster_match(spacing=spacing, abs_tol=abs_tol,
+                                                                      raster_origin=raster_origin)
+        missing_counts = np.bincount(np.searchsorted(self.times, raster[raster_gaps], side='right') - 1,
+                                     minlength=len(differences))
+
+        # Build table of gaps
+        rows = np.flatnonzero(step_errors | (missing_counts > 0))
+        points_missed = differences[rows] / spacing - 1
+
+        gaps = np.zeros(len(rows), dtype=gap_table_dtype)
+        gaps['start_index'] = rows
+        gaps['start_time'] = self.times[rows]
+        gaps['step'] = differences[rows]
+        gaps['missing_count'] = missing_counts[rows]
+        gaps['step_error'] = step_errors[rows]
+        gaps['unexpected_step'] = step_errors[rows] & (np.abs(np.round(points_missed) - points_missed) > abs_tol)
+        return gaps
+
+    def fixed_step_raster_match(self, spacing=None, abs_tol=1e-4, raster_origin=None):
+        """
+        Match each point of a fixed-step raster, from the first sample in this lightcurve to the last, to the first
+        sample which lies within <abs_tol> of it, if there is one. The result is cached in this lightcurve's gap
+        index, and must not be modified.
+
+        By default the raster starts at the first sample. When a long lightcurve is checked in chunks, <raster_origin>
+        is set to the time of its very first sample, so that every chunk is checked against the same raster. Each chunk
+        then covers the raster points from the first one at or after its first sample, to the last one before its last
+        sample, counting points in the same way as <np.arange>; adjacent chunks which share a sample therefore cover
+        every raster point exactly once.
+
+        :param spacing:
+            The time step of the raster (days). If None, it is estimated from this lightcurve.
+        :type spacing:
+            float
+        :param abs_tol:
+            The tolerance on matching samples to the raster (days).
+        :type abs_tol:
+            float
+        :param raster_origin:
+            The time of the first point of the raster (days), or None to start it at the first sample.
+        :type raster_origin:
+            float
+        :return:
+            Tuple of (times of the raster points; index of matched sample for each raster point, which is undefined for
+            points with no match; boolean mask of raster points with no matching sample)
+        """
+
+        if spacing is None:
+            spacing = self.estimate_sampling_interval()
+
+        cache_key = ('raster_match', spacing, abs_tol, raster_origin)
+        if cache_key not in self._gap_index_cache:
+            if raster_origin is None:
+                raster = np.arange(start=self.times[0], stop=self.times[-1], step=spacing)
+            else:
+                first_point, last_point = (max(int(np.ceil((time - raster_origin) / spacing)), 0)
+                                           for time in (self.times[0], self.times[-1]))
+                raster = raster_origin + np.arange(first_point, max(first_point, last_point)) * spacing
+            positions, gap_mask = self._match_to_raster(raster=raster, spacing=spacing, abs_tol=abs_tol)
+            self._gap_index_cache[cache_key] = (raster, positions, gap_mask)
+        return self._gap_index_cache[cache_key]
+
+    def window(self, t_start=None, t_end=None):
+        """
+        Return the part of this lightcurve within a time window, t_start <= t < t_end. The window is found by binary
+        search, so the times must be in ascending order. The returned lightcurve's arrays are views of this
+        lightcurve's arrays, and it shares this lightcurve's metadata, so nothing is copied. The arrays are read-only;
+        see <writable>.
+
+        :param t_start:
+            The start of the time window (days), or None to start at the beginning of the lightcurve.
+        :type t_start:
+            float
+        :param t_end:
+            The end of the time window (days), or None to continue to the end of the lightcurve.
+        :type t_end:
+            float
+        :return:
+            LightcurveArbitraryRaster
+        """
+        times = self.times
+        start = 0 if t_start is None else int(np.searchsorted(times, t_start, side='left'))
+        end = len(times) if t_end is None else int(np.searchsorted(times, t_end, side='left'))
+        end = max(start, end)
+
+        self._share_arrays()
+        uncertainties = self._uncertainties[start:end] if self.has_uncertainties else None
+        return LightcurveArbitraryRaster(times=times[start:end],
+                                         fluxes=self.fluxes[start:end],
+                                         uncertainties=uncertainties,
+                                         flags=self.flags[start:end],
+                                         metadata=self.metadata,
+                                         dtype_policy=self.dtype_policy
+                                         )
+
+    def check_fixed_step(self, verbose=True, max_errors=6, spacing=None):
         """
-        Check that this light curve is sampled at a fixed time interval. Return the number of errors.
+        Check that this light curve is sampled at a fixed time interval. Return the number of time steps which differ
+        from the expected spacing.
 
         :param verbose:
             Should we output a logging message about every missing time point?
@@ -366,43 +1314,34 @@ class LightcurveArbitraryRaster:
             The maximum number of errors we should show
         :type max_errors:
             int
+        :param spacing:
+            The expected time step (days). If None, it is estimated from this lightcurve. This is set when a long
+            lightcurve is checked in chunks, so that every chunk is checked against the same time step.
+        :type spacing:
+            float
         :return:
             int
         """
 
-        abs_tol = 1e-4
-        rel_tol = 0
-
-        error_count = 0
-        spacing = self.estimate_sampling_interval()
+        if spacing is None:
+            spacing = self.estimate_sampling_interval()
 
         if verbose:
             logging.info("Time step is {:.15f}".format(spacing))
 
-        differences = np.diff(self.times)
+        gaps = self.analyse_gaps(spacing=spacing)
+        step_errors = gaps[gaps['step_error']]
+        error_count = len(step_errors)
 
-        for index, step in enumerate(differences):
-            # If this time point has the correct spacing, it is OK
-            if math.isclose(step, spacing, abs_tol=abs_tol, rel_tol=rel_tol):
-                continue
-
-            # We have found a problem
-            error_count += 1
-
-            # See if we have skipped some time points
-            points_missed = step / spacing - 1
-            if math.isclose(points_missed, round(points_missed), abs_tol=abs_tol, rel_tol=rel_tol):
-                if verbose and (max_errors is None or error_count <= max_errors):
-                    logging.info("index {:5d} - {:d} points missing at time {:.5f}".format(index,
-                                                                                           int(points_missed),
-                                                                                           self.times[index]))
-                continue
-
-            # Or is this an entirely unexpected time interval?
-            if verbose and (max_errors is None or error_count <= max_errors):
-                logging.info("index {:5d} - Unexpected time step {:.15f} at time {:.5f}".format(index,
-                                                                                                step,
-                                                                                                self.times[index]))
+        if verbose:
+            for gap in step_errors if max_errors is None else step_errors[:max_errors]:
+                # See if we have skipped some time points, or if this is an entirely unexpected time interval
+                if not gap['unexpected_step']:
+                    logging.info("index {:5d} - {:d} points missing at time {:.5f}".format(
+                        gap['start_index'], int(gap['step'] / spacing - 1), gap['start_time']))
+                else:
+                    logging.info("index {:5d} - Unexpected time step {:.15f} at time {:.5f}".format(
+                        gap['start_index'], gap['step'], gap['start_time']))
 
         # Return total error count
         if verbose and error_count > 0:
@@ -411,9 +1350,10 @@ class LightcurveArbitraryRaster:
         # Return the verdict on this lightcurve
         return error_count
 
-    def check_fixed_step_v2(self, verbose=True, max_errors=6):
+    def check_fixed_step_v2(self, verbose=True, max_errors=6, spacing=None):
         """
-        Check that this light curve is sampled at a fixed time interval. Return the number of errors.
+        Check that this light curve is sampled at a fixed time interval. Return the number of points on a fixed-step
+        raster, from the first sample to the last, which have no matching sample.
 
         :param verbose:
             Should we output a logging message about every missing time point?
@@ -423,40 +1363,28 @@ class LightcurveArbitraryRaster:
             The maximum number of errors we should show
         :type max_errors:
             int
+        :param spacing:
+            The expected time step (days). If None, it is estimated from this lightcurve. This is set when a long
+            lightcurve is checked in chunks, so that every chunk is checked against the same time step.
+        :type spacing:
+            float
         :return:
             int
         """
 
-        abs_tol = 1e-4
-        rel_tol = 0
-
-        spacing = self.estimate_sampling_interval()
+        if spacing is None:
+            spacing = self.estimate_sampling_interval()
 
         if verbose:
             logging.info("Time step is {:.15f}".format(spacing))
 
-        start_time = self.times[0]
-        end_time = self.times[-1]
-        times = np.arange(start=start_time, stop=end_time, step=spacing)
-        error_count = 0
-
-        input_position = 0
-        for index, time in enumerate(times):
-            closest_time_point = self.times[input_position]
-            while ((not math.isclose(time, self.times[input_position], abs_tol=abs_tol, rel_tol=rel_tol)) and
-                   (time > self.times[input_position])):
-                if abs(self.times[input_position] - time) < abs(closest_time_point - time):
-                    closest_time_point = self.times[input_position]
-                input_position += 1
-
-            # If this time point has the correct spacing, it is OK
-            if not math.isclose(time, self.times[input_position], abs_tol=abs_tol, rel_tol=rel_tol):
-                if abs(self.times[input_position] - time) < abs(closest_time_point - time):
-                    closest_time_point = self.times[input_position]
-                if verbose and (max_errors is None or error_count <= max_errors):
-                    logging.info("index {:5d} - Point missing at time {:.15f}. Closest time was {:.15f}.".
-                                 format(index, self.times[index], closest_time_point))
-                error_count += 1
+        gaps = self.analyse_gaps(spacing=spacing)
+        error_count = int(np.sum(gaps['missing_count']))
+
+        # Report the individual missing time points
+        if verbose and error_count > 0:
+            raster, positions, gap_mask = self.fixed_step_raster_match(spacing=spacing)
+            self._log_raster_gaps(raster=raster, gap_mask=gap_mask, abs_tol=1e-4, max_errors=max_errors)
 
         # Return total error count
         if verbose and error_count > 0:
@@ -465,10 +1393,14 @@ class LightcurveArbitraryRaster:
         # Return the verdict on this lightcurve
         return error_count
 
-    def to_fixed_step(self, verbose=True, max_errors=6):
+    def to_fixed_step(self, verbose=True, max_errors=6, fill_strategy="constant", fill_value=1):
         """
         Convert this lightcurve to a fixed time stride.
 
+        Each time point in the output is matched to the first input sample which lies no more than a small tolerance
+        before it. If that sample is within the tolerance of the output time, its flux is used; otherwise the output
+        time point is a gap, which is filled according to <fill_strategy>.
+
         :param verbose:
             Should we output a logging message about every missing time point?
         :type verbose:
@@ -477,12 +1409,22 @@ class LightcurveArbitraryRaster:
             The maximum number of errors we should show
         :type max_errors:
             int
+        :param fill_strategy:
+            How to fill gaps in the lightcurve. Either <constant>, to use <fill_value>, or <interpolate>, to linearly
+            interpolate between the input samples either side of each gap.
+        :type fill_strategy:
+            str
+        :param fill_value:
+            The flux to use in gaps, if <fill_strategy> is <constant>.
+        :type fill_value:
+            float
         :return:
             [LightcurveFixedStep]
         """
 
+        assert fill_strategy in ('constant', 'interpolate'), "Unknown fill strategy <{}>".format(fill_strategy)
+
         abs_tol = 1e-4
-        rel_tol = 0
 
         spacing = self.estimate_sampling_interval()
 
@@ -490,54 +1432,46 @@ class LightcurveArbitraryRaster:
             logging.info("Time step is {:.15f}".format(spacing))
 
         start_time = self.times[0]
-        end_time = self.times[-1]
-        times = np.arange(start=start_time, stop=end_time, step=spacing)
-        output = np.zeros_like(times)
-        error_count = 0
-
-        # Iterate over each time point in the fixed-step output lightcurve
-        input_position = 0
-        for index, time in enumerate(times):
-            # Find the time point in the input lightcurve which is closest to this time
-            closest_time_point = [self.times[input_position], self.fluxes[input_position]]
-            while ((not math.isclose(time, self.times[input_position], abs_tol=abs_tol, rel_tol=rel_tol))
-                   and (time > self.times[input_position])):
-                if abs(self.times[input_position] - time) < abs(closest_time_point[0] - time):
-                    closest_time_point = [self.times[input_position], self.fluxes[input_position]]
-                input_position += 1
-
-            if abs(self.times[input_position] - time) < abs(closest_time_point[0] - time):
-                closest_time_point = [self.times[input_position], self.fluxes[input_position]]
-
-            # If this time point has the correct spacing, it is OK
-            if math.isclose(time, self.times[input_position], abs_tol=abs_tol, rel_tol=rel_tol):
-                output[index] = closest_time_point[1]
-                continue
-
-            if verbose and (max_errors is None or error_count <= max_errors):
-                logging.info("index {:5d} - Point missing at time {:.15f}. Closest time was {:.15f}.".
-                             format(index, self.times[index], closest_time_point[0]))
-            error_count += 1
-            output[index] = 1
+
+        # For each output time point, find the first input sample which is not more than <abs_tol> before it
+        times, positions, gap_mask = self.fixed_step_raster_match(spacing=spacing, abs_tol=abs_tol)
+
+        # Fill in output time points which have no matching input sample
+        output = self.fluxes[positions]
+        if fill_strategy == 'constant':
+            output[gap_mask] = fill_value
+        else:
+            output[gap_mask] = np.interp(x=times[gap_mask], xp=self.times, fp=self.fluxes)
+
+        error_count = int(np.count_nonzero(gap_mask))
+
+        if verbose:
+            self._log_raster_gaps(raster=times, gap_mask=gap_mask, abs_tol=abs_tol, max_errors=max_errors)
 
         # Return total error count
         if verbose and error_count > 0:
             logging.info("Lightcurve had gaps at {}/{} time points.".format(error_count, len(times)))
 
-        # Return lightcurve
-        return LightcurveFixedStep(
+        # Return lightcurve. Its fluxes were allocated for it alone, so it may modify them without copying them
+        lc_fixed_step = LightcurveFixedStep(
             time_start=start_time,
             time_step=spacing,
-            fluxes=output
+            fluxes=output,
+            gap_mask=gap_mask.copy(),
+            dtype_policy=self.dtype_policy
         )
+        lc_fixed_step._adopt_arrays(fluxes=self.dtype_policy.cast_fluxes(output))
+        return lc_fixed_step
 
 
 class LightcurveFixedStep:
     """
-    A class representing a lightcurve which is sampled on a fixed time step.
+    A class representing a lightcurve which is sampled on a fixed time step. As with <LightcurveArbitraryRaster>, its
+    arrays are read-only, and code which needs to modify them should request them with <writable>.
     """
 
-    def __init__(self, time_start, time_step, fluxes, uncertainties=None, flags=None, metadata=None):
+    def __init__(self, time_start, time_step, fluxes, uncertainties=None, flags=None, metadata=None, gap_mask=None,
+                 dtype_policy=None):
         """
         Create a lightcurve which is sampled on an arbitrary raster of times.
 
@@ -554,7 +1488,8 @@ class LightcurveFixedStep:
         :type fluxes:
             np.ndarray
         :param uncertainties:
-            The uncertainty in each data point.
+            The uncertainty in each data point. If not specified, the uncertainties are zero, and an array of zeros is
+            only created if they are accessed.
         :type uncertainties:
             np.ndarray
         :param flags:
@@ -565,16 +1500,29 @@ class LightcurveFixedStep:
             The metadata associated with this lightcurve.
         :type metadata:
             dict
+        :param gap_mask:
+            Boolean array, which is True for each data point which was missing from the original lightcurve, and has
+            been filled in.
+        :type gap_mask:
+            np.ndarray
+        :param dtype_policy:
+            The numeric types used to store the fluxes, uncertainties and flags (see <lc_dtype_policy>). If None,
+            everything is stored at double precision.
+        :type dtype_policy:
+            DtypePolicy
         """
 
         # Check inputs
         assert isinstance(fluxes, np.ndarray)
 
+        if dtype_policy is None:
+            dtype_policy = default_dtype_policy
+
         # Unset all flags if none were specified
         if flags is not None:
             assert isinstance(flags, np.ndarray)
         else:
-            flags = np.zeros_like(fluxes)
+            flags = np.zeros(len(fluxes), dtype=dtype_policy.flag_dtype)
 
         # Make an empty metadata dictionary if none was specified
         if metadata is not None:
@@ -582,21 +1530,190 @@ class LightcurveFixedStep:
         else:
             metadata = {}
 
-        # Make uncertainty zero if not specified
+        # Uncertainties are zero if not specified
         if uncertainties is not None:
             assert isinstance(uncertainties, np.ndarray)
-        else:
-            uncertainties = np.zeros_like(fluxes)
+            uncertainties = dtype_policy.cast_fluxes(uncertainties)
 
         # Store the data
+        self.dtype_policy = dtype_policy
         self.time_start = float(time_start)
         self.time_step = float(time_step)
-        self.fluxes = fluxes
+        self.fluxes = dtype_policy.cast_fluxes(fluxes)
         self.uncertainties = uncertainties
-        self.flags = flags
+        self.flags = dtype_policy.cast_flags(flags)
         self.flags_set = True
         self.metadata = metadata
 
+        # Record which data points were missing, if this lightcurve was resampled from an arbitrary raster
+        if gap_mask is not None:
+            assert isinstance(gap_mask, np.ndarray)
+        else:
+            gap_mask = np.zeros(len(fluxes), dtype=bool)
+        self.gap_mask = _read_only(gap_mask)
+
+    @property
+    def uncertainties(self):
+        """
+        The uncertainty in each data point. If this lightcurve has no uncertainties, an array of zeros is created the
+        first time they are accessed.
+
+        :return:
+            np.ndarray
+        """
+        if self._uncertainties is None:
+            self._uncertainties = _read_only(np.zeros(len(self.fluxes), dtype=self.dtype_policy.flux_dtype))
+        return self._uncertainties
+
+    @uncertainties.setter
+    def uncertainties(self, uncertainties):
+        self._uncertainties = _read_only(uncertainties)
+
+    @property
+    def fluxes(self):
+        """
+        The light fluxes at each data point. This array is read-only, unless it has been replaced with a private copy
+        by <writable>.
+
+        :return:
+            np.ndarray
+        """
+        return self._fluxes
+
+    @fluxes.setter
+    def fluxes(self, fluxes):
+        self._fluxes = _read_only(fluxes)
+
+    @property
+    def flags(self):
+        """
+        The flag associated with each data point. This array is read-only, unless it has been replaced with a private
+        copy by <writable>.
+
+        :return:
+            np.ndarray
+        """
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = _read_only(flags)
+
+    def writable(self, column):
+        """
+        Return a writable version of one of this lightcurve's arrays, copying it the first time it is requested. See
+        <LightcurveArbitraryRaster.writable>.
+
+        :param column:
+            The array to return: 'fluxes', 'uncertainties' or 'flags'.
+        :type column:
+            str
+        :return:
+            np.ndarray
+        """
+        assert column in ('fluxes', 'uncertainties', 'flags'), "Unknown lightcurve column <{}>".format(column)
+        values = getattr(self, column)
+        if not values.flags.writeable:
+            values = values.copy()
+            setattr(self, '_' + column, values)
+        return values
+
+    def _adopt_arrays(self, **columns):
+        """
+        Store arrays which were allocated for this lightcurve alone, without making them read-only, so that this
+        lightcurve may update them in place.
+
+        :param columns:
+            The arrays to store, keyed by column name: 'fluxes', 'uncertainties' or 'flags'.
+        :return:
+            None
+        """
+        for column, values in columns.items():
+            setattr(self, '_' + column, values)
+
+    def _share_arrays(self):
+        """
+        Make this lightcurve's arrays read-only before they are shared with another lightcurve.
+
+        :return:
+            None
+        """
+        for values in (self._fluxes, self._uncertainties, self._flags):
+            if values is not None and values.flags.writeable:
+                values.flags.writeable = False
+
+    def copy_on_write(self):
+        """
+        Return a copy of this lightcurve which shares all of its arrays, so that nothing is copied until the copy
+        requests a writable array with <writable>. The copy has its own metadata dictionary.
+
+        :return:
+            LightcurveFixedStep
+        """
+        self._share_arrays()
+        return LightcurveFixedStep(time_start=self.time_start,
+                                   time_step=self.time_step,
+                                   fluxes=self.fluxes,
+                                   uncertainties=self._uncertainties,
+                                   flags=self.flags,
+                                   metadata={**self.metadata},
+                                   gap_mask=self.gap_mask,
+                                   dtype_policy=self.dtype_policy
+                                   )
+
+    def _first_index_at(self, time):
+        """
+        Return the index of the first data point in this lightcurve at or after a given time, clipped to the range of
+        the lightcurve.
+
+        :param time:
+            The time (days).
+        :type time:
+            float
+        :return:
+            int
+        """
+        index = min(max(int(np.ceil((time - self.time_start) / self.time_step)), 0), len(self.fluxes))
+
+        # Correct for rounding errors in the division, so that the result is consistent with <time_value>
+        while index > 0 and self.time_value(index - 1) >= time:
+            index -= 1
+        while index < len(self.fluxes) and self.time_value(index) < time:
+            index += 1
+        return index
+
+    def window(self, t_start=None, t_end=None):
+        """
+        Return the part of this lightcurve within a time window, t_start <= t < t_end. The returned lightcurve's arrays
+        are views of this lightcurve's arrays, and it shares this lightcurve's metadata, so nothing is copied.
+
+        :param t_start:
+            The start of the time window (days), or None to start at the beginning of the lightcurve.
+        :type t_start:
+            float
+        :param t_end:
+            The end of the time window (days), or None to continue to the end of the lightcurve.
+        :type t_end:
+            float
+        :return:
+            LightcurveFixedStep
+        """
+        start = 0 if t_start is None else self._first_index_at(time=t_start)
+        end = len(self.fluxes) if t_end is None else self._first_index_at(time=t_end)
+        end = max(start, end)
+
+        self._share_arrays()
+        uncertainties = self._uncertainties[start:end] if self._uncertainties is not None else None
+        return LightcurveFixedStep(time_start=self.time_value(start),
+                                   time_step=self.time_step,
+                                   fluxes=self.fluxes[start:end],
+                                   uncertainties=uncertainties,
+                                   flags=self.flags[start:end],
+                                   metadata=self.metadata,
+                                   gap_mask=self.gap_mask[start:end],
+                                   dtype_policy=self.dtype_policy
+                                   )
+
     def time_value(self, index):
         """
         Return the time value associated with a particular index in this lightcurve.
@@ -4,6 +4,19 @@ import numpy as np
 
 from .lightcurve import LightcurveArbitraryRaster
 
+# Default number of input samples integrated in each block by <ResamplingPlan.apply_columns>. This bounds the size of
+# the temporary arrays used, whatever the length of the lightcurve.
+default_resampling_block_length = 65536
+
+# Relative tolerance, as a fraction of the input time step, within which both rasters must lie on fixed time steps, and
+# the output time step must be a whole number of input time steps, for data to be resampled by summing blocks of
+# samples rather than by interpolation
+integer_ratio_tolerance = 1e-6
+
+# Number of values summed directly in each block by <_compensated_cumsum>, before the block totals are accumulated
+# with compensated summation
+compensated_sum_block_length = 1024
+
 
 class LightcurveResampler(object):
     """
@@ -108,33 +121,10 @@ class LightcurveResampler(object):
         assert x_new.ndim == 1, \
             "New x array should have exactly one dimension. Passed array has {} dimensions".format(x_new.ndim)
 
-        # Make an array of the start time of each pixel in the input raster. The final entry is the end time of the
-        # last pixel, so if we have N input pixels, we output N+1 left edges (length N+1)
-        x_in_pixel_start_times = LightcurveResampler._pixel_start_times(x_in)
-
-        # Compute the time span of each pixel in the input raster (length N)
-        x_in_pixel_width = LightcurveResampler._pixel_widths(x_in_pixel_start_times)
-
-        # Do the same for the output raster
-        x_new_pixel_start_times = LightcurveResampler._pixel_start_times(x_new)
-        x_new_pixel_width = LightcurveResampler._pixel_widths(x_new_pixel_start_times)
-
-        # Create an array of the integrated flux prior to time point i in <x_in_pixel_start_times> (length N+1)
-        x_in_integrated = np.cumsum(np.insert(y_in * x_in_pixel_width, 0, 0))
+        # Integrate the flux within each pixel of the output array, and divide by the pixel's width
+        return ResamplingPlan(input_raster=x_in, output_raster=x_new).apply(values=y_in)
 
-        # Create an array of the integrated flux within each pixel of the output array, divided by the pixel's width
-        y_new = (np.interp(xp=x_in_pixel_start_times,
-                           fp=x_in_integrated,
-                           x=x_new_pixel_start_times[1:]) -
-                 np.interp(xp=x_in_pixel_start_times,
-                           fp=x_in_integrated,
-                           x=x_new_pixel_start_times[:-1])
-                 ) / x_new_pixel_width
-
-        # Return output
-        return y_new
-
-    def onto_raster(self, output_raster, resample_flags=True):
+    def onto_raster(self, output_raster, resample_flags=True, plan=None, quadrature_uncertainties=False):
         """
         Resample this lightcurve onto a user-specified time raster.
 
@@ -145,28 +135,54 @@ class LightcurveResampler(object):
             Should we bother resampling the lightcurve's flags as the data itself? If not, the flags will be cleared,
             but the function will return 30% quicker.
 
+        :param plan:
+            Optionally, a <ResamplingPlan> from this lightcurve's raster onto <output_raster>, which may be shared with
+            other lightcurves on the same raster. If None, a plan is created for this call only, unless both rasters
+            have fixed time steps, with the output step a whole number of input steps. In that case the data is instead
+            resampled by summing blocks of samples (see <_block_rebin>), which gives the same result.
+
+        :param quadrature_uncertainties:
+            If True, and the data is resampled by summing blocks of samples, the uncertainties are combined in
+            quadrature, rather than averaged like the fluxes. Interpolation always averages the uncertainties.
+
         :return:
             New LightcurveArbitraryRaster object.
         """
 
-        new_values = self._resample(x_new=output_raster,
-                                    x_in=self._input.times,
-                                    y_in=self._input.fluxes)
-
-        new_uncertainties = self._resample(x_new=output_raster,
-                                           x_in=self._input.times,
-                                           y_in=self._input.uncertainties)
+        # Lightcurves without uncertainties remain without them
+        column_names = (['fluxes'] + (['uncertainties'] if self._input.has_uncertainties else []) +
+                        (['flags'] if resample_flags and self._input.flags_set else []))
+        columns = [getattr(self._input, name) for name in column_names]
+
+        layout = _integer_ratio_layout(input_raster=self._input.times, output_raster=output_raster) \
+            if plan is None else None
+        if layout is not None:
+            # Sum blocks of input samples, rather than interpolating
+            assert len(self._input.times) > 3, \
+                "Input lightcurve must have at least three pixels for re-sampling to produce sensible output"
+            ratio, first_centre = layout
+            resampled = {name: _block_rebin(values=column, ratio=ratio, first_centre=first_centre,
+                                            output_length=len(output_raster),
+                                            quadrature=quadrature_uncertainties and name == 'uncertainties')
+                         for name, column in zip(column_names, columns)}
+        else:
+            # Plan the resampling once, and resample all the columns together, in a single pass
+            if plan is None:
+                plan = ResamplingPlan(input_raster=self._input.times, output_raster=output_raster)
+            else:
+                assert plan.matches(input_raster=self._input.times, output_raster=output_raster), \
+                    "Resampling plan does not match rasters"
+            resampled = dict(zip(column_names, plan.apply_columns(columns=columns)))
 
         output = LightcurveArbitraryRaster(times=output_raster,
-                                           fluxes=new_values,
-                                           uncertainties=new_uncertainties,
-                                           metadata=self._input.metadata.copy()
+                                           fluxes=resampled['fluxes'],
+                                           uncertainties=resampled.get('uncertainties', None),
+                                           metadata=self._input.metadata.copy(),
+                                           dtype_policy=self._input.dtype_policy
                                            )
 
-        if resample_flags and self._input.flags_set:
-            output.mask = self._resample(x_new=output_raster,
-                                         x_in=self._input.times,
-                                         y_in=self._input.flags) > 0.5
+        if 'flags' in resampled:
+            output.mask = resampled['flags'] > 0.5
             output.mask_set = not np.all(output.mask)
 
         return output
@@ -189,3 +205,805 @@ class LightcurveResampler(object):
 
         return self.onto_raster(output_raster=other.times,
                                 resample_flags=resample_flags)
+
+
+class ResamplingPlan:
+    """
+    A precomputed plan for resampling data from one raster of times onto another, in the same way as
+    <LightcurveResampler>. The pixel edges of both rasters, and the position of each output pixel edge among the input
+    pixel edges, are found once, when the plan is created. Applying the plan to a column of data then costs only a
+    cumulative sum and a weighted sum, so one plan can be reused for every column of a lightcurve, and for every
+    lightcurve sampled on the same raster, by passing it to <LightcurveResampler.onto_raster>.
+    """
+
+    def __init__(self, input_raster, output_raster):
+        """
+        Plan the resampling of data from one raster of times onto another.
+
+        :param input_raster:
+            The raster of times the data is sampled on.
+        :type input_raster:
+            np.ndarray
+        :param output_raster:
+            The raster of times to resample the data onto.
+        :type output_raster:
+            np.ndarray
+        """
+        input_raster = np.asarray(input_raster)
+        output_raster = np.asarray(output_raster)
+
+        # Make sure that input data is sensible
+        assert input_raster.ndim == 1, \
+            "Input raster should have exactly one dimension. Passed array has {} dimensions".format(input_raster.ndim)
+        assert input_raster.shape[0] > 3, \
+            "Input lightcurve must have at least three pixels for re-sampling to produce sensible output"
+        assert output_raster.ndim == 1, \
+            "New raster should have exactly one dimension. Passed array has {} dimensions".format(output_raster.ndim)
+
+        self.input_raster = input_raster
+        self.output_raster = output_raster
+
+        # The start time of each pixel in the input raster. The final entry is the end time of the last pixel, so if
+        # we have N input pixels, we have N+1 edges. Also compute the time span of each pixel (length N).
+        self.input_edges = LightcurveResampler._pixel_start_times(input_raster)
+        self.input_widths = LightcurveResampler._pixel_widths(self.input_edges)
+
+        # Do the same for the output raster
+        self.output_edges = LightcurveResampler._pixel_start_times(output_raster)
+        self.output_widths = LightcurveResampler._pixel_widths(self.output_edges)
+
+        # Find the input pixel edge at or before each output pixel edge. The integrated flux at each output edge is
+        # interpolated between that input edge and the next one, with the same arithmetic as np.interp, so that the
+        # results are identical, bit for bit, to interpolating each column separately
+        edge_count = len(self.input_edges)
+        below = np.searchsorted(self.input_edges, self.output_edges, side='right') - 1
+        self._lower = np.clip(below, 0, edge_count - 2)
+        self._upper = self._lower + 1
+        self._spans = self.input_edges[self._upper] - self.input_edges[self._lower]
+        self._offsets = self.output_edges - self.input_edges[self._lower]
+        self._sorted = bool(np.all(self._lower[1:] >= self._lower[:-1]))
+
+        # Output edges which lie outside the input raster, or exactly on an input edge, take the integrated flux at
+        # the nearest input edge, as they do in np.interp
+        nearest = np.clip(below, 0, edge_count - 1)
+        on_input_edge = (below < 0) | (below >= edge_count - 1) | (self.input_edges[nearest] == self.output_edges)
+        self._on_edge_positions = np.flatnonzero(on_input_edge)
+        self._on_edge_nearest = nearest[on_input_edge]
+
+    def matches(self, input_raster, output_raster):
+        """
+        Test whether this plan resamples data from one raster of times onto another. Rasters which are the same arrays
+        the plan was created for are accepted at once; others are compared element by element.
+
+        :param input_raster:
+            The raster of times the data is sampled on.
+        :type input_raster:
+            np.ndarray
+        :param output_raster:
+            The raster of times to resample the data onto.
+        :type output_raster:
+            np.ndarray
+        :return:
+            bool
+        """
+        return all(raster is planned or np.array_equal(raster, planned)
+                   for raster, planned in ((input_raster, self.input_raster), (output_raster, self.output_raster)))
+
+    def apply(self, values):
+        """
+        Resample data from the input raster onto the output raster, conserving its integral over time.
+
+        :param values:
+            The data on the input raster. This may be a 2-D array, in which case each row is resampled separately.
+        :type values:
+            np.ndarray
+        :return:
+            np.ndarray
+        """
+        values = np.asarray(values)
+        if values.ndim == 1:
+            return self.apply_columns(columns=[values])[0]
+        return self.apply_columns(columns=values)
+
+    def apply_columns(self, columns, block_length=default_resampling_block_length):
+        """
+        Resample several columns of data from the input raster onto the output raster in a single pass. The input
+        raster is processed in blocks: within each block, the columns are stacked into a 2-D array, integrated along
+        the time axis together, and every output pixel edge which falls within the block is evaluated for all the
+        columns at once. Apart from the output, memory use is bounded by the block length.
+
+        :param columns:
+            The columns of data on the input raster: either a list of 1-D arrays, or a 2-D array with one column per
+            row.
+        :type columns:
+            list
+        :param block_length:
+            The number of input samples integrated in each block.
+        :type block_length:
+            int
+        :return:
+            2-D array, with one row per column of data
+        """
+        column_count = len(columns)
+        input_length = len(self.input_raster)
+        for column in columns:
+            assert len(column) == input_length, "Input data should have one value per point of the input raster"
+
+        # Output pixel edges are found by binary search within each block, so if the output raster is not sorted, use
+        # a single block
+        if not self._sorted:
+            block_length = input_length
+        block_length = max(int(block_length), 1)
+
+        at_edges = np.empty((column_count, len(self.output_edges)))
+        carry = np.zeros(column_count)
+        for start in range(0, input_length, block_length):
+            end = min(start + block_length, input_length)
+
+            # Integrated flux prior to input pixel edges <start> to <end> (inclusive) of each column. Each block is
+            # seeded with the integral so far, so that the additions happen in the same order as a single cumulative
+            # sum over the whole lightcurve.
+            integrated = np.empty((column_count, end - start + 1))
+            integrated[:, 0] = carry
+            for index, column in enumerate(columns):
+                np.multiply(column[start:end], self.input_widths[start:end], out=integrated[index, 1:])
+            np.cumsum(integrated, axis=1, out=integrated)
+            carry = integrated[:, -1]
+
+            # Output pixel edges which are interpolated between input edges within this block
+            if start == 0 and end == input_length:
+                first, last = 0, len(self._lower)
+            else:
+                first, last = np.searchsorted(self._lower, [start, end], side='left')
+            lower = self._lower[first:last] - start
+            at_lower = integrated[:, lower]
+            at_edges[:, first:last] = (integrated[:, lower + 1] - at_lower) / self._spans[first:last] * \
+                self._offsets[first:last] + at_lower
+
+            # Output edges which lie outside the input raster, or exactly on an input edge
+            first, last = np.searchsorted(self._on_edge_positions, [first, last], side='left')
+            at_edges[:, self._on_edge_positions[first:last]] = integrated[:, self._on_edge_nearest[first:last] - start]
+
+        # Mean flux within each output pixel
+        output = np.subtract(at_edges[:, 1:], at_edges[:, :-1])
+        output /= self.output_widths
+        return output
+
+
+def _fixed_step_raster(start, step, indices):
+    """
+    Return the times of pixels within the raster <np.arange(start, stop, step)>, computed in exactly the same way as
+    numpy does, so that a raster can be generated piece by piece without knowing its end time.
+
+    :param start:
+        The time of the first pixel.
+    :type start:
+        float
+    :param step:
+        The time step between pixels.
+    :type step:
+        float
+    :param indices:
+        The indices of the pixels whose times should be returned.
+    :type indices:
+        np.ndarray
+    :return:
+        np.ndarray
+    """
+    # numpy fills the raster with start + i * delta, where delta is the difference between its first two entries
+    delta = (start + step) - start
+    raster = start + indices * delta
+    raster[indices == 0] = start
+    raster[indices == 1] = start + step
+    return raster
+
+
+def _fixed_step_pixel_edges(start, step, first, last, length=None):
+    """
+    Return the edges of pixels <first> to <last> (inclusive) of the raster <np.arange(start, stop, step)>, computed in
+    exactly the same way as <LightcurveResampler._pixel_start_times>.
+
+    :param start:
+        The time of the first pixel.
+    :type start:
+        float
+    :param step:
+        The time step between pixels.
+    :type step:
+        float
+    :param first:
+        The index of the first edge to return.
+    :type first:
+        int
+    :param last:
+        The index of the last edge to return.
+    :type last:
+        int
+    :param length:
+        The total number of pixels in the raster, if known. This must be set if the final edge is requested.
+    :type length:
+        int
+    :return:
+        np.ndarray
+    """
+    indices = np.arange(first, last + 1)
+    raster = _fixed_step_raster(start=start, step=step, indices=np.arange(max(first - 1, 0), last + 1))
+
+    # Interior edges lie midway between pixel centres
+    edges = np.empty(len(indices))
+    if first == 0:
+        edges[1:] = (raster[1:] + raster[:-1]) / 2
+        edges[0] = raster[0] * 1.5 - raster[1] * 0.5
+    else:
+        edges[:] = (raster[1:] + raster[:-1]) / 2
+
+    # The final edge is extrapolated from the last two pixels
+    if length is not None and last == length:
+        final_pixels = _fixed_step_raster(start=start, step=step, indices=np.array([length - 2, length - 1]))
+        edges[-1] = final_pixels[1] * 1.5 - final_pixels[0] * 0.5
+    return edges
+
+
+def _on_fixed_step(times, start, step, tolerance, first_index=0):
+    """
+    Test whether a sequence of times lies on the raster <start + i * step>.
+
+    :param times:
+        The times to test.
+    :type times:
+        np.ndarray
+    :param start:
+        The time of the first point of the raster.
+    :type start:
+        float
+    :param step:
+        The time step of the raster.
+    :type step:
+        float
+    :param tolerance:
+        The maximum permitted difference between each time and the raster.
+    :type tolerance:
+        float
+    :param first_index:
+        The index within the raster of the first time.
+    :type first_index:
+        int
+    :return:
+        bool
+    """
+    # Compute the differences in place, to avoid temporary arrays
+    differences = np.arange(first_index, first_index + len(times), dtype=np.float64)
+    differences *= step
+    differences += start
+    differences -= times
+    return len(times) == 0 or bool(np.max(np.abs(differences, out=differences)) <= tolerance)
+
+
+def _integer_ratio_layout(input_raster, output_raster):
+    """
+    Test whether data can be resampled from one raster of times onto another by <_block_rebin>. Both rasters must have
+    fixed time steps, the output time step must be a whole number of input time steps, and each output pixel must be
+    centred on an input sample.
+
+    :param input_raster:
+        The raster of times the data is sampled on.
+    :type input_raster:
+        np.ndarray
+    :param output_raster:
+        The raster of times to resample the data onto.
+    :type output_raster:
+        np.ndarray
+    :return:
+        Tuple of (number of input time steps per output time step, index of the input sample at the centre of the
+        first output pixel), or None if the rasters are not suitable.
+    """
+    input_raster = np.asarray(input_raster)
+    output_raster = np.asarray(output_raster)
+    if input_raster.ndim != 1 or output_raster.ndim != 1 or len(input_raster) < 2 or len(output_raster) < 2:
+        return None
+
+    # Compare the mean time steps of the two rasters first, which is cheap, before checking every point
+    input_step = (input_raster[-1] - input_raster[0]) / (len(input_raster) - 1)
+    output_step = (output_raster[-1] - output_raster[0]) / (len(output_raster) - 1)
+    if not (input_step > 0 and output_step > 0):
+        return None
+    ratio = int(np.rint(output_step / input_step))
+    first_centre = int(np.rint((output_raster[0] - input_raster[0]) / input_step))
+    tolerance = integer_ratio_tolerance * input_step
+    if (ratio < 1 or abs(output_step - ratio * input_step) * (len(output_raster) - 1) > tolerance or
+            abs(output_raster[0] - (input_raster[0] + first_centre * input_step)) > tolerance):
+        return None
+
+    if not (_on_fixed_step(times=input_raster, start=input_raster[0], step=input_step, tolerance=tolerance) and
+            _on_fixed_step(times=output_raster, start=input_raster[0] + first_centre * input_step,
+                           step=input_step * ratio, tolerance=tolerance)):
+        return None
+    return ratio, first_centre
+
+
+def _block_rebin(values, ratio, first_centre, output_length, quadrature=False):
+    """
+    Resample data on a fixed-step raster onto a raster whose time step is a whole number of input time steps, and whose
+    pixels are centred on input samples, by summing blocks of samples. The result is the same as interpolating the
+    integrated flux with <LightcurveResampler>, but much faster: each output pixel is the mean of the input pixels it
+    covers. If <ratio> is even, the edges of the output pixels fall at the centres of input samples, which are split
+    between the two output pixels. Beyond the ends of the input, the flux is zero.
+
+    :param values:
+        The data on the input raster.
+    :type values:
+        np.ndarray
+    :param ratio:
+        The number of input time steps per output time step.
+    :type ratio:
+        int
+    :param first_centre:
+        The index of the input sample at the centre of the first output pixel. This may lie outside the input.
+    :type first_centre:
+        int
+    :param output_length:
+        The number of output pixels.
+    :type output_length:
+        int
+    :param quadrature:
+        If True, the values are uncertainties, which are combined in quadrature, as the uncertainty of the mean of the
+        input pixels. Otherwise they are averaged, as they are by interpolation.
+    :type quadrature:
+        bool
+    :return:
+        np.ndarray
+    """
+    half = ratio // 2
+
+    # Copy the samples covered by the output pixels into a zero-padded array, so that output pixel <j> covers the
+    # samples <padded[j * ratio : (j + 1) * ratio + 1]>, of which the last is only used if <ratio> is even
+    first = first_centre - half
+    padded = np.zeros(output_length * ratio + 1)
+    source_start = min(max(first, 0), len(values))
+    source_end = min(max(first + len(padded), 0), len(values))
+    padded[source_start - first:source_end - first] = values[source_start:source_end]
+    if quadrature:
+        np.square(padded, out=padded)
+
+    sums = padded[:-1].reshape((output_length, ratio)).sum(axis=1)
+
+    # When <ratio> is even, the samples at either end of each output pixel contribute only half their weight, or a
+    # quarter of their variance
+    if ratio % 2 == 0:
+        edge_weight = 0.25 if quadrature else 0.5
+        sums -= (1 - edge_weight) * padded[0:-1:ratio]
+        sums += edge_weight * padded[ratio::ratio]
+
+    if quadrature:
+        # Rounding may leave the sum of squares very slightly negative when only the edge samples are non-zero
+        return np.sqrt(np.maximum(sums, 0, out=sums)) / ratio
+    return sums / ratio
+
+
+def _block_rebin_stream(chunks, step, column_names, quadrature_uncertainties=False):
+    """
+    Resample a lightcurve, supplied as a sequence of chunks in time order, onto a fixed-step raster by summing blocks of
+    samples with <_block_rebin>, for as long as the input lies on a fixed time step of which <step> is a whole
+    multiple. This is the first stage of <StreamingResampler.resample>.
+
+    :param chunks:
+        Iterator of <LightcurveArbitraryRaster> objects, which together make up the input lightcurve.
+    :param step:
+        The time step of the output raster (days).
+    :type step:
+        float
+    :param column_names:
+        The names of the columns to resample.
+    :type column_names:
+        list
+    :param quadrature_uncertainties:
+        If True, the uncertainties are combined in quadrature, rather than averaged like the fluxes.
+    :type quadrature_uncertainties:
+        bool
+    :return:
+        Generator of <LightcurveArbitraryRaster> objects. Its return value is None if the whole lightcurve was
+        resampled. Otherwise, it is a tuple of (metadata, dtype_policy, start time of the output raster, number of
+        output pixels produced, index of the first retained input sample, start time of the first retained input
+        pixel, times of the retained input samples, dictionary of the values of the retained input samples), from
+        which the lightcurve may be resampled by interpolation. The retained samples include everything which has
+        been read but not yet fully used.
+    """
+    metadata = None
+    dtype_policy = None
+    ratio = None
+    sample_step = None
+    start = None
+    output_count = 0
+
+    # Samples which later output pixels may need, starting from input sample number <first_index>
+    first_index = 0
+    times = np.zeros(0)
+    values = {name: np.zeros(0) for name in column_names}
+
+    def emit(count):
+        """
+        Yield the next <count> output pixels, and discard the input samples they no longer need.
+        """
+        nonlocal output_count, first_index, times
+        if count <= 0:
+            return
+
+        binned = {name: _block_rebin(values=values[name], ratio=ratio, first_centre=output_count * ratio - first_index,
+                                     output_length=count,
+                                     quadrature=quadrature_uncertainties and name == 'uncertainties')
+                  for name in column_names}
+
+        output = LightcurveArbitraryRaster(
+            times=_fixed_step_raster(start=start, step=step, indices=np.arange(output_count, output_count + count)),
+            fluxes=binned['fluxes'],
+            uncertainties=binned['uncertainties'],
+            metadata=metadata.copy(),
+            dtype_policy=dtype_policy
+        )
+        if 'flags' in binned:
+            output.mask = binned['flags'] > 0.5
+            output.mask_set = not np.all(output.mask)
+        yield output
+
+        output_count += count
+
+        # Keep the samples which the next output pixel may need, and all those after them. We keep one sample more
+        # than the block sums need, so that at least one sample is always retained for interpolation to start from.
+        keep_from = max(output_count * ratio - ratio // 2 - 1 - first_index, 0)
+        first_index += keep_from
+        times = times[keep_from:]
+        for name in column_names:
+            values[name] = values[name][keep_from:]
+
+    def handover(chunk_times, chunk_values):
+        first_edge = None if ratio is None else start + (first_index - 0.5) * sample_step
+        return (metadata, dtype_policy, start, output_count, first_index, first_edge,
+                np.concatenate([times, chunk_times]),
+                {name: np.concatenate([values[name], chunk_values[name]]) for name in column_names})
+
+    for chunk in chunks:
+        if metadata is None:
+            metadata = chunk.metadata
+            dtype_policy = chunk.dtype_policy
+        chunk_values = {name: getattr(chunk, name) for name in column_names}
+
+        # Choose the input time step from the first two samples
+        if ratio is None:
+            candidate_times = np.concatenate([times, chunk.times])
+            if len(candidate_times) < 2:
+                times = candidate_times
+                for name in column_names:
+                    values[name] = np.concatenate([values[name], chunk_values[name]])
+                continue
+            input_step = candidate_times[1] - candidate_times[0]
+            if not input_step > 0 or int(np.rint(step / input_step)) < 1:
+                return handover(chunk_times=chunk.times, chunk_values=chunk_values)
+            ratio = int(np.rint(step / input_step))
+            sample_step = step / ratio
+            start = float(candidate_times[0])
+
+        # Hand over to interpolation as soon as a sample does not lie on the input time step, e.g. after a gap
+        if not _on_fixed_step(times=chunk.times, start=start, step=sample_step,
+                              tolerance=integer_ratio_tolerance * sample_step,
+                              first_index=first_index + len(times)):
+            return handover(chunk_times=chunk.times, chunk_values=chunk_values)
+
+        times = np.concatenate([times, chunk.times])
+        for name in column_names:
+            values[name] = np.concatenate([values[name], chunk_values[name]])
+
+        # Output pixels are complete once we have the sample at their end edge, and they are certain to lie within the
+        # output raster
+        last_index = first_index + len(times) - 1
+        complete = min((last_index - ratio // 2) // ratio + 1, int(np.ceil((times[-1] - start) / step)))
+        yield from emit(count=complete - output_count)
+
+    if ratio is None:
+        return handover(chunk_times=np.zeros(0), chunk_values={name: np.zeros(0) for name in column_names})
+
+    last_index = first_index + len(times) - 1
+    assert last_index + 1 > 3, \
+        "Input lightcurve must have at least three pixels for re-sampling to produce sensible output"
+
+    # Now that we know the end time of the lightcurve, we know the length of the output raster
+    raster_length = int(np.ceil((times[-1] - start) / step))
+    assert raster_length > 1, "Output raster must have at least two pixels"
+    yield from emit(count=raster_length - output_count)
+    return None
+
+
+def _compensated_cumsum(values, initial=0., block_length=compensated_sum_block_length):
+    """
+    Compute the cumulative sum of an array, starting from an initial value, with less rounding error than
+    <np.cumsum>. The array is summed in short blocks, and the running total at the start of each block is accumulated
+    with Neumaier's compensated summation, so the error grows with the block length, rather than the length of the
+    array.
+
+    :param values:
+        The values to sum.
+    :type values:
+        np.ndarray
+    :param initial:
+        The value the cumulative sum starts from.
+    :type initial:
+        float
+    :param block_length:
+        The number of values in each block.
+    :type block_length:
+        int
+    :return:
+        np.ndarray, with one more entry than <values>, starting with <initial>
+    """
+    block_count = -(-len(values) // block_length)
+    padded = np.zeros(block_count * block_length + 1)
+    padded[1:len(values) + 1] = values
+    blocks = padded[1:].reshape((block_count, block_length))
+
+    # Running total at the start of each block, summed with a compensation term for the low-order bits lost
+    offsets = np.empty(block_count)
+    total = float(initial)
+    compensation = 0.
+    for index, block_total in enumerate(blocks.sum(axis=1).tolist()):
+        offsets[index] = total + compensation
+        new_total = total + block_total
+        if abs(total) >= abs(block_total):
+            compensation += (total - new_total) + block_total
+        else:
+            compensation += (block_total - new_total) + total
+        total = new_total
+
+    np.cumsum(blocks, axis=1, out=blocks)
+    blocks += offsets[:, np.newaxis]
+    padded[0] = initial
+    return padded[:len(values) + 1]
+
+
+class StreamingResampler:
+    """
+    A streaming variant of <LightcurveResampler>, which resamples a lightcurve supplied as a sequence of chunks in time
+    order onto a fixed-step raster spanning the time range of the lightcurve, as they are read. Only the state at the
+    boundary between chunks is carried from one chunk to the next: the samples whose input pixels are not yet complete,
+    and the input pixel edges and integrated flux which later output pixels need. Memory use and the cost of each chunk
+    therefore scale with the chunk size, rather than the length of the lightcurve.
+
+    While the input lies on a fixed time step, of which the output step is a whole multiple, output pixels are computed
+    by summing blocks of input samples (see <_block_rebin>). Otherwise, the integrated flux is interpolated, as by
+    <LightcurveResampler>. Each integral is measured from the first input pixel edge still held, and computed with
+    compensated sums (see <_compensated_cumsum>), so it never grows with the length of the lightcurve, and the output is
+    at least as precise as that of <LightcurveResampler.onto_raster>.
+    """
+
+    def __init__(self, step, resample_flags=True, quadrature_uncertainties=False):
+        """
+        Create a streaming resampler.
+
+        :param step:
+            The time step of the output raster (days).
+        :type step:
+            float
+        :param resample_flags:
+            Should we bother resampling the lightcurve's flags as the data itself? If not, the flags will be cleared.
+        :type resample_flags:
+            bool
+        :param quadrature_uncertainties:
+            If True, the uncertainties of output pixels computed by summing blocks of input samples are combined in
+            quadrature, rather than averaged like the fluxes. Interpolation always averages the uncertainties.
+        :type quadrature_uncertainties:
+            bool
+        """
+        self.step = step
+        self.resample_flags = resample_flags
+        self.quadrature_uncertainties = quadrature_uncertainties
+        self.column_names = ['fluxes', 'uncertainties'] + (['flags'] if resample_flags else [])
+
+        self._metadata = None
+        self._dtype_policy = None
+        self._start = None
+        self._output_count = 0
+        self._input_count = 0
+        self._penultimate_time = None
+
+        # Samples which have been read, but whose input pixels are not yet complete
+        self._pending_times = np.zeros(0)
+        self._pending_values = {name: np.zeros(0) for name in self.column_names}
+
+        # The window of input pixel edges, and the integrated flux from the first of them up to each edge, which later
+        # output pixels may need
+        self._edges_window = np.zeros(0)
+        self._integrated_window = {name: np.zeros(0) for name in self.column_names}
+
+    def resample(self, chunks):
+        """
+        Resample a lightcurve, supplied as a sequence of chunks in time order. The output is the same as:
+
+        resampler = LightcurveResampler(input_lc=lc)
+        resampler.onto_raster(output_raster=np.arange(np.min(lc.times), np.max(lc.times), step),
+                              quadrature_uncertainties=self.quadrature_uncertainties)
+
+        :param chunks:
+            Iterable of <LightcurveArbitraryRaster> objects, which together make up the input lightcurve.
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects, which together make up the output lightcurve.
+        """
+        chunks = iter(chunks)
+
+        # Sum blocks of input samples for as long as the input lies on a suitable fixed time step
+        handover = yield from _block_rebin_stream(chunks=chunks, step=self.step, column_names=self.column_names,
+                                                  quadrature_uncertainties=self.quadrature_uncertainties)
+        if handover is None:
+            return
+
+        # Resample the rest of the lightcurve by interpolation, starting from the samples the block stage still needed
+        (self._metadata, self._dtype_policy, self._start, self._output_count, first_index, first_edge,
+         retained_times, retained_values) = handover
+
+        # If the block stage has already produced some output pixels, resume from the start edge of the first input
+        # pixel it retained
+        if self._output_count > 0:
+            self._input_count = first_index
+            self._edges_window = np.array([first_edge])
+            self._integrated_window = {name: np.zeros(1) for name in self.column_names}
+
+        yield from self._consume(times=retained_times, values=retained_values)
+        for chunk in chunks:
+            yield from self._consume(times=chunk.times,
+                                     values={name: getattr(chunk, name) for name in self.column_names})
+        yield from self._finish()
+
+    def _emit(self, count, edges):
+        """
+        Yield the next <count> output pixels, whose edges are <edges>, and discard the input pixels they no longer need.
+
+        :param count:
+            The number of output pixels to yield.
+        :type count:
+            int
+        :param edges:
+            The edges of at least the next <count> output pixels.
+        :type edges:
+            np.ndarray
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects.
+        """
+        if count <= 0:
+            return
+
+        values = {}
+        for name in self.column_names:
+            values[name] = (np.interp(xp=self._edges_window, fp=self._integrated_window[name], x=edges[1:count + 1]) -
+                            np.interp(xp=self._edges_window, fp=self._integrated_window[name], x=edges[:count])
+                            ) / (edges[1:count + 1] - edges[:count])
+
+        output = LightcurveArbitraryRaster(
+            times=_fixed_step_raster(start=self._start, step=self.step,
+                                     indices=np.arange(self._output_count, self._output_count + count)),
+            fluxes=values['fluxes'],
+            uncertainties=values['uncertainties'],
+            metadata=self._metadata.copy(),
+            dtype_policy=self._dtype_policy
+        )
+        if self.resample_flags:
+            output.mask = values['flags'] > 0.5
+            output.mask_set = not np.all(output.mask)
+        yield output
+
+        self._output_count += count
+
+        # Keep the input pixel which contains the next output edge, and all those after it. Measure the integrals
+        # from the first edge we keep, so that they stay small.
+        keep_from = max(int(np.searchsorted(self._edges_window, edges[count], side='right')) - 1, 0)
+        self._edges_window = self._edges_window[keep_from:]
+        for name in self.column_names:
+            self._integrated_window[name] = self._integrated_window[name][keep_from:] - \
+                self._integrated_window[name][keep_from]
+
+    def _consume(self, times, values):
+        """
+        Integrate the flux in the input pixels completed by some new samples, and yield any output pixels which are
+        then complete.
+
+        :param times:
+            The times of the new samples.
+        :type times:
+            np.ndarray
+        :param values:
+            Dictionary of the values of each column at the new samples.
+        :type values:
+            dict
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects.
+        """
+        self._pending_times = np.concatenate([self._pending_times, times])
+        for name in self.column_names:
+            self._pending_values[name] = np.concatenate([self._pending_values[name], values[name]])
+        pending_times = self._pending_times
+
+        # We need two samples before we can compute the first edge of the input raster
+        if len(pending_times) < 2:
+            return
+
+        if len(self._edges_window) == 0:
+            self._start = float(pending_times[0])
+            new_edges = np.concatenate([[pending_times[0] * 1.5 - pending_times[1] * 0.5],
+                                        (pending_times[1:] + pending_times[:-1]) / 2])
+            for name in self.column_names:
+                self._integrated_window[name] = np.zeros(1)
+        else:
+            new_edges = (pending_times[1:] + pending_times[:-1]) / 2
+
+        # Integrate the flux in each input pixel which is now complete, continuing from the last integral we hold
+        all_edges = np.concatenate([self._edges_window[-1:], new_edges])
+        widths = all_edges[1:] - all_edges[:-1]
+        for name in self.column_names:
+            integrals = _compensated_cumsum(values=self._pending_values[name][:len(widths)] * widths,
+                                            initial=self._integrated_window[name][-1])
+            self._integrated_window[name] = np.concatenate([self._integrated_window[name], integrals[1:]])
+        self._edges_window = np.concatenate([self._edges_window, new_edges])
+
+        self._input_count += len(pending_times) - 1
+        self._penultimate_time = pending_times[-2]
+        self._pending_times = pending_times[-1:]
+        for name in self.column_names:
+            self._pending_values[name] = self._pending_values[name][-1:]
+
+        # Output pixels are complete once they are not the last pixel of the output raster, and their right edge lies
+        # before the last input edge we know
+        raster_length_minimum = int(np.ceil((self._pending_times[0] - self._start) / self.step))
+        if raster_length_minimum - 1 > self._output_count:
+            edges = _fixed_step_pixel_edges(start=self._start, step=self.step, first=self._output_count,
+                                            last=raster_length_minimum - 1)
+            count = int(np.searchsorted(edges[1:], self._edges_window[-1], side='left'))
+            yield from self._emit(count=count, edges=edges)
+
+    def _finish(self):
+        """
+        Complete the final input pixel, and yield all the remaining output pixels, once the whole of the input
+        lightcurve has been read.
+
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects.
+        """
+        assert self._input_count + len(self._pending_times) > 3, \
+            "Input lightcurve must have at least three pixels for re-sampling to produce sensible output"
+
+        # Complete the final input pixel, whose end edge is extrapolated from the last two samples
+        final_edge = self._pending_times[0] * 1.5 - self._penultimate_time * 0.5
+        for name in self.column_names:
+            final_integral = self._integrated_window[name][-1] + \
+                self._pending_values[name][0] * (final_edge - self._edges_window[-1])
+            self._integrated_window[name] = np.append(self._integrated_window[name], final_integral)
+        self._edges_window = np.append(self._edges_window, final_edge)
+
+        # Now that we know the end time of the lightcurve, we know the length of the output raster
+        raster_length = int(np.ceil((self._pending_times[0] - self._start) / self.step))
+        assert raster_length > 1, "Output raster must have at least two pixels"
+        edges = _fixed_step_pixel_edges(start=self._start, step=self.step, first=self._output_count,
+                                        last=raster_length, length=raster_length)
+        yield from self._emit(count=raster_length - self._output_count, edges=edges)
+
+
+def resample_stream(chunks, step, resample_flags=True, quadrature_uncertainties=False):
+    """
+    Resample a lightcurve, supplied as a sequence of chunks in time order, onto a fixed-step raster spanning the time
+    range of the lightcurve, with a <StreamingResampler>.
+
+    :param chunks:
+        Iterable of <LightcurveArbitraryRaster> objects, which together make up the input lightcurve.
+    :param step:
+        The time step of the output raster (days).
+    :type step:
+        float
+    :param resample_flags:
+        Should we bother resampling the lightcurve's flags as the data itself? If not, the flags will be cleared.
+    :type resample_flags:
+        bool
+    :param quadrature_uncertainties:
+        If True, the uncertainties of output pixels computed by summing blocks of input samples are combined in
+        quadrature, rather than averaged like the fluxes.
+    :type quadrature_uncertainties:
+        bool
+    :return:
+        Generator of <LightcurveArbitraryRaster> objects, which together make up the output lightcurve.
+    """
+    return StreamingResampler(step=step, resample_flags=resample_flags,
+                              quadrature_uncertainties=quadrature_uncertainties).resample(chunks=chunks)
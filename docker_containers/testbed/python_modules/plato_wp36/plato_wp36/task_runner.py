@@ -13,12 +13,17 @@ import numpy as np
 from eas_batman_wrapper.batman_wrapper import BatmanWrapper
 from eas_psls_wrapper.psls_wrapper import PslsWrapper
 
-from .lc_reader_lcsg import read_lcsg_lightcurve
+from .lc_archive import LightcurveArchive
+from .lc_dtype_policy import DtypePolicy
+from .lc_expression import parse_expression
+from .lc_reader_lcsg import iter_lcsg_lightcurve, read_lcsg_lightcurve
+from .lc_stream import default_chunk_length
 from .lightcurve import LightcurveArbitraryRaster
-from .lightcurve_resample import LightcurveResampler
+from .lightcurve_resample import resample_stream
 from .quality_control import quality_control
 from .results_logger import ResultsToRabbitMQ
 from .run_time_logger import RunTimesToRabbitMQ
+from .settings import settings
 from .task_timer import TaskTimer
 from .tda_wrappers import bls_reference, bls_kovacs, dst_v26, dst_v29, exotrans, qats, tls
 
@@ -28,7 +33,7 @@ class TaskRunner:
     Within a worker node, run a sequence of lightcurve processing tasks, as defined within a list of tasks.
     """
 
-    def __init__(self, results_target="rabbitmq"):
+    def __init__(self, results_target="rabbitmq", dtype_policy=None):
         """
         Instantiate a task runner.
 
@@ -36,11 +41,19 @@ class TaskRunner:
             Define where we send our results to
         :type results_target:
             str
+        :param dtype_policy:
+            The numeric types used to store lightcurves in memory, unless a task specifies otherwise: either the name
+            of a standard policy, 'default' or 'compact', or a dictionary of settings (see <lc_dtype_policy>).
+        :type dtype_policy:
+            str
         """
 
         # Destination for results from this task running. Either <rabbitmq> or <logging>
         self.results_target = results_target
 
+        # Numeric types used to store lightcurves in memory
+        self.dtype_policy = DtypePolicy.from_spec(dtype_policy)
+
         # List of all the lightcurves this task runner has written. Each a dictionary of <lc_filename> and
         # <lc_directory>
         self.lightcurves_written = []
@@ -60,16 +73,20 @@ class TaskRunner:
 
         :param source:
             A dictionary specifying the source of the lightcurve. It should contain the fields
-            <source>, <filename> and <directory>.
+            <source>, <filename> and <directory>. Lightcurves with source <shard> may also specify the field <shard>,
+            the name of the shard file within <directory>. The field <dtype_policy> may specify the numeric types
+            used to store the lightcurve in memory.
         :type source:
             dict
         """
 
         # Extract fields from input data structure
         lc_source = source.get('source', 'memory')
-        assert lc_source in ('memory', 'archive', 'lcsg')
+        assert lc_source in ('memory', 'archive', 'lcsg', 'shard')
         lc_filename = source.get('filename', 'lightcurve.dat')
         lc_directory = source.get('directory', 'test_lightcurves')
+        lc_shard = source.get('shard', 'lightcurves.shard')
+        lc_dtype_policy = DtypePolicy.from_spec(source.get('dtype_policy', self.dtype_policy))
 
         # Open connections to transit results and run times to output message queues
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
@@ -77,21 +94,29 @@ class TaskRunner:
         # Read input lightcurve
         if lc_source == 'memory':
             lc = self.lightcurves_in_memory[lc_directory][lc_filename]
+            if 'dtype_policy' in source:
+                lc = lc.with_dtype_policy(dtype_policy=lc_dtype_policy)
         else:
             if lc_source == 'lcsg':
                 lc_reader = read_lcsg_lightcurve
             elif lc_source == 'archive':
                 lc_reader = LightcurveArbitraryRaster.from_file
+            elif lc_source == 'shard':
+                lc_reader = LightcurveArchive(directory=lc_directory, shard=lc_shard).read
             else:
                 raise ValueError("Unknown lightcurve source <{}>".format(lc_source))
 
             # Load lightcurve
             with TaskTimer(job_name=self.job_name, target_name=lc_filename, task_name='load_lc',
                            parameters=self.job_parameters, time_logger=time_log):
-                lc = lc_reader(
-                    filename=lc_filename,
-                    directory=lc_directory
-                )
+                if lc_source == 'shard':
+                    lc = lc_reader(name=lc_filename, dtype_policy=lc_dtype_policy)
+                else:
+                    lc = lc_reader(
+                        filename=lc_filename,
+                        directory=lc_directory,
+                        dtype_policy=lc_dtype_policy
+                    )
 
         # Close connection to message queue
         time_log.close()
@@ -99,6 +124,55 @@ class TaskRunner:
         # Return lightcurve object
         return lc
 
+    def iter_lightcurve(self, source, chunk_length=None, chunk_duration=None):
+        """
+        Read an input lightcurve as a sequence of chunks, so that it never needs to be held in memory all at once.
+        Lightcurves which are already held in memory are returned as a single chunk.
+
+        :param source:
+            A dictionary specifying the source of the lightcurve. It should contain the fields
+            <source>, <filename> and <directory>. Lightcurves with source <shard> may also specify the field <shard>,
+            the name of the shard file within <directory>.
+        :type source:
+            dict
+        :param chunk_length:
+            The number of samples in each chunk.
+        :type chunk_length:
+            int
+        :param chunk_duration:
+            Alternatively, the time span of each chunk (days).
+        :type chunk_duration:
+            float
+        :return:
+            Generator of <LightcurveArbitraryRaster> objects
+        """
+
+        # Extract fields from input data structure
+        lc_source = source.get('source', 'memory')
+        assert lc_source in ('memory', 'archive', 'lcsg', 'shard')
+        lc_filename = source.get('filename', 'lightcurve.dat')
+        lc_directory = source.get('directory', 'test_lightcurves')
+        lc_shard = source.get('shard', 'lightcurves.shard')
+        lc_dtype_policy = DtypePolicy.from_spec(source.get('dtype_policy', self.dtype_policy))
+
+        if lc_source == 'memory':
+            yield self.lightcurves_in_memory[lc_directory][lc_filename]
+        elif lc_source == 'lcsg':
+            yield from iter_lcsg_lightcurve(filename=lc_filename, directory=lc_directory,
+                                            chunk_length=chunk_length, chunk_duration=chunk_duration,
+                                            dtype_policy=lc_dtype_policy)
+        elif lc_source == 'archive':
+            yield from LightcurveArbitraryRaster.iter_from_file(filename=lc_filename, directory=lc_directory,
+                                                                chunk_length=chunk_length,
+                                                                chunk_duration=chunk_duration,
+                                                                dtype_policy=lc_dtype_policy)
+        elif lc_source == 'shard':
+            yield from LightcurveArchive(directory=lc_directory, shard=lc_shard).iter_read(
+                name=lc_filename, chunk_length=chunk_length, chunk_duration=chunk_duration,
+                dtype_policy=lc_dtype_policy)
+        else:
+            raise ValueError("Unknown lightcurve source <{}>".format(lc_source))
+
     def write_lightcurve(self, lightcurve, target):
         """
         Write an output lightcurve.
@@ -109,16 +183,24 @@ class TaskRunner:
             LightcurveArbitraryRaster
         :param target:
             A dictionary specifying the destination for the lightcurve. It should contain the fields
-            <source>, <filename> and <directory>.
+            <source>, <filename> and <directory>. Lightcurves with source <shard> may also specify the field <shard>,
+            the name of the shard file within <directory>. Lightcurves written to <archive> or <shard> may also specify
+            the fields <binary>, <codec> and <codec_level> to select a compressed binary format. Lightcurves written to
+            <memory> are stored using the dtype policy given in the field <dtype_policy>, or otherwise the task
+            runner's default.
         :type target:
             dict
         """
 
         # Extract fields from input data structure
         lc_target = target.get('source', 'memory')
-        assert lc_target in ('memory', 'archive', 'lcsg')
+        assert lc_target in ('memory', 'archive', 'lcsg', 'shard')
         lc_filename = target.get('filename', 'lightcurve.dat')
         lc_directory = target.get('directory', 'test_lightcurves')
+        lc_shard = target.get('shard', 'lightcurves.shard')
+        lc_binary = target.get('binary', target.get('codec', None) is not None)
+        lc_codec = target.get('codec', None)
+        lc_codec_level = target.get('codec_level', None)
 
         # Open connections to transit results and run times to output message queues
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
@@ -127,16 +209,32 @@ class TaskRunner:
         if lc_target == "archive":
             with TaskTimer(job_name=self.job_name, target_name=lc_filename, task_name='write_lc',
                            parameters=self.job_parameters, time_logger=time_log):
-                lightcurve.to_file(directory=lc_directory, filename=lc_filename)
+                lightcurve.to_file(directory=lc_directory, filename=lc_filename, binary=lc_binary,
+                                   codec=lc_codec, codec_level=lc_codec_level)
                 self.lightcurves_written.append({
                     'source': 'archive',
                     'filename': lc_filename,
                     'directory': lc_directory
                 })
+        elif lc_target == "shard":
+            with TaskTimer(job_name=self.job_name, target_name=lc_filename, task_name='write_lc',
+                           parameters=self.job_parameters, time_logger=time_log):
+                LightcurveArchive(directory=lc_directory, shard=lc_shard).write(name=lc_filename,
+                                                                                lightcurve=lightcurve,
+                                                                                codec=lc_codec,
+                                                                                codec_level=lc_codec_level)
+                self.lightcurves_written.append({
+                    'source': 'shard',
+                    'filename': lc_filename,
+                    'directory': lc_directory,
+                    'shard': lc_shard
+                })
         else:
             if lc_directory not in self.lightcurves_in_memory:
                 self.lightcurves_in_memory[lc_directory] = {}
-            self.lightcurves_in_memory[lc_directory][lc_filename] = lightcurve
+            lc_dtype_policy = DtypePolicy.from_spec(target.get('dtype_policy', self.dtype_policy))
+            self.lightcurves_in_memory[lc_directory][lc_filename] = lightcurve.with_dtype_policy(
+                dtype_policy=lc_dtype_policy)
 
         # Close connection to message queue
         time_log.close()
@@ -154,19 +252,22 @@ class TaskRunner:
 
         # Extract fields from input data structure
         source = lc_source.get('source', 'memory')
-        assert source in ('memory', 'archive', 'lcsg')
+        assert source in ('memory', 'archive', 'lcsg', 'shard')
         filename = lc_source.get('filename', 'lightcurve.dat')
         directory = lc_source.get('directory', 'test_lightcurves')
+        shard = lc_source.get('shard', 'lightcurves.shard')
 
         # Delete lightcurve
-        if lc_source == 'memory':
-            del self.lightcurves_in_memory[lc_directory][lc_filename]
-        elif lc_source == 'archive':
+        if source == 'memory':
+            del self.lightcurves_in_memory[directory][filename]
+        elif source == 'archive':
             # Full path for this lightcurve
             file_path = os.path.join(settings['lcPath'], directory, filename)
 
             if os.path.exists(file_path):
                 os.unlink(file_path)
+        elif source == 'shard':
+            LightcurveArchive(directory=directory, shard=shard).delete(name=filename)
 
     def delete_all_products(self):
         """
@@ -310,27 +411,82 @@ class TaskRunner:
         :type output:
             dict
         """
+        logging.info("Multiplying lightcurves")
+
+        # Multiplication is a special case of an expression
+        self.lightcurve_expression(job_name=job_name, inputs={'a': input_1, 'b': input_2}, expression='a * b',
+                                   output=output, task_name='multiplication')
+
+    def lightcurve_expression(self, job_name, inputs, expression, output, task_name='lightcurve_expression'):
+        """
+        Perform the task of evaluating an arithmetic expression on lightcurves, such as "noise * transit + systematics".
+        Each input lightcurve is resampled onto the time raster of the left-most lightcurve in the expression only once,
+        and the expression is then evaluated in a single pass. The input lightcurves are never modified, except that if
+        the result replaces the left-most lightcurve in memory, its arrays are reused to hold the result.
+
+        :param job_name:
+            Specify the name of the job that these tasks is part of.
+        :type job_name:
+            str
+        :param inputs:
+            A dictionary of the lightcurves used in the expression, keyed by the names used to refer to them. Each
+            value is a dictionary specifying the source of a lightcurve, containing the fields <source>, <filename> and
+            <directory>.
+        :type inputs:
+            dict
+        :param expression:
+            The expression to evaluate. Only the operators +, - and *, parentheses and the names of the input
+            lightcurves are allowed.
+        :type expression:
+            str
+        :param output:
+            A dictionary specifying the destination for the lightcurve. It should contain the fields
+            <source>, <filename> and <directory>.
+        :type output:
+            dict
+        :param task_name:
+            The name under which the time taken to evaluate the expression is logged.
+        :type task_name:
+            str
+        """
         self.job_name = job_name
         out_id = os.path.join(
             output.get('directory', 'test_lightcurves'),
             output.get('filename', 'lightcurve.dat')
         )
 
-        logging.info("Multiplying lightcurves")
+        logging.info("Evaluating lightcurve expression <{}>".format(expression))
 
         # Open connections to transit results and run times to output message queues
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
 
-        # Load lightcurve 1
-        lc_1 = self.read_lightcurve(source=input_1)
-
-        # Load lightcurve 2
-        lc_2 = self.read_lightcurve(source=input_2)
-
-        # Multiply lightcurves together
-        with TaskTimer(job_name=job_name, target_name=out_id, task_name='multiplication',
+        # Load input lightcurves
+        lightcurves = {name: self.read_lightcurve(source=source) for name, source in inputs.items()}
+        lc_expression = parse_expression(expression=expression, lightcurves=lightcurves)
+
+        # The arrays of the left-most lightcurve can hold the result, rather than allocating new ones, if nothing else
+        # will see them change: either it was freshly read from a file by this task, or it is held in memory, and the
+        # result replaces it there. Its arrays must also not be shared with any other lightcurve.
+        target_name = next(name for name in lightcurves if lightcurves[name] is lc_expression.leaves()[0])
+        target = lightcurves[target_name]
+        target_source = inputs[target_name]
+        if target_source.get('source', 'memory') != 'memory':
+            replaceable = True
+        else:
+            target_key = (target_source.get('directory', 'test_lightcurves'),
+                          target_source.get('filename', 'lightcurve.dat'))
+            stored_under = [(directory, filename)
+                            for directory, stored in self.lightcurves_in_memory.items()
+                            for filename, lightcurve in stored.items() if lightcurve is target]
+            replaceable = (output.get('source', 'memory') == 'memory' and stored_under == [target_key] and
+                           (output.get('directory', 'test_lightcurves'),
+                            output.get('filename', 'lightcurve.dat')) == target_key)
+        reuse_target = replaceable and target._buffers_writable(length=len(target.times))
+
+        # Evaluate expression
+        with TaskTimer(job_name=job_name, target_name=out_id, task_name=task_name,
                        parameters=self.job_parameters, time_logger=time_log):
-            result = lc_1 * lc_2
+            result = lc_expression.evaluate(out=target if reuse_target else None)
 
         # Store result
         self.write_lightcurve(lightcurve=result, target=output)
@@ -338,9 +494,10 @@ class TaskRunner:
         # Close connection to message queue
         time_log.close()
 
-    def verify_lightcurve(self, job_name, source):
+    def verify_lightcurve(self, job_name, source, chunk_length=default_chunk_length):
         """
-        Perform the task of verifying a lightcurve.
+        Perform the task of verifying a lightcurve. The lightcurve is read in chunks, so that it never needs to be held
+        in memory all at once.
 
         :param job_name:
             Specify the name of the job that these tasks is part of.
@@ -351,6 +508,10 @@ class TaskRunner:
             <source>, <filename> and <directory>.
         :type source:
             dict
+        :param chunk_length:
+            The number of samples to read from the lightcurve at a time.
+        :type chunk_length:
+            int
         """
         self.job_name = job_name
         input_id = os.path.join(
@@ -367,18 +528,57 @@ class TaskRunner:
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
         result_log = ResultsToRabbitMQ(results_target=self.results_target)
 
-        # Read input lightcurve
-        lc = self.read_lightcurve(source=source)
-
-        # Verify lightcurve
+        # Verify lightcurve, reading it one chunk at a time
         with TaskTimer(job_name=job_name, target_name=input_id, task_name='verify',
                        parameters=self.job_parameters, time_logger=time_log):
             output = {
-                'time_min': np.min(lc.times),
-                'time_max': np.max(lc.times),
-                'flux_min': np.min(lc.fluxes),
-                'flux_max': np.max(lc.fluxes)
+                'time_min': np.inf,
+                'time_max': -np.inf,
+                'flux_min': np.inf,
+                'flux_max': -np.inf
             }
+            error_count_v1 = error_count_v2 = gap_count = 0
+            spacing = raster_origin = None
+            previous_chunk = None
+
+            for chunk in self.iter_lightcurve(source=source, chunk_length=chunk_length):
+                if len(chunk.times) == 0:
+                    continue
+
+                output['time_min'] = min(output['time_min'], np.min(chunk.times))
+                output['time_max'] = max(output['time_max'], np.max(chunk.times))
+                output['flux_min'] = min(output['flux_min'], np.min(chunk.fluxes))
+                output['flux_max'] = max(output['flux_max'], np.max(chunk.fluxes))
+
+                # Estimate the time step from the first chunk, and check every chunk against it, on a single
+                # fixed-step raster starting at the first sample of the lightcurve
+                if spacing is None:
+                    spacing = chunk.estimate_sampling_interval()
+                    raster_origin = float(chunk.times[0])
+
+                # Prepend the last sample of the previous chunk, so that we also check the step between chunks
+                if previous_chunk is not None:
+                    chunk_to_check = LightcurveArbitraryRaster(
+                        times=np.concatenate([previous_chunk.times[-1:], chunk.times]),
+                        fluxes=np.concatenate([previous_chunk.fluxes[-1:], chunk.fluxes])
+                    )
+                else:
+                    chunk_to_check = chunk
+                previous_chunk = chunk
+
+                if len(chunk_to_check.times) < 2:
+                    continue
+
+                # Find all the gaps in this chunk in a single pass. The first check counts time steps which differ
+                # from the expected spacing; the second counts missing points on a fixed-step raster.
+                gaps = chunk_to_check.analyse_gaps(spacing=spacing, raster_origin=raster_origin)
+                for gap in gaps[:max(4 - gap_count, 0)]:
+                    logging.info("Lightcurve <{}> gap at time {:.5f}: time step {:.15f}, {:d} points missing".format(
+                        input_id, gap['start_time'], gap['step'], gap['missing_count']))
+                gap_count += len(gaps)
+
+                error_count_v1 += int(np.count_nonzero(gaps['step_error']))
+                error_count_v2 += int(np.sum(gaps['missing_count']))
 
             logging.info("Lightcurve <{}> time span {:.1f} to {:.1f}".format(input_id,
                                                                              output['time_min'],
@@ -388,24 +588,20 @@ class TaskRunner:
                                                                               output['flux_min'],
                                                                               output['flux_max']))
 
-            # Run first code for checking LCs
-            error_count = lc.check_fixed_step(verbose=True, max_errors=4)
-
-            if error_count == 0:
+            if error_count_v1 == 0:
                 logging.info("V1: Lightcurve <{}> has fixed step".format(input_id))
                 output['v1'] = True
             else:
-                logging.info("V1: Lightcurve <{}> doesn't have fixed step ({:d} errors)".format(input_id, error_count))
+                logging.info("V1: Lightcurve <{}> doesn't have fixed step ({:d} errors)".format(input_id,
+                                                                                               error_count_v1))
                 output['v1'] = False
 
-            # Run second code for checking LCs
-            error_count = lc.check_fixed_step_v2(verbose=True, max_errors=4)
-
-            if error_count == 0:
+            if error_count_v2 == 0:
                 logging.info("V2: Lightcurve <{}> has fixed step".format(input_id))
                 output['v2'] = True
             else:
-                logging.info("V2: Lightcurve <{}> doesn't have fixed step ({:d} errors)".format(input_id, error_count))
+                logging.info("V2: Lightcurve <{}> doesn't have fixed step ({:d} errors)".format(input_id,
+                                                                                               error_count_v2))
                 output['v2'] = False
 
         # Log output to results table
@@ -418,9 +614,11 @@ class TaskRunner:
         time_log.close()
         result_log.close()
 
-    def rebin_lightcurve(self, job_name, cadence, source, target):
+    def rebin_lightcurve(self, job_name, cadence, source, target, chunk_length=default_chunk_length,
+                         quadrature_uncertainties=False):
         """
-        Perform the task of re-binning a lightcurve.
+        Perform the task of re-binning a lightcurve. The input lightcurve is read in chunks, so that it never needs to
+        be held in memory all at once.
 
         :param job_name:
             Specify the name of the job that these tasks is part of.
@@ -440,6 +638,15 @@ class TaskRunner:
             <source>, <filename> and <directory>.
         :type target:
             dict
+        :param chunk_length:
+            The number of samples to read from the input lightcurve at a time.
+        :type chunk_length:
+            int
+        :param quadrature_uncertainties:
+            If True, where the new cadence is a whole multiple of the input cadence, the uncertainties are combined in
+            quadrature, rather than averaged like the fluxes.
+        :type quadrature_uncertainties:
+            bool
         """
         self.job_name = job_name
         input_id = os.path.join(
@@ -452,22 +659,14 @@ class TaskRunner:
         # Open connections to transit results and run times to output message queues
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
 
-        # Read input lightcurve
-        lc = self.read_lightcurve(source=source)
-
-        # Re-bin lightcurve
+        # Re-bin lightcurve, reading the input one chunk at a time
         with TaskTimer(job_name=job_name, target_name=input_id, task_name='binning',
                        parameters=self.job_parameters, time_logger=time_log):
-            start_time = np.min(lc.times)
-            end_time = np.max(lc.times)
-            new_times = np.arange(start_time, end_time, cadence / 86400)  # Array of times (days)
-
-            resampler = LightcurveResampler(input_lc=lc)
-            new_lc = resampler.onto_raster(output_raster=new_times)
-
-            # Eliminate nasty edge effects
-            new_lc.fluxes[0] = 1
-            new_lc.fluxes[-1] = 1
+            output_chunks = list(resample_stream(chunks=self.iter_lightcurve(source=source,
+                                                                             chunk_length=chunk_length),
+                                                 step=cadence / 86400,
+                                                 quadrature_uncertainties=quadrature_uncertainties))
+            new_lc = self._join_rebinned_chunks(chunks=output_chunks)
 
         # Write output
         self.write_lightcurve(lightcurve=new_lc, target=target)
@@ -475,6 +674,113 @@ class TaskRunner:
         # Close connection to message queue
         time_log.close()
 
+    @staticmethod
+    def _join_rebinned_chunks(chunks):
+        """
+        Join the chunks of a re-binned lightcurve, produced by <resample_stream>, into a single lightcurve.
+
+        :param chunks:
+            The chunks of the re-binned lightcurve.
+        :type chunks:
+            list of <LightcurveArbitraryRaster>
+        :return:
+            LightcurveArbitraryRaster
+        """
+        fluxes = np.concatenate([item.fluxes for item in chunks])
+
+        # Eliminate nasty edge effects
+        fluxes[0] = 1
+        fluxes[-1] = 1
+
+        return LightcurveArbitraryRaster(
+            times=np.concatenate([item.times for item in chunks]),
+            fluxes=fluxes,
+            uncertainties=np.concatenate([item.uncertainties for item in chunks]),
+            metadata=chunks[0].metadata
+        )
+
+    def cadence_pyramid(self, job_name, cadences, source, target, chunk_length=default_chunk_length):
+        """
+        Perform the task of re-binning a lightcurve onto a whole pyramid of cadences, in a single pass over the input
+        lightcurve. Each level of the pyramid is re-binned from the level below it, rather than from the input, as its
+        chunks are produced, so the input is read only once. The pixel edges of successive levels do not coincide, so
+        each level is slightly smoother than if it were re-binned directly from the input.
+
+        :param job_name:
+            Specify the name of the job that these tasks is part of.
+        :type job_name:
+            str
+        :param cadences:
+            List of the time cadences of the levels of the pyramid, seconds, in increasing order. These should
+            ideally be whole multiples of one another, and of the input cadence, so that each level can be re-binned
+            by summing blocks of samples.
+        :type cadences:
+            list
+        :param source:
+            A dictionary specifying the source for the input lightcurve. It should contain the fields
+            <source>, <filename> and <directory>.
+        :type source:
+            dict
+        :param target:
+            A dictionary specifying the target for the output lightcurves. It should contain the fields
+            <source>, <filename> and <directory>. Each level is written to the filename given by substituting its
+            cadence for "{cadence}" in <filename>, or otherwise by inserting "_<cadence>s" before its extension.
+        :type target:
+            dict
+        :param chunk_length:
+            The number of samples to read from the input lightcurve at a time.
+        :type chunk_length:
+            int
+        """
+        self.job_name = job_name
+        input_id = os.path.join(
+            source.get('directory', 'test_lightcurves'),
+            source.get('filename', 'lightcurve.dat')
+        )
+
+        assert len(cadences) > 0, "A cadence pyramid must have at least one level"
+        assert all(cadences[i] < cadences[i + 1] for i in range(len(cadences) - 1)), \
+            "The cadences of a pyramid must be in increasing order"
+
+        logging.info("Building cadence pyramid of <{input_id}> at cadences {cadences}.".format(input_id=input_id,
+                                                                                             cadences=cadences))
+
+        # Open connections to transit results and run times to output message queues
+        time_log = RunTimesToRabbitMQ(results_target=self.results_target)
+
+        def keep_chunks(chunks, level_chunks):
+            # Record each chunk of a level as it passes through to the level above
+            for chunk in chunks:
+                level_chunks.append(chunk)
+                yield chunk
+
+        # Chain together a re-binning stage for each level, each fed by the one below, and then pull every chunk
+        # through the chain, reading the input one chunk at a time
+        with TaskTimer(job_name=job_name, target_name=input_id, task_name='cadence_pyramid',
+                       parameters=self.job_parameters, time_logger=time_log):
+            levels = [[] for cadence in cadences]
+            chunks = self.iter_lightcurve(source=source, chunk_length=chunk_length)
+            for cadence, level_chunks in zip(cadences, levels):
+                chunks = keep_chunks(chunks=resample_stream(chunks=chunks, step=cadence / 86400),
+                                     level_chunks=level_chunks)
+            for chunk in chunks:
+                pass
+
+            level_lightcurves = [self._join_rebinned_chunks(chunks=level_chunks) for level_chunks in levels]
+
+        # Write each level under its own name
+        filename = target.get('filename', 'lightcurve.dat')
+        for cadence, level_lc in zip(cadences, level_lightcurves):
+            if '{cadence}' in filename:
+                level_filename = filename.replace('{cadence}', '{:g}'.format(cadence))
+            else:
+                stem, extension = os.path.splitext(filename)
+                level_filename = "{}_{:g}s{}".format(stem, cadence, extension)
+            self.write_lightcurve(lightcurve=level_lc, target={**target, 'filename': level_filename})
+
+        # Close connection to message queue
+        time_log.close()
+
     def transit_search(self, job_name, lc_duration, tda_name, source, search_settings):
         """
         Perform the task of running a lightcurve through a transit-detection algorithm.
@@ -520,8 +826,11 @@ class TaskRunner:
         time_log = RunTimesToRabbitMQ(results_target=self.results_target)
         result_log = ResultsToRabbitMQ(results_target=self.results_target)
 
-        # Read input lightcurve
+        # Read input lightcurve, and truncate it to the requested duration. The truncated lightcurve is a view of the
+        # one we read, so a lightcurve held in memory can serve searches at many durations without being copied.
         lc = self.read_lightcurve(source=source)
+        if len(lc.times) > 0:
+            lc = lc.window(t_start=lc.times[0], t_end=lc.times[0] + lc_duration)
 
         # Process lightcurve
         with TaskTimer(job_name=job_name, tda_code=tda_name, target_name=input_id, task_name='transit_detection',
@@ -642,18 +951,27 @@ class TaskRunner:
                     output=job_description['output'],
                 )
 
+            # Evaluate an arithmetic expression on lightcurves
+            elif job_description['task'] == 'lightcurve_expression':
+                self.lightcurve_expression(
+                    job_name=job_description.get('job_name', job_name),
+                    inputs=job_description['inputs'],
+                    expression=job_description['expression'],
+                    output=job_description['output'],
+                )
+
             # Verify lightcurve
             elif job_description['task'] == 'verify':
                 self.verify_lightcurve(
                     job_name=job_description.get('job_name', job_name),
                     source=job_description['source'],
+                    chunk_length=job_description.get('chunk_length', default_chunk_length)
                 )
 
             # Delete lightcurve
             elif job_description['task'] == 'delete':
                 self.delete_lightcurve(
-                    job_name=job_description.get('job_name', job_name),
-                    source=job_description['source'],
+                    lc_source=job_description['source'],
                 )
 
             # Re-bin lightcurve
@@ -662,7 +980,19 @@ class TaskRunner:
                     job_name=job_description.get('job_name', job_name),
                     source=job_description['source'],
                     target=job_description['target'],
-                    cadence=job_description.get('cadence', 25)
+                    cadence=job_description.get('cadence', 25),
+                    chunk_length=job_description.get('chunk_length', default_chunk_length),
+                    quadrature_uncertainties=job_description.get('quadrature_uncertainties', False)
+                )
+
+            # Re-bin lightcurve onto a pyramid of cadences
+            elif job_description['task'] == 'cadence_pyramid':
+                self.cadence_pyramid(
+                    job_name=job_description.get('job_name', job_name),
+                    source=job_description['source'],
+                    target=job_description['target'],
+                    cadences=job_description['cadences'],
+                    chunk_length=job_description.get('chunk_length', default_chunk_length)
                 )
 
             # Unknown task
@@ -26,8 +26,11 @@ def process_lightcurve(lc: LightcurveArbitraryRaster, lc_duration: float, search
         dict containing the results of the transit search.
     """
 
+    # Take a copy-on-write copy of the lightcurve, which may be shared with other transit searches
+    lc = lc.copy_on_write()
+
     time = lc.times  # Unit of days
-    flux = lc.fluxes
+    flux = lc.writable('fluxes')
 
     # Median subtract lightcurve
     median = np.median(flux)
@@ -35,13 +35,15 @@ def process_lightcurve(lc: LightcurveArbitraryRaster, lc_duration: float, search
     # Convert input lightcurve to a fixed time step, and fill in gaps
     lc_fixed_step = lc.to_fixed_step()
 
-    # Median subtract lightcurve
-    median = np.median(lc_fixed_step.fluxes)
-    lc_fixed_step.fluxes -= median
+    # Median subtract lightcurve. The fixed-step lightcurve is a new object, so we may modify it, and its fluxes are
+    # only copied if it shares them with the input lightcurve
+    fluxes = lc_fixed_step.writable('fluxes')
+    median = np.median(fluxes)
+    fluxes -= median
 
     # Normalise lightcurve
-    std_dev = np.std(lc_fixed_step.fluxes)
-    lc_fixed_step.fluxes /= std_dev
+    std_dev = np.std(fluxes)
+    fluxes /= std_dev
 
     # Pick a random filename to use to store lightcurve to a text file
     tmp_dir_name = secrets.token_hex(15)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# test_lc_archive.py
+
+"""
+Test that lightcurves round-trip through shard files, and that the index survives interrupted writes.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from plato_wp36 import lc_archive
+from plato_wp36.lc_archive import LightcurveArchive
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+from plato_wp36.settings import settings
+
+
+def example_lightcurve(length, seed):
+    rng = np.random.default_rng(seed)
+    times = np.arange(length) * 25 / 86400
+    return LightcurveArbitraryRaster(times=times,
+                                     fluxes=rng.normal(size=length),
+                                     uncertainties=rng.random(length),
+                                     flags=(rng.random(length) < 0.1).astype(float),
+                                     metadata={'seed': seed})
+
+
+class TestLightcurveArchive(unittest.TestCase):
+    def setUp(self):
+        self.lc_path = settings['lcPath']
+        settings['lcPath'] = tempfile.mkdtemp()
+        lc_archive._index_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(settings['lcPath'])
+        settings['lcPath'] = self.lc_path
+        lc_archive._index_cache.clear()
+
+    def assert_same_lightcurve(self, lc, original):
+        for name in ['times', 'fluxes', 'uncertainties', 'flags']:
+            self.assertTrue(np.array_equal(getattr(lc, name), getattr(original, name)), name)
+        self.assertEqual(lc.metadata['seed'], original.metadata['seed'])
+
+    def test_round_trip(self):
+        archive = LightcurveArchive(directory='shards')
+        originals = {"lc{:d}".format(i): example_lightcurve(length=1000 + i, seed=i) for i in range(20)}
+        for name, lc in originals.items():
+            archive.write(name=name, lightcurve=lc, codec='zlib' if len(name) % 2 else None)
+
+        # A fresh reader, with nothing cached, must see every lightcurve
+        lc_archive._index_cache.clear()
+        self.assertEqual(sorted(archive.names()), sorted(originals))
+        for name, lc in originals.items():
+            self.assert_same_lightcurve(archive.read(name=name), lc)
+            chunks = list(archive.iter_read(name=name, chunk_length=300))
+            self.assertTrue(np.array_equal(np.concatenate([chunk.fluxes for chunk in chunks]), lc.fluxes))
+
+    def test_replace_and_delete(self):
+        archive = LightcurveArchive(directory='shards')
+        archive.write_many(items=[("a", example_lightcurve(100, 1), None), ("b", example_lightcurve(100, 2), None)])
+        archive.write(name="a", lightcurve=example_lightcurve(100, 3))
+        archive.delete(name="b")
+        lc_archive._index_cache.clear()
+        self.assertEqual(archive.names(), ["a"])
+        self.assert_same_lightcurve(archive.read(name="a"), example_lightcurve(100, 3))
+
+    def test_long_chains_are_compacted(self):
+        archive = LightcurveArchive(directory='shards')
+        for i in range(2 * lc_archive.max_index_chain_length + 5):
+            archive.write(name="lc{:d}".format(i), lightcurve=example_lightcurve(10, i))
+        with open(archive.file_path, "rb") as f:
+            pointer = LightcurveArchive._read_pointer(f)
+            segment = LightcurveArchive._read_segment(f, pointer=pointer)
+        self.assertLessEqual(segment['chain_length'], lc_archive.max_index_chain_length)
+        self.assertLessEqual(segment['delta_size'], segment['base_size'])
+        lc_archive._index_cache.clear()
+        self.assertEqual(len(archive.names()), 2 * lc_archive.max_index_chain_length + 5)
+
+    def test_interrupted_write_keeps_index(self):
+        archive = LightcurveArchive(directory='shards')
+        archive.write(name="a", lightcurve=example_lightcurve(100, 1))
+
+        # Simulate a writer which crashed after appending part of a record, before updating the index pointer
+        with open(archive.file_path, "ab") as f:
+            f.write(b'\x01' * 5000)
+        lc_archive._index_cache.clear()
+        self.assertEqual(archive.names(), ["a"])
+
+        archive.write(name="b", lightcurve=example_lightcurve(100, 2))
+        lc_archive._index_cache.clear()
+        self.assertEqual(sorted(archive.names()), ["a", "b"])
+        self.assert_same_lightcurve(archive.read(name="b"), example_lightcurve(100, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# test_lc_batch.py
+
+"""
+Test that operations on batches of lightcurves give the same results as applying them to each lightcurve in turn,
+without modifying the arrays the batch was created from.
+"""
+
+import unittest
+
+import numpy as np
+
+from plato_wp36.lc_batch import LightcurveBatch
+from plato_wp36.lc_dtype_policy import DtypePolicy
+
+
+def example_batch_arrays(count=5, length=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    times = 0.3 + np.arange(length) * 25 / 86400
+    fluxes = 1 + rng.random((count, 1)) + 1e-3 * rng.normal(size=(count, length))
+    uncertainties = 1e-3 * rng.random((count, length))
+    return times, fluxes, uncertainties
+
+
+class TestLightcurveBatch(unittest.TestCase):
+    def test_matches_each_lightcurve(self):
+        times, fluxes, uncertainties = example_batch_arrays()
+        batch = LightcurveBatch(times=times, fluxes=fluxes, uncertainties=uncertainties)
+        means = batch.normalise()
+        medians = batch.subtract_median()
+        for index in range(len(batch)):
+            normalised = fluxes[index] / np.mean(fluxes[index])
+            self.assertEqual(means[index], np.mean(fluxes[index]))
+            self.assertEqual(medians[index], np.median(normalised))
+            self.assertTrue(np.array_equal(batch.fluxes[index], normalised - np.median(normalised)))
+            self.assertTrue(np.array_equal(batch.uncertainties[index], uncertainties[index] / np.mean(fluxes[index])))
+
+    def test_inputs_unchanged(self):
+        times, fluxes, uncertainties = example_batch_arrays()
+        fluxes_before, uncertainties_before = fluxes.copy(), uncertainties.copy()
+        batch = LightcurveBatch(times=times, fluxes=fluxes, uncertainties=uncertainties)
+        row = batch.row(index=1)
+        batch.subtract_median()
+        batch.normalise()
+        self.assertTrue(np.array_equal(fluxes, fluxes_before))
+        self.assertTrue(np.array_equal(uncertainties, uncertainties_before))
+        self.assertTrue(np.array_equal(row.fluxes, fluxes_before[1]))
+        self.assertTrue(np.array_equal(row.uncertainties, uncertainties_before[1]))
+
+    def test_single_precision(self):
+        # Operations on single-precision batches keep their type, and match the same operations applied in place
+        times, fluxes, uncertainties = example_batch_arrays()
+        policy = DtypePolicy(flux_dtype=np.float32)
+        batch = LightcurveBatch(times=times, fluxes=fluxes, uncertainties=uncertainties, dtype_policy=policy)
+        expected = batch.fluxes.copy()
+        expected -= np.median(expected, axis=1)[:, np.newaxis]
+        batch.subtract_median()
+        self.assertEqual(batch.fluxes.dtype, np.float32)
+        self.assertTrue(np.array_equal(batch.fluxes, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
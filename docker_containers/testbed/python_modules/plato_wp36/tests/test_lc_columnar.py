@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# test_lc_columnar.py
+
+"""
+Test that lightcurves read in chunks from our columnar binary format match the whole file, and that each compressed
+block is only decompressed once.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from plato_wp36 import lc_columnar
+from plato_wp36.lc_columnar import iter_columnar, read_columnar, write_columnar
+
+
+class TestIterColumnar(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, "lightcurve.bin")
+
+        rng = np.random.default_rng(0)
+        length = 200000
+        self.columns = {
+            'times': np.arange(length) * 25 / 86400,
+            'fluxes': rng.normal(size=length),
+            'flags': (rng.random(length) < 0.1).astype(float),
+            'uncertainties': rng.random(length)
+        }
+        write_columnar(file_path=self.file_path, columns=self.columns, codec='zlib')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunks_match_whole_file(self):
+        header, whole = read_columnar(file_path=self.file_path)
+        for chunk_length in (4097, 65536, 100000, 300000):
+            chunks = list(iter_columnar(file_path=self.file_path, chunk_length=chunk_length))
+            self.assertEqual(len(chunks), -(-len(self.columns['times']) // chunk_length))
+            for name, values in self.columns.items():
+                joined = np.concatenate([chunk[name] for chunk in chunks])
+                self.assertTrue(np.array_equal(joined, values), "{} {}".format(name, chunk_length))
+                self.assertTrue(np.array_equal(joined, whole[name]), "{} {}".format(name, chunk_length))
+
+    def test_blocks_decoded_once(self):
+        for chunk_length in (1000, 4097, 100000):
+            with mock.patch.object(lc_columnar, '_read_encoded_column',
+                                   wraps=lc_columnar._read_encoded_column) as read_encoded_column:
+                for _ in iter_columnar(file_path=self.file_path, chunk_length=chunk_length):
+                    pass
+            decoded_blocks = {}
+            for call in read_encoded_column.call_args_list:
+                first_block, last_block = call.kwargs['block_range']
+                decoded_blocks.setdefault(call.kwargs['column']['name'], []).extend(range(first_block, last_block))
+            self.assertEqual(set(decoded_blocks), set(self.columns))
+            for name, blocks in decoded_blocks.items():
+                self.assertEqual(sorted(blocks), list(range(4)), "{} {}".format(name, chunk_length))
+
+    def test_chunks_are_read_only(self):
+        chunks = iter_columnar(file_path=self.file_path, chunk_length=100)
+        chunk = next(chunks)
+        with self.assertRaises(ValueError):
+            chunk['fluxes'][0] = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# test_lc_expression.py
+
+"""
+Test that lazy lightcurve expressions, evaluated in a single pass over chunks of samples, give the same results as
+applying the arithmetic operators of lightcurves one at a time.
+"""
+
+import unittest
+
+import numpy as np
+
+from plato_wp36.lc_expression import parse_expression
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+
+
+def example_lightcurve(times, seed=0, mes=0):
+    rng = np.random.default_rng(seed)
+    return LightcurveArbitraryRaster(times=times,
+                                     fluxes=1 + 1e-3 * rng.normal(size=len(times)),
+                                     uncertainties=1e-3 * rng.random(len(times)),
+                                     flags=(rng.random(len(times)) < 0.05).astype(float),
+                                     metadata={'mes': mes, 'seed': seed})
+
+
+class TestLightcurveExpression(unittest.TestCase):
+    # Each eager product trims a sample from each end, whereas a lazy expression is trimmed once, so these expressions
+    # have at most one multiplication, on the left. Lazy expressions also resample each input, rather than each
+    # intermediate result, so products are only compared where the operands share the target raster
+    expressions = ('noise + transit', 'noise - transit + systematics', 'noise * transit + systematics',
+                   '(noise - transit) * transit + noise', 'noise + noise', 'systematics + noise - transit')
+
+    def setUp(self):
+        times = 0.3 + np.arange(30000) * 25 / 86400
+        self.lightcurves = {
+            'noise': example_lightcurve(times, seed=0, mes=3),
+            'transit': example_lightcurve(times.copy(), seed=1, mes=5),
+            'systematics': example_lightcurve(0.2 + np.arange(10000) * 90 / 86400, seed=2, mes=1)
+        }
+
+    def eager(self, expression):
+        return eval(expression, {}, self.lightcurves)
+
+    def assert_lightcurves_match(self, actual, expected, message):
+        self.assertTrue(np.array_equal(actual.times, expected.times), message)
+        self.assertTrue(np.allclose(actual.fluxes, expected.fluxes, rtol=1e-12, atol=0), message)
+        self.assertTrue(np.allclose(actual.uncertainties, expected.uncertainties, rtol=1e-12, atol=0), message)
+        self.assertTrue(np.allclose(actual.flags, expected.flags, rtol=1e-12, atol=0), message)
+        self.assertEqual(actual.metadata, expected.metadata, message)
+
+    def test_matches_eager(self):
+        for expression in self.expressions:
+            lazy = parse_expression(expression=expression, lightcurves=self.lightcurves).evaluate()
+            self.assert_lightcurves_match(lazy, self.eager(expression), expression)
+
+    def test_chunk_length(self):
+        for expression in self.expressions:
+            tree = parse_expression(expression=expression, lightcurves=self.lightcurves)
+            whole = tree.evaluate(chunk_length=1000000)
+            for chunk_length in (1, 999, 16384):
+                chunked = tree.evaluate(chunk_length=chunk_length)
+                for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+                    self.assertTrue(np.array_equal(getattr(chunked, name), getattr(whole, name)),
+                                    "{} {} {}".format(expression, name, chunk_length))
+
+    def test_operators(self):
+        noise, transit = self.lightcurves['noise'], self.lightcurves['transit']
+        lazy = (noise.lazy() * transit + self.lightcurves['systematics']).evaluate()
+        self.assert_lightcurves_match(lazy, self.eager('noise * transit + systematics'), 'operators')
+
+    def test_out(self):
+        # The output may be the result of an earlier evaluation, whose arrays are overwritten
+        tree = parse_expression(expression='noise - transit + systematics', lightcurves=self.lightcurves)
+        out = parse_expression(expression='transit + noise', lightcurves=self.lightcurves).evaluate()
+        buffer = out.fluxes
+        result = tree.evaluate(out=out)
+        self.assertIs(result, out)
+        self.assertTrue(np.shares_memory(result.fluxes, buffer))
+        self.assert_lightcurves_match(result, self.eager('noise - transit + systematics'), 'out')
+
+    def test_inputs_unchanged(self):
+        before = {name: np.array(lc.fluxes) for name, lc in self.lightcurves.items()}
+        for expression in self.expressions:
+            parse_expression(expression=expression, lightcurves=self.lightcurves).evaluate()
+        for name, lc in self.lightcurves.items():
+            self.assertTrue(np.array_equal(lc.fluxes, before[name]), name)
+
+    def test_unsupported_syntax(self):
+        with self.assertRaises(ValueError):
+            parse_expression(expression='noise / transit', lightcurves=self.lightcurves)
+        with self.assertRaises(AssertionError):
+            parse_expression(expression='noise + unknown', lightcurves=self.lightcurves)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# test_lc_reader_lcsg.py
+
+"""
+Test the bulk reader for LCSG lightcurves against a line-by-line parser, which works in the same way as the original
+reader.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from plato_wp36.lc_reader_lcsg import iter_lcsg_lightcurve, read_lcsg_lightcurve
+from plato_wp36.settings import settings
+
+
+def reference_read(file_path):
+    """
+    Read an LCSG lightcurve one line at a time, taking the first three comma-separated columns of each line.
+    """
+    metadata = {}
+    rows = []
+    with gzip.open(file_path, "rt") as file:
+        for line in file:
+            if line.startswith('#'):
+                if line.startswith('# #'):
+                    key, value = line[3:].split('=', 1)
+                    try:
+                        metadata[key.strip()] = float(value)
+                    except ValueError:
+                        metadata[key.strip()] = value.strip()
+                continue
+            if len(line.strip()) == 0:
+                continue
+            rows.append([float(item) for item in line.split(',')[:3]])
+    return metadata, np.array(rows).reshape((-1, 3)).T
+
+
+class TestLcsgReader(unittest.TestCase):
+    def setUp(self):
+        self.lc_path = settings['lcPath']
+        settings['lcPath'] = tempfile.mkdtemp()
+        os.mkdir(os.path.join(settings['lcPath'], 'lcsg'))
+
+    def tearDown(self):
+        shutil.rmtree(settings['lcPath'])
+        settings['lcPath'] = self.lc_path
+
+    def write(self, filename, text):
+        with gzip.open(os.path.join(settings['lcPath'], 'lcsg', filename), 'wt') as file:
+            file.write(text)
+
+    def example_text(self, length=1000, line_ending='\n'):
+        rng = np.random.default_rng(1)
+        lines = ["# #star_id=1234", "# #mag=11.5", "# time,flux,flag"]
+        for time, flux, flag in zip(np.arange(length) * 25 / 86400, rng.normal(size=length), rng.random(length)):
+            lines.append("{:.12f},{:.9f},{:.0f}".format(time, flux, flag) + line_ending.rstrip('\n'))
+        return "\n".join(lines) + "\n"
+
+    def assert_matches_reference(self, filename):
+        metadata, columns = reference_read(os.path.join(settings['lcPath'], 'lcsg', filename))
+        lc = read_lcsg_lightcurve(filename=filename, directory='lcsg')
+        for name, column in zip(['times', 'fluxes', 'flags'], columns):
+            self.assertTrue(np.array_equal(getattr(lc, name), column), name)
+        for key, value in metadata.items():
+            self.assertEqual(lc.metadata[key], value)
+
+        chunks = list(iter_lcsg_lightcurve(filename=filename, directory='lcsg', chunk_length=97))
+        self.assertTrue(np.array_equal(np.concatenate([chunk.times for chunk in chunks]), columns[0]))
+        self.assertTrue(np.array_equal(np.concatenate([chunk.fluxes for chunk in chunks]), columns[1]))
+
+    def test_matches_reference(self):
+        self.write('plain.csv.gz', self.example_text())
+        self.assert_matches_reference('plain.csv.gz')
+
+    def test_trailing_commas_and_blank_lines(self):
+        text = self.example_text(line_ending=',\n').replace("\n", "\n\n", 5)
+        self.write('trailing.csv.gz', text)
+        self.assert_matches_reference('trailing.csv.gz')
+
+    def test_ragged_line(self):
+        lines = self.example_text().split("\n")
+        lines[500] += ",7"
+        self.write('ragged.csv.gz', "\n".join(lines))
+        with self.assertRaises(ValueError) as context:
+            read_lcsg_lightcurve(filename='ragged.csv.gz', directory='lcsg')
+        self.assertIn("Line 501", str(context.exception))
+        self.assertIn("ragged.csv.gz", str(context.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# test_lightcurve_arithmetic.py
+
+"""
+Test that arithmetic on lightcurves gives the same results as the original implementation, which always resampled
+the second lightcurve onto the raster of the first, both when the result is allocated afresh and when it is written
+into an existing lightcurve.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from plato_wp36 import lc_archive
+from plato_wp36.lc_archive import LightcurveArchive
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+from plato_wp36.lightcurve_resample import LightcurveResampler
+from plato_wp36.settings import settings
+
+
+def reference_combine(lc_1, lc_2, operation):
+    """
+    Combine two lightcurves, in the same way as the original <__add__>, <__sub__> and <__mul__>. Returns the times,
+    fluxes, uncertainties and flags of the result.
+
+    The original combined this lightcurve's flags with the <flags> of the resampled lightcurve, which were always
+    zero, since the resampler returns resampled flags in its <mask>. The other lightcurve's flags are now kept, so
+    they are taken from the mask here.
+    """
+    other_resampled = LightcurveResampler(input_lc=lc_2).match_to_other_lightcurve(other=lc_1)
+    fluxes = {'add': np.add, 'subtract': np.subtract, 'multiply': np.multiply}[operation](lc_1.fluxes,
+                                                                                         other_resampled.fluxes)
+    uncertainties = np.hypot(lc_1.uncertainties, other_resampled.uncertainties)
+    flags = np.hypot(lc_1.flags, other_resampled.mask)
+    trim = slice(1, -1) if operation == 'multiply' else slice(None)
+    return lc_1.times[trim], fluxes[trim], uncertainties[trim], flags[trim]
+
+
+def example_lightcurve(times, seed=0, mes=0):
+    rng = np.random.default_rng(seed)
+    return LightcurveArbitraryRaster(times=times,
+                                     fluxes=1 + 1e-3 * rng.normal(size=len(times)),
+                                     uncertainties=1e-3 * rng.random(len(times)),
+                                     flags=(rng.random(len(times)) < 0.05).astype(float),
+                                     metadata={'mes': mes})
+
+
+class TestArithmetic(unittest.TestCase):
+    operations = ('add', 'subtract', 'multiply')
+
+    def assert_matches_reference(self, result, lc_1, lc_2, operation):
+        times, fluxes, uncertainties, flags = reference_combine(lc_1=lc_1, lc_2=lc_2, operation=operation)
+        self.assertTrue(np.array_equal(result.times, times), operation)
+        for name, expected in (('fluxes', fluxes), ('uncertainties', uncertainties)):
+            self.assertTrue(np.allclose(getattr(result, name), expected, rtol=1e-10, atol=1e-14),
+                            "{} {}".format(name, operation))
+        self.assertTrue(np.array_equal(result.flags, flags), operation)
+
+    def test_same_raster(self):
+        times = 0.3 + np.arange(20000) * 25 / 86400
+        lc_1 = example_lightcurve(times, seed=0, mes=2)
+        lc_2 = example_lightcurve(times.copy(), seed=1, mes=1)
+        for operation in self.operations:
+            result = getattr(lc_1, operation)(other=lc_2)
+            self.assert_matches_reference(result=result, lc_1=lc_1, lc_2=lc_2, operation=operation)
+
+    def test_contained_raster(self):
+        # The first lightcurve is a contiguous part of the raster of the second
+        times = 0.3 + np.arange(20000) * 25 / 86400
+        lc_1 = example_lightcurve(times[5000:15000], seed=0)
+        lc_2 = example_lightcurve(times, seed=1)
+        for operation in self.operations:
+            result = getattr(lc_1, operation)(other=lc_2)
+            self.assert_matches_reference(result=result, lc_1=lc_1, lc_2=lc_2, operation=operation)
+
+    def test_different_raster(self):
+        lc_1 = example_lightcurve(0.3 + np.arange(20000) * 25 / 86400, seed=0)
+        lc_2 = example_lightcurve(0.2 + np.arange(10000) * 60 / 86400, seed=1)
+        for operation in self.operations:
+            result = getattr(lc_1, operation)(other=lc_2)
+            self.assert_matches_reference(result=result, lc_1=lc_1, lc_2=lc_2, operation=operation)
+
+    def test_metadata(self):
+        times = 0.3 + np.arange(1000) * 25 / 86400
+        lc_1 = example_lightcurve(times, seed=0, mes=1)
+        lc_2 = example_lightcurve(times, seed=1, mes=2)
+        lc_1.metadata['first'] = 1
+        lc_2.metadata['second'] = 2
+        self.assertEqual(lc_1.add(other=lc_2).metadata, {'mes': 2, 'second': 2})
+        self.assertEqual(lc_1.subtract(other=lc_2).metadata, {'mes': 2, 'first': 1, 'second': 2})
+
+
+class TestArithmeticOutput(unittest.TestCase):
+    operations = ('add', 'subtract', 'multiply')
+
+    @staticmethod
+    def writable_lightcurve(times, seed):
+        # The arrays of the results of arithmetic belong to them alone, so may be overwritten
+        lc = example_lightcurve(times, seed=seed)
+        return lc.add(other=LightcurveArbitraryRaster(times=times, fluxes=np.zeros_like(times), metadata={'mes': 0}))
+
+    def test_out_matches_allocated(self):
+        times = 0.3 + np.arange(20000) * 25 / 86400
+        lc_1 = example_lightcurve(times, seed=0)
+        lc_2 = example_lightcurve(times, seed=1)
+        for operation in self.operations:
+            expected = getattr(lc_1, operation)(other=lc_2)
+            out = self.writable_lightcurve(times, seed=2)
+            buffer = out.fluxes
+            result = getattr(lc_1, operation)(other=lc_2, out=out)
+            self.assertIs(result, out, operation)
+            self.assertTrue(np.shares_memory(result.fluxes, buffer), operation)
+            for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+                self.assertTrue(np.array_equal(getattr(result, name), getattr(expected, name)),
+                                "{} {}".format(name, operation))
+
+    def test_in_place_operators(self):
+        times = 0.3 + np.arange(20000) * 25 / 86400
+        lc_2 = example_lightcurve(times, seed=1)
+        for operation, in_place in (('add', '__iadd__'), ('subtract', '__isub__'), ('multiply', '__imul__')):
+            lc_1 = self.writable_lightcurve(times, seed=0)
+            expected = getattr(self.writable_lightcurve(times, seed=0), operation)(other=lc_2)
+            buffer = lc_1.fluxes
+            result = getattr(lc_1, in_place)(lc_2)
+            self.assertIs(result, lc_1, operation)
+            self.assertTrue(np.shares_memory(result.fluxes, buffer), operation)
+            for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+                self.assertTrue(np.array_equal(getattr(result, name), getattr(expected, name)),
+                                "{} {}".format(name, operation))
+
+    def test_shared_arrays_not_overwritten(self):
+        # Lightcurves whose arrays may be shared with others must not be updated in place
+        times = 0.3 + np.arange(1000) * 25 / 86400
+        lc_2 = example_lightcurve(times, seed=1)
+        for lc_1 in (example_lightcurve(times, seed=0), self.writable_lightcurve(times, seed=0)):
+            view = lc_1.window(t_start=times[0], t_end=times[-1] + 1)
+            fluxes_before = np.array(view.fluxes)
+            expected = lc_1.add(other=lc_2)
+            lc_1 += lc_2
+            self.assertTrue(np.array_equal(view.fluxes, fluxes_before))
+            self.assertTrue(np.array_equal(lc_1.fluxes, expected.fluxes))
+
+    def test_read_only_out_rejected(self):
+        times = 0.3 + np.arange(1000) * 25 / 86400
+        lc_1 = example_lightcurve(times, seed=0)
+        with self.assertRaises(AssertionError):
+            lc_1.add(other=example_lightcurve(times, seed=1), out=example_lightcurve(times, seed=2))
+
+
+class TestReadLightcurvesReused(unittest.TestCase):
+    def setUp(self):
+        self.lc_path = settings['lcPath']
+        settings['lcPath'] = tempfile.mkdtemp()
+        lc_archive._index_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(settings['lcPath'])
+        settings['lcPath'] = self.lc_path
+        lc_archive._index_cache.clear()
+
+    def test_in_place_operators(self):
+        # Lightcurves read from files own their arrays, so in-place arithmetic on them does not allocate new ones
+        times = 0.3 + np.arange(2000) * 25 / 86400
+        original = example_lightcurve(times, seed=0)
+        other = example_lightcurve(times, seed=1)
+        expected = original.multiply(other=other)
+        readers = []
+        for name, options in (('text', {}), ('gzip', {'gzipped': True}), ('binary', {'binary': True}),
+                              ('compressed', {'binary': True, 'codec': 'zlib'})):
+            original.to_file(directory='lc', filename=name, **options)
+            readers.append((name, lambda name=name: LightcurveArbitraryRaster.from_file(directory='lc', filename=name)))
+        LightcurveArchive(directory='lc').write(name='shard', lightcurve=original)
+        readers.append(('shard', lambda: LightcurveArchive(directory='lc').read(name='shard')))
+
+        for name, reader in readers:
+            lc = reader()
+            buffers = (lc.fluxes, lc.uncertainties, lc.flags)
+            lc *= other
+            for column, buffer in zip(('fluxes', 'uncertainties', 'flags'), buffers):
+                self.assertTrue(np.shares_memory(getattr(lc, column), buffer), "{} {}".format(name, column))
+                self.assertTrue(np.allclose(getattr(lc, column), getattr(expected, column), rtol=1e-12, atol=0),
+                                "{} {}".format(name, column))
+
+            # The file itself is unchanged
+            self.assertTrue(np.allclose(reader().fluxes, original.fluxes, rtol=1e-12, atol=0), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# test_lightcurve_files.py
+
+"""
+Test that lightcurves read from and written to data files in our lightcurve archive match the original line-by-line
+text reader and <np.savetxt> writer.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from plato_wp36.lc_codecs import codecs
+from plato_wp36.lc_columnar import read_columnar_header
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+from plato_wp36.settings import settings
+
+
+def reference_read(file_path, gzipped, cut_off_time=None):
+    """
+    Read the columns of a text lightcurve in the same way as the original <LightcurveArbitraryRaster.from_file>.
+    """
+    rows = []
+    with (gzip.open if gzipped else open)(file_path, "rt") as file:
+        for line in file:
+            if len(line) == 0 or line[0] == '#':
+                continue
+            words = line.split()
+            time = float(words[0]) / 86400
+            if cut_off_time is not None and time > cut_off_time:
+                continue
+            rows.append([time, float(words[1]), float(words[2]), float(words[3])])
+    return np.array(rows).reshape((-1, 4)).T
+
+
+def reference_write(file_path, gzipped, columns, metadata):
+    """
+    Write a text lightcurve and its sidecar metadata file in the same way as the original
+    <LightcurveArbitraryRaster.to_file>.
+    """
+    with open("{}.metadata".format(file_path), "w") as out:
+        out.write("binary=0\n")
+        out.write("gzipped={}\n".format(int(gzipped)))
+        for key, value in metadata.items():
+            out.write("{}={}\n".format(key, value))
+    with (gzip.open if gzipped else open)(file_path, "wt") as out:
+        np.savetxt(out, np.transpose([columns[0] * 86400] + list(columns[1:])))
+
+
+def example_columns(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return [np.arange(length) * 25 / 86400 + 0.1,
+            1 + 1e-3 * rng.normal(size=length),
+            (rng.random(length) < 0.05).astype(float),
+            1e-3 * rng.random(length)]
+
+
+class LightcurveFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lc_path = settings['lcPath']
+        settings['lcPath'] = tempfile.mkdtemp()
+        os.mkdir(os.path.join(settings['lcPath'], 'lc'))
+
+    def tearDown(self):
+        shutil.rmtree(settings['lcPath'])
+        settings['lcPath'] = self.lc_path
+
+    def file_path(self, filename):
+        return os.path.join(settings['lcPath'], 'lc', filename)
+
+    def assert_columns_equal(self, lc, columns, message=None):
+        for name, expected in zip(('times', 'fluxes', 'flags', 'uncertainties'), columns):
+            self.assertTrue(np.array_equal(getattr(lc, name), expected), "{} {}".format(name, message))
+
+
+class TestTextReader(LightcurveFileTestCase):
+    def test_matches_reference(self):
+        columns = example_columns(50000)
+        for gzipped in (True, False):
+            filename = "lc.txt{}".format(".gz" if gzipped else "")
+            reference_write(file_path=self.file_path(filename), gzipped=gzipped, columns=columns,
+                            metadata={'mes': 7.5, 'star': 'abc'})
+            for cut_off_time in (None, 1.5, 100):
+                lc = LightcurveArbitraryRaster.from_file(directory='lc', filename=filename, cut_off_time=cut_off_time)
+                expected = reference_read(file_path=self.file_path(filename), gzipped=gzipped,
+                                          cut_off_time=cut_off_time)
+                self.assert_columns_equal(lc, expected, "gzipped {} cut off {}".format(gzipped, cut_off_time))
+                self.assertEqual(lc.metadata['mes'], 7.5)
+                self.assertEqual(lc.metadata['star'], 'abc')
+
+    def test_comment_lines(self):
+        columns = example_columns(1000)
+        file_path = self.file_path("commented.txt")
+        reference_write(file_path=file_path, gzipped=False, columns=columns, metadata={})
+        with open(file_path) as f:
+            lines = f.readlines()
+        with open(file_path, "w") as f:
+            f.write("# A comment\n")
+            f.writelines(lines[:500] + ["# Another comment\n"] + lines[500:])
+
+        lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="commented.txt")
+        self.assert_columns_equal(lc, reference_read(file_path=file_path, gzipped=False))
+
+
+class TestTextWriter(LightcurveFileTestCase):
+    def test_matches_savetxt(self):
+        columns = example_columns(30000)
+        lc = LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2], uncertainties=columns[3])
+        reference_write(file_path=self.file_path("reference.txt"), gzipped=False, columns=columns, metadata={})
+        with open(self.file_path("reference.txt"), "rb") as f:
+            expected = f.read()
+
+        lc.to_file(directory='lc', filename="lc.txt", gzipped=False)
+        with open(self.file_path("lc.txt"), "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+        for compression_threads in (0, 3):
+            lc.to_file(directory='lc', filename="lc.txt.gz", compression_threads=compression_threads)
+            with gzip.open(self.file_path("lc.txt.gz"), "rb") as f:
+                self.assertEqual(f.read(), expected, "threads {}".format(compression_threads))
+
+
+class TestBinaryFiles(LightcurveFileTestCase):
+    def test_round_trip(self):
+        columns = example_columns(50000)
+        original = LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                             uncertainties=columns[3], metadata={'mes': 7.5})
+        original.to_file(directory='lc', filename="lc.bin", binary=True)
+        for cut_off_time in (None, 0.05, 1.5, 100):
+            lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin", cut_off_time=cut_off_time)
+            selection = columns[0] <= cut_off_time if cut_off_time is not None else slice(None)
+            self.assert_columns_equal(lc, [column[selection] for column in columns], "cut off {}".format(cut_off_time))
+            self.assertEqual(lc.metadata['mes'], 7.5)
+
+    def test_irregular_times(self):
+        columns = example_columns(10000)
+        columns[0] = np.cumsum(np.random.default_rng(1).uniform(10, 40, size=10000)) / 86400
+        LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                  uncertainties=columns[3]).to_file(directory='lc', filename="lc.bin", binary=True)
+        self.assert_columns_equal(LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin"), columns)
+
+    def test_copy_on_write(self):
+        # The lightcurve owns its memory-mapped arrays, but updating them never modifies the file
+        columns = example_columns(1000)
+        LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                  uncertainties=columns[3]).to_file(directory='lc', filename="lc.bin", binary=True)
+        lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin")
+        lc.fluxes[0] = 0
+        self.assertEqual(lc.fluxes[0], 0)
+        self.assert_columns_equal(LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin"), columns)
+
+        # Once it shares them with another lightcurve, they are read-only
+        lc.window(t_start=columns[0][10])
+        with self.assertRaises(ValueError):
+            lc.fluxes[0] = 1
+
+    def test_legacy_npy(self):
+        # The original binary format was an array of rows written by np.save, which appends a .npy suffix
+        columns = example_columns(1000)
+        np.save(self.file_path("legacy.bin"), np.transpose([columns[0] * 86400] + columns[1:]))
+        lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="legacy.bin")
+        self.assertTrue(np.allclose(lc.times, columns[0], rtol=1e-15, atol=0))
+        self.assert_columns_equal(lc, [lc.times] + columns[1:])
+
+
+class TestCompressedFiles(LightcurveFileTestCase):
+    def test_codecs_round_trip(self):
+        columns = example_columns(70000)
+        original = LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                             uncertainties=columns[3])
+        for codec in codecs:
+            for shuffle in (True, False):
+                message = "codec {} shuffle {}".format(codec, shuffle)
+                original.to_file(directory='lc', filename="lc.bin", binary=True, codec=codec, shuffle=shuffle,
+                                 codec_level=1 if codec != 'none' else None)
+                self.assert_columns_equal(LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin"),
+                                          columns, message)
+                lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin", cut_off_time=2)
+                self.assert_columns_equal(lc, [column[columns[0] <= 2] for column in columns], message)
+
+
+class TestCompactFiles(LightcurveFileTestCase):
+    def test_implicit_time_axis(self):
+        # Times generated in seconds, as by PSLS, can be reconstructed exactly from a start time and step
+        columns = example_columns(20000)
+        columns[0] = (600 + np.arange(20000) * 25.) / 86400
+        keep = np.ones(20000, dtype=bool)
+        keep[5000:5100] = False
+        keep[12345] = False
+        columns = [column[keep] for column in columns]
+        LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                  uncertainties=columns[3]).to_file(directory='lc', filename="lc.bin", binary=True,
+                                                                    codec='zlib')
+        self.assertIn('time_axis', read_columnar_header(file_path=self.file_path("lc.bin")))
+        self.assert_columns_equal(LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin"), columns)
+        lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin", cut_off_time=1)
+        self.assert_columns_equal(lc, [column[columns[0] <= 1] for column in columns])
+
+    def test_float32(self):
+        columns = example_columns(20000)
+        LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                  uncertainties=columns[3]).to_file(directory='lc', filename="lc.bin", binary=True,
+                                                                    float32=True)
+        header = read_columnar_header(file_path=self.file_path("lc.bin"))
+        lc = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.bin")
+        self.assertTrue(np.array_equal(lc.times, columns[0]))
+        self.assertTrue(np.array_equal(lc.flags, columns[2]))
+        for name, expected in (('fluxes', columns[1]), ('uncertainties', columns[3])):
+            column = [item for item in header['columns'] if item['name'] == name][0]
+            self.assertEqual(np.dtype(column['dtype']), np.float32)
+            self.assertEqual(float(np.max(np.abs(getattr(lc, name) - expected))), column['max_error'])
+            self.assertTrue(np.allclose(getattr(lc, name), expected, rtol=1e-7, atol=0))
+
+
+class TestMetadata(LightcurveFileTestCase):
+    metadata = {'mes': 7.5, 'star': 'abc', 'count': 3, 'flag': True, 'nothing': None}
+
+    def example_lightcurve(self):
+        columns = example_columns(1000)
+        return LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2],
+                                         uncertainties=columns[3], metadata=dict(self.metadata))
+
+    def test_sidecar_by_default(self):
+        # By default, text lightcurves can still be read by the original reader, which requires a sidecar file
+        lc = self.example_lightcurve()
+        lc.to_file(directory='lc', filename="lc.txt.gz")
+        self.assertTrue(os.path.exists(self.file_path("lc.txt.gz.metadata")))
+        for column, expected in zip(reference_read(file_path=self.file_path("lc.txt.gz"), gzipped=True),
+                                    [lc.times * 86400 / 86400, lc.fluxes, lc.flags, lc.uncertainties]):
+            self.assertTrue(np.array_equal(column, expected))
+        read_back = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.txt.gz")
+        self.assertEqual(read_back.metadata['mes'], 7.5)
+        self.assertEqual(read_back.metadata['star'], 'abc')
+
+    def test_embedded(self):
+        lc = self.example_lightcurve()
+        for binary in (False, True):
+            # Any stale sidecar left by an earlier lightcurve with the same name is removed
+            lc.to_file(directory='lc', filename="lc.dat", binary=binary, metadata_format='sidecar')
+            lc.to_file(directory='lc', filename="lc.dat", binary=binary, metadata_format='embedded')
+            self.assertFalse(os.path.exists(self.file_path("lc.dat.metadata")))
+            read_back = LightcurveArbitraryRaster.from_file(directory='lc', filename="lc.dat")
+            # Text files store times in seconds
+            times = lc.times if binary else lc.times * 86400 / 86400
+            self.assert_columns_equal(read_back, [times, lc.fluxes, lc.flags, lc.uncertainties])
+            for key, value in self.metadata.items():
+                self.assertEqual(read_back.metadata[key], value, key)
+                self.assertIs(type(read_back.metadata[key]), type(value), key)
+
+
+class TestChunkedReading(LightcurveFileTestCase):
+    def test_chunks_match_whole_file(self):
+        columns = example_columns(20000)
+        lc = LightcurveArbitraryRaster(times=columns[0], fluxes=columns[1], flags=columns[2], uncertainties=columns[3],
+                                       metadata={'mes': 2.})
+        lc.to_file(directory='lc', filename="lc.txt.gz")
+        lc.to_file(directory='lc', filename="lc.bin", binary=True)
+        lc.to_file(directory='lc', filename="lc.zlib", binary=True, codec='zlib')
+        np.save(self.file_path("lc.npy"), np.transpose([columns[0] * 86400] + columns[1:]))
+
+        for filename in ("lc.txt.gz", "lc.bin", "lc.zlib", "lc.npy"):
+            for cut_off_time in (None, 2):
+                whole = LightcurveArbitraryRaster.from_file(directory='lc', filename=filename,
+                                                            cut_off_time=cut_off_time)
+                for arguments in ({'chunk_length': 999}, {'chunk_length': 20000}, {'chunk_duration': 0.5}):
+                    message = "{} {} {}".format(filename, cut_off_time, arguments)
+                    chunks = list(LightcurveArbitraryRaster.iter_from_file(directory='lc', filename=filename,
+                                                                           cut_off_time=cut_off_time, **arguments))
+                    if 'chunk_length' in arguments:
+                        self.assertTrue(all(len(chunk.times) == arguments['chunk_length'] for chunk in chunks[:-1]),
+                                        message)
+                    else:
+                        self.assertTrue(all(np.ptp(chunk.times) < arguments['chunk_duration'] for chunk in chunks),
+                                        message)
+                    for name in ('times', 'fluxes', 'flags', 'uncertainties'):
+                        self.assertTrue(np.array_equal(np.concatenate([getattr(chunk, name) for chunk in chunks]),
+                                                       getattr(whole, name)), "{} {}".format(name, message))
+                    if filename != "lc.npy":
+                        self.assertTrue(all(chunk.metadata['mes'] == 2. for chunk in chunks), message)
+
+
+if __name__ == '__main__':
+    unittest.main()
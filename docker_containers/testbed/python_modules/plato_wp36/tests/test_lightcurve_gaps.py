@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# test_lightcurve_gaps.py
+
+"""
+Test that the vectorised gap analysis of lightcurves counts the same errors as the original sample-by-sample checks,
+both for whole lightcurves and for lightcurves which are checked in chunks.
+"""
+
+import math
+import unittest
+
+import numpy as np
+
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+
+
+def reference_check_fixed_step(times, spacing, abs_tol=1e-4):
+    """
+    Count the time steps which differ from <spacing>, in the same way as the original <check_fixed_step>.
+    """
+    return sum(not math.isclose(step, spacing, abs_tol=abs_tol, rel_tol=0) for step in np.diff(times))
+
+
+def reference_check_fixed_step_v2(times, spacing, abs_tol=1e-4):
+    """
+    Count the points on a fixed-step raster with no matching sample, in the same way as the original
+    <check_fixed_step_v2>.
+    """
+    error_count = 0
+    input_position = 0
+    for time in np.arange(start=times[0], stop=times[-1], step=spacing):
+        while ((not math.isclose(time, times[input_position], abs_tol=abs_tol, rel_tol=0)) and
+               (time > times[input_position])):
+            input_position += 1
+        if not math.isclose(time, times[input_position], abs_tol=abs_tol, rel_tol=0):
+            error_count += 1
+    return error_count
+
+
+def reference_estimate_sampling_interval(times):
+    """
+    Estimate the time step of a lightcurve from the mean of the interquartile range of its time steps, in the same way
+    as the original <estimate_sampling_interval>.
+    """
+    differences_sorted = np.sort(np.diff(times))
+    interquartile_data = differences_sorted[int(len(differences_sorted) * 0.25):int(len(differences_sorted) * 0.75)]
+    return round(np.mean(interquartile_data) * 86400) / 86400
+
+
+def reference_to_fixed_step(times, fluxes, spacing, abs_tol=1e-4):
+    """
+    Sample a lightcurve on a fixed time step, filling gaps with ones, in the same way as the original
+    <to_fixed_step>. Returns the fluxes, and a mask of the time points which were gaps.
+    """
+    raster = np.arange(start=times[0], stop=times[-1], step=spacing)
+    output = np.zeros_like(raster)
+    gaps = np.zeros(len(raster), dtype=bool)
+    input_position = 0
+    for index, time in enumerate(raster):
+        closest_time_point = [times[input_position], fluxes[input_position]]
+        while ((not math.isclose(time, times[input_position], abs_tol=abs_tol, rel_tol=0)) and
+               (time > times[input_position])):
+            if abs(times[input_position] - time) < abs(closest_time_point[0] - time):
+                closest_time_point = [times[input_position], fluxes[input_position]]
+            input_position += 1
+        if abs(times[input_position] - time) < abs(closest_time_point[0] - time):
+            closest_time_point = [times[input_position], fluxes[input_position]]
+        if math.isclose(time, times[input_position], abs_tol=abs_tol, rel_tol=0):
+            output[index] = closest_time_point[1]
+            continue
+        gaps[index] = True
+        output[index] = 1
+    return output, gaps
+
+
+def example_times():
+    """
+    A 25-second raster with missing samples, a run of samples shifted by half a step, and a little jitter.
+    """
+    rng = np.random.default_rng(0)
+    times = np.arange(60000) * 25 / 86400
+    times[30000:] += 12.5 / 86400
+    times += rng.normal(scale=1e-6, size=len(times))
+    keep = np.ones(len(times), dtype=bool)
+    keep[1000:1010] = False
+    keep[45000:45003] = False
+    return times[keep]
+
+
+class TestGapAnalysis(unittest.TestCase):
+    def test_matches_reference(self):
+        times = example_times()
+        lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+        spacing = lc.estimate_sampling_interval()
+        gaps = lc.analyse_gaps(spacing=spacing)
+        self.assertEqual(int(np.count_nonzero(gaps['step_error'])), reference_check_fixed_step(times, spacing))
+        self.assertEqual(int(np.sum(gaps['missing_count'])), reference_check_fixed_step_v2(times, spacing))
+
+    def test_chunks_share_raster(self):
+        times = example_times()
+        spacing = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times)).estimate_sampling_interval()
+        expected = reference_check_fixed_step_v2(times, spacing)
+
+        for chunk_length in (1000, 7777, 29999, 100000):
+            missing_count = 0
+            for start in range(0, len(times) - 1, chunk_length):
+                # Each chunk starts with the last sample of the previous one, as in the chunked <verify> task
+                chunk_times = times[start:start + chunk_length + 1]
+                chunk = LightcurveArbitraryRaster(times=chunk_times, fluxes=np.ones_like(chunk_times))
+                gaps = chunk.analyse_gaps(spacing=spacing, raster_origin=times[0])
+                missing_count += int(np.sum(gaps['missing_count']))
+            self.assertEqual(missing_count, expected, "chunk length {}".format(chunk_length))
+
+
+class TestSamplingInterval(unittest.TestCase):
+    def test_matches_reference(self):
+        rng = np.random.default_rng(2)
+        for length in (3, 4, 10, 1001):
+            for times in (example_times()[:length], np.cumsum(rng.uniform(10, 40, size=length)) / 86400):
+                lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+                self.assertEqual(lc.estimate_sampling_interval(), reference_estimate_sampling_interval(times), length)
+        times = example_times()
+        lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+        self.assertEqual(lc.estimate_sampling_interval(), reference_estimate_sampling_interval(times))
+
+
+class TestFixedStepChecks(unittest.TestCase):
+    def test_matches_reference(self):
+        times = example_times()
+        lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+        spacing = lc.estimate_sampling_interval()
+        for verbose in (False, True):
+            self.assertEqual(lc.check_fixed_step(verbose=verbose), reference_check_fixed_step(times, spacing))
+            self.assertEqual(lc.check_fixed_step_v2(verbose=verbose), reference_check_fixed_step_v2(times, spacing))
+
+    def test_regular_raster(self):
+        times = 0.3 + np.arange(10000) * 25 / 86400
+        lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+        self.assertEqual(lc.check_fixed_step(verbose=False), 0)
+        self.assertEqual(lc.check_fixed_step_v2(verbose=False), 0)
+
+    def test_max_errors(self):
+        times = example_times()
+        lc = LightcurveArbitraryRaster(times=times, fluxes=np.ones_like(times))
+        with self.assertLogs(level='INFO') as logs:
+            lc.check_fixed_step(verbose=True, max_errors=2)
+        self.assertEqual(sum('points missing' in line or 'Unexpected time step' in line for line in logs.output), 2)
+
+
+class TestToFixedStep(unittest.TestCase):
+    def test_matches_reference(self):
+        times = example_times()
+        fluxes = 1 + 1e-3 * np.random.default_rng(1).normal(size=len(times))
+        lc = LightcurveArbitraryRaster(times=times, fluxes=fluxes)
+        expected_fluxes, expected_gaps = reference_to_fixed_step(times, fluxes, lc.estimate_sampling_interval())
+
+        fixed = lc.to_fixed_step(verbose=False)
+        self.assertEqual(fixed.time_start, times[0])
+        self.assertEqual(fixed.time_step, lc.estimate_sampling_interval())
+        self.assertTrue(np.array_equal(fixed.fluxes, expected_fluxes))
+        self.assertTrue(np.array_equal(fixed.gap_mask, expected_gaps))
+
+        # Interpolated gaps differ from the original only in the gaps
+        interpolated = lc.to_fixed_step(verbose=False, fill_strategy='interpolate')
+        self.assertTrue(np.array_equal(interpolated.fluxes[~expected_gaps], expected_fluxes[~expected_gaps]))
+        raster = times[0] + np.arange(len(expected_gaps)) * fixed.time_step
+        self.assertTrue(np.allclose(interpolated.fluxes[expected_gaps],
+                                    np.interp(x=raster[expected_gaps], xp=times, fp=fluxes), rtol=1e-12, atol=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# test_lightcurve_resample.py
+
+"""
+Test that resampling lightcurves, with reusable plans, gives the same results as the original implementation, which
+interpolated the integral of each column separately.
+"""
+
+import gc
+import unittest
+import weakref
+
+import numpy as np
+
+from plato_wp36.lc_batch import LightcurveBatch
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+from plato_wp36.lightcurve_resample import LightcurveResampler, ResamplingPlan, _integer_ratio_layout, resample_stream
+
+
+def reference_resample(x_new, x_in, y_in):
+    """
+    Resample a column of data onto a new raster of times, in the same way as the original
+    <LightcurveResampler._resample>.
+    """
+    x_in_pixel_start_times = LightcurveResampler._pixel_start_times(x_in)
+    x_in_pixel_width = LightcurveResampler._pixel_widths(x_in_pixel_start_times)
+    x_new_pixel_start_times = LightcurveResampler._pixel_start_times(x_new)
+    x_new_pixel_width = LightcurveResampler._pixel_widths(x_new_pixel_start_times)
+    x_in_integrated = np.cumsum(np.insert(y_in * x_in_pixel_width, 0, 0))
+    return (np.interp(xp=x_in_pixel_start_times, fp=x_in_integrated, x=x_new_pixel_start_times[1:]) -
+            np.interp(xp=x_in_pixel_start_times, fp=x_in_integrated, x=x_new_pixel_start_times[:-1])
+            ) / x_new_pixel_width
+
+
+def reference_quadrature(uncertainties, ratio, first_centre, output_length):
+    # Each output pixel is the mean of the input pixels it covers, with those split by its edges given half weight, so
+    # its uncertainty is the root sum of squares of the weighted uncertainties, divided by <ratio>
+    output = np.zeros(output_length)
+    for index in range(output_length):
+        centre = first_centre + index * ratio
+        for offset in range(-(ratio // 2), ratio // 2 + 1):
+            weight = 0.5 if ratio % 2 == 0 and abs(offset) == ratio // 2 else 1
+            if 0 <= centre + offset < len(uncertainties):
+                output[index] += (weight * uncertainties[centre + offset]) ** 2
+    return np.sqrt(output) / ratio
+
+
+def example_lightcurve(times, seed=0):
+    rng = np.random.default_rng(seed)
+    return LightcurveArbitraryRaster(times=times,
+                                     fluxes=1 + 1e-3 * rng.normal(size=len(times)),
+                                     uncertainties=1e-3 * rng.random(len(times)),
+                                     flags=(rng.random(len(times)) < 0.05).astype(float))
+
+
+def irregular_times(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.uniform(10, 40, size=length)) / 86400
+
+
+class TestResamplingPlan(unittest.TestCase):
+    def assert_close(self, actual, expected, message=None):
+        self.assertTrue(np.allclose(actual, expected, rtol=1e-10, atol=1e-14), message)
+
+    def test_matches_reference(self):
+        input_raster = irregular_times(200000)
+        lc = example_lightcurve(input_raster)
+        for output_raster in (np.linspace(input_raster[0] - 0.1, input_raster[-1] + 0.1, 5000),
+                              irregular_times(20000, seed=1) * 5,
+                              input_raster[::7]):
+            plan = ResamplingPlan(input_raster=input_raster, output_raster=output_raster)
+            resampled = LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster, plan=plan)
+            for name in ('fluxes', 'uncertainties', 'flags'):
+                expected = reference_resample(x_new=output_raster, x_in=input_raster, y_in=getattr(lc, name))
+                self.assert_close(plan.apply(values=getattr(lc, name)), expected, name)
+                if name != 'flags':
+                    self.assert_close(getattr(resampled, name), expected, name)
+            expected_mask = reference_resample(x_new=output_raster, x_in=input_raster, y_in=lc.flags) > 0.5
+            self.assertTrue(np.array_equal(resampled.mask, expected_mask))
+
+    def test_columns_resampled_together(self):
+        input_raster = irregular_times(100000)
+        output_raster = np.linspace(input_raster[0], input_raster[-1], 3000)
+        lc = example_lightcurve(input_raster)
+        plan = ResamplingPlan(input_raster=input_raster, output_raster=output_raster)
+        columns = [lc.fluxes, lc.uncertainties, lc.flags]
+        for block_length in (100, 4096, 1000000):
+            for values, column in zip(plan.apply_columns(columns=columns, block_length=block_length), columns):
+                self.assert_close(values, reference_resample(x_new=output_raster, x_in=input_raster, y_in=column))
+
+    def test_batch_shares_plan(self):
+        input_raster = irregular_times(20000)
+        output_raster = np.linspace(input_raster[0], input_raster[-1], 1000)
+        lightcurves = [example_lightcurve(input_raster, seed=seed) for seed in range(4)]
+        batch = LightcurveBatch.from_lightcurves(lightcurves).onto_raster(output_raster=output_raster)
+        for lc, fluxes in zip(lightcurves, batch.fluxes):
+            self.assert_close(fluxes, reference_resample(x_new=output_raster, x_in=input_raster, y_in=lc.fluxes))
+
+    def test_mismatched_plan_rejected(self):
+        input_raster = irregular_times(10000)
+        output_raster = np.linspace(input_raster[0], input_raster[-1], 500)
+        lc = example_lightcurve(input_raster)
+        resampler = LightcurveResampler(input_lc=lc)
+        plan = ResamplingPlan(input_raster=input_raster, output_raster=output_raster)
+
+        # Rasters of the same length as the ones the plan was made for
+        with self.assertRaises(AssertionError):
+            resampler.onto_raster(output_raster=output_raster + 3.3 / 86400, plan=plan)
+        with self.assertRaises(AssertionError):
+            LightcurveResampler(input_lc=example_lightcurve(input_raster + 1e-3)).onto_raster(
+                output_raster=output_raster, plan=plan)
+
+        # Equal rasters are accepted, even if they are different arrays
+        resampled = resampler.onto_raster(output_raster=output_raster.copy(), plan=plan)
+        self.assert_close(resampled.fluxes, reference_resample(x_new=output_raster, x_in=input_raster,
+                                                               y_in=lc.fluxes))
+
+    def test_rasters_not_retained(self):
+        # Resampling must not keep the rasters alive after the call, or reuse results for different rasters which
+        # happen to occupy the same memory
+        input_raster = irregular_times(10000)
+        output_raster = np.linspace(input_raster[0], input_raster[-1], 500)
+        lc = example_lightcurve(input_raster)
+        LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster)
+        output_reference = weakref.ref(output_raster)
+        del output_raster
+        gc.collect()
+        self.assertIsNone(output_reference())
+
+        output_raster = np.linspace(input_raster[0], input_raster[-1], 500)
+        first = LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster)
+        output_raster[:] = np.linspace(input_raster[0], input_raster[-1] / 2, 500)
+        second = LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster)
+        self.assert_close(second.fluxes, reference_resample(x_new=output_raster, x_in=input_raster, y_in=lc.fluxes))
+        self.assertFalse(np.allclose(first.fluxes, second.fluxes))
+
+
+class TestBlockRebinning(unittest.TestCase):
+    def assert_close(self, actual, expected, message=None):
+        self.assertTrue(np.allclose(actual, expected, rtol=1e-8, atol=1e-12), message)
+
+    def test_matches_interpolation(self):
+        step = 25 / 86400
+        input_raster = 0.3 + np.arange(100000) * step
+        lc = example_lightcurve(input_raster)
+        for ratio in (1, 2, 3, 24, 25):
+            for first_centre in (-7, 0, 5, 40):
+                output_length = (len(input_raster) - first_centre) // ratio
+                output_raster = input_raster[0] + (first_centre + np.arange(output_length) * ratio) * step
+                self.assertEqual(_integer_ratio_layout(input_raster=input_raster, output_raster=output_raster),
+                                 (ratio, first_centre))
+                message = "ratio {} first centre {}".format(ratio, first_centre)
+
+                # Without a plan, the fast path sums blocks of samples; with one, the integrated flux is interpolated
+                resampler = LightcurveResampler(input_lc=lc)
+                fast = resampler.onto_raster(output_raster=output_raster)
+                interpolated = resampler.onto_raster(output_raster=output_raster,
+                                                     plan=ResamplingPlan(input_raster=input_raster,
+                                                                         output_raster=output_raster))
+                for name in ('fluxes', 'uncertainties'):
+                    expected = reference_resample(x_new=output_raster, x_in=input_raster, y_in=getattr(lc, name))
+                    self.assert_close(getattr(fast, name), getattr(interpolated, name), "{} {}".format(name, message))
+                    self.assert_close(getattr(fast, name), expected, "{} {}".format(name, message))
+
+                # Flags are only compared where the resampled flag is not too close to the threshold to call
+                expected_flags = reference_resample(x_new=output_raster, x_in=input_raster, y_in=lc.flags)
+                clear = np.abs(expected_flags - 0.5) > 1e-6
+                self.assertTrue(np.array_equal(fast.mask[clear], expected_flags[clear] > 0.5), message)
+                self.assertTrue(np.array_equal(fast.mask[clear], interpolated.mask[clear]), message)
+
+    def test_quadrature(self):
+        step = 25 / 86400
+        input_raster = 0.3 + np.arange(2000) * step
+        lc = example_lightcurve(input_raster)
+        for ratio in (2, 3, 24, 25):
+            for first_centre in (-7, 0, 5, 40):
+                output_length = (len(input_raster) - first_centre) // ratio
+                output_raster = input_raster[0] + (first_centre + np.arange(output_length) * ratio) * step
+                message = "ratio {} first centre {}".format(ratio, first_centre)
+
+                resampler = LightcurveResampler(input_lc=lc)
+                averaged = resampler.onto_raster(output_raster=output_raster)
+                combined = resampler.onto_raster(output_raster=output_raster, quadrature_uncertainties=True)
+                self.assert_close(combined.uncertainties,
+                                  reference_quadrature(uncertainties=lc.uncertainties, ratio=ratio,
+                                                       first_centre=first_centre, output_length=output_length),
+                                  message)
+                self.assertTrue(np.array_equal(combined.fluxes, averaged.fluxes), message)
+                self.assertTrue(np.array_equal(combined.mask, averaged.mask), message)
+
+        # With an odd ratio, and output pixels which lie within the input, the blocks are disjoint
+        output_raster = input_raster[12::25]
+        combined = LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster,
+                                                                 quadrature_uncertainties=True)
+        self.assert_close(combined.uncertainties,
+                          np.sqrt(np.sum(lc.uncertainties.reshape((-1, 25)) ** 2, axis=1)) / 25)
+
+
+class TestStreamingResampler(unittest.TestCase):
+    def assert_close(self, actual, expected, message=None):
+        self.assertTrue(np.allclose(actual, expected, rtol=1e-8, atol=1e-12), message)
+
+    def check_against_reference(self, lc, step, chunk_length):
+        message = "step {} chunk length {}".format(step * 86400, chunk_length)
+        chunks = (LightcurveArbitraryRaster(times=lc.times[start:start + chunk_length],
+                                            fluxes=lc.fluxes[start:start + chunk_length],
+                                            uncertainties=lc.uncertainties[start:start + chunk_length],
+                                            flags=lc.flags[start:start + chunk_length])
+                  for start in range(0, len(lc.times), chunk_length))
+        output = list(resample_stream(chunks=chunks, step=step))
+
+        # The output raster is the one the original rebinning task used
+        output_raster = np.arange(np.min(lc.times), np.max(lc.times), step)
+        self.assertTrue(np.array_equal(np.concatenate([item.times for item in output]), output_raster), message)
+        for name in ('fluxes', 'uncertainties'):
+            self.assert_close(np.concatenate([getattr(item, name) for item in output]),
+                              reference_resample(x_new=output_raster, x_in=lc.times, y_in=getattr(lc, name)),
+                              "{} {}".format(name, message))
+
+        expected_flags = reference_resample(x_new=output_raster, x_in=lc.times, y_in=lc.flags)
+        clear = np.abs(expected_flags - 0.5) > 1e-6
+        mask = np.concatenate([item.mask for item in output])
+        self.assertTrue(np.array_equal(mask[clear], expected_flags[clear] > 0.5), message)
+
+    def test_fixed_step(self):
+        lc = example_lightcurve(0.3 + np.arange(100000) * 25 / 86400)
+        for step in (75, 600, 60):
+            for chunk_length in (999, 7777, 100000):
+                self.check_against_reference(lc=lc, step=step / 86400, chunk_length=chunk_length)
+
+    def test_with_gaps(self):
+        times = 0.3 + np.arange(100000) * 25 / 86400
+        keep = np.ones(len(times), dtype=bool)
+        keep[30000:30100] = False
+        keep[60001] = False
+        lc = example_lightcurve(times[keep])
+        for step in (75, 600, 60):
+            for chunk_length in (999, 30000, 100000):
+                self.check_against_reference(lc=lc, step=step / 86400, chunk_length=chunk_length)
+
+    def test_quadrature(self):
+        lc = example_lightcurve(0.3 + np.arange(100000) * 25 / 86400)
+        for step in (75, 600, 60):
+            output_raster = np.arange(np.min(lc.times), np.max(lc.times), step / 86400)
+            expected = LightcurveResampler(input_lc=lc).onto_raster(output_raster=output_raster,
+                                                                    quadrature_uncertainties=True)
+            for chunk_length in (999, 100000):
+                message = "step {} chunk length {}".format(step, chunk_length)
+                chunks = (LightcurveArbitraryRaster(times=lc.times[start:start + chunk_length],
+                                                    fluxes=lc.fluxes[start:start + chunk_length],
+                                                    uncertainties=lc.uncertainties[start:start + chunk_length],
+                                                    flags=lc.flags[start:start + chunk_length])
+                          for start in range(0, len(lc.times), chunk_length))
+                output = list(resample_stream(chunks=chunks, step=step / 86400, quadrature_uncertainties=True))
+                for name in ('fluxes', 'uncertainties'):
+                    self.assert_close(np.concatenate([getattr(item, name) for item in output]),
+                                      getattr(expected, name), "{} {}".format(name, message))
+
+    def test_irregular(self):
+        lc = example_lightcurve(irregular_times(50000))
+        for chunk_length in (999, 50000):
+            self.check_against_reference(lc=lc, step=600 / 86400, chunk_length=chunk_length)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# test_lightcurve_views.py
+
+"""
+Test that time windows of lightcurves, which are views of the original arrays, select the same samples as the
+boolean-mask selection that they replace, and that lightcurves which share arrays cannot modify them underneath one
+another.
+"""
+
+import unittest
+
+import numpy as np
+
+from plato_wp36.lightcurve import LightcurveArbitraryRaster, LightcurveFixedStep
+
+
+def reference_window(times, t_start, t_end):
+    """
+    Select the samples within a time window, t_start <= t < t_end, with a boolean mask.
+    """
+    selection = np.ones(len(times), dtype=bool)
+    if t_start is not None:
+        selection &= times >= t_start
+    if t_end is not None:
+        selection &= times < t_end
+    return selection
+
+
+def example_windows(times):
+    """
+    Time windows which start and end before, after, on and between the samples of a lightcurve.
+    """
+    step = times[1] - times[0]
+    edges = [None, times[0] - 1, times[0], times[0] + step / 2, times[10], times[-1], times[-1] + step, times[-1] + 1]
+    return [(t_start, t_end) for t_start in edges for t_end in edges]
+
+
+class TestArbitraryRasterWindow(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        times = np.cumsum(rng.uniform(10, 40, size=5000)) / 86400
+        self.lc = LightcurveArbitraryRaster(times=times, fluxes=rng.normal(size=len(times)),
+                                            uncertainties=rng.random(len(times)),
+                                            flags=(rng.random(len(times)) < 0.05).astype(float),
+                                            metadata={'mes': 1})
+
+    def test_matches_reference(self):
+        for t_start, t_end in example_windows(self.lc.times):
+            message = "{} {}".format(t_start, t_end)
+            selection = reference_window(times=self.lc.times, t_start=t_start, t_end=t_end)
+            window = self.lc.window(t_start=t_start, t_end=t_end)
+            for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+                self.assertTrue(np.array_equal(getattr(window, name), getattr(self.lc, name)[selection]),
+                                "{} {}".format(name, message))
+            self.assertIs(window.metadata, self.lc.metadata, message)
+
+    def test_views(self):
+        window = self.lc.window(t_start=self.lc.times[100], t_end=self.lc.times[200])
+        self.assertEqual(len(window.times), 100)
+        for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+            self.assertTrue(np.shares_memory(getattr(window, name), getattr(self.lc, name)), name)
+            self.assertFalse(getattr(window, name).flags.writeable, name)
+
+    def test_lc_duration(self):
+        # The truncation used by the transit search task
+        lc_duration = 0.5
+        window = self.lc.window(t_start=self.lc.times[0], t_end=self.lc.times[0] + lc_duration)
+        self.assertTrue(np.array_equal(window.times, self.lc.times[self.lc.times < self.lc.times[0] + lc_duration]))
+
+
+class TestFixedStepWindow(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        length = 5000
+        gap_mask = np.zeros(length, dtype=bool)
+        gap_mask[1000:1100] = True
+        self.lc = LightcurveFixedStep(time_start=0.3, time_step=25 / 86400, fluxes=rng.normal(size=length),
+                                      uncertainties=rng.random(length),
+                                      flags=(rng.random(length) < 0.05).astype(float), gap_mask=gap_mask)
+        self.times = np.array([self.lc.time_value(index) for index in range(length)])
+
+    def test_matches_reference(self):
+        for t_start, t_end in example_windows(self.times):
+            message = "{} {}".format(t_start, t_end)
+            selection = reference_window(times=self.times, t_start=t_start, t_end=t_end)
+            window = self.lc.window(t_start=t_start, t_end=t_end)
+            window_times = np.array([window.time_value(index) for index in range(len(window.fluxes))])
+            self.assertTrue(np.allclose(window_times, self.times[selection], rtol=0, atol=1e-9), message)
+            for name in ('fluxes', 'uncertainties', 'flags', 'gap_mask'):
+                self.assertTrue(np.array_equal(getattr(window, name), getattr(self.lc, name)[selection]),
+                                "{} {}".format(name, message))
+
+    def test_views(self):
+        window = self.lc.window(t_start=self.times[100], t_end=self.times[200])
+        self.assertEqual(len(window.fluxes), 100)
+        self.assertEqual(window.time_start, self.times[100])
+        for name in ('fluxes', 'uncertainties', 'flags', 'gap_mask'):
+            self.assertTrue(np.shares_memory(getattr(window, name), getattr(self.lc, name)), name)
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.times = 0.3 + np.arange(5000) * 25 / 86400
+        self.fluxes = 1 + 1e-3 * rng.normal(size=len(self.times))
+        self.lc = LightcurveArbitraryRaster(times=self.times, fluxes=self.fluxes, metadata={'mes': 1})
+
+    def test_arrays_read_only(self):
+        for name in ('times', 'fluxes', 'uncertainties', 'flags'):
+            with self.assertRaises(ValueError):
+                getattr(self.lc, name)[0] = 0
+
+        # The arrays passed to the constructor stay writable for their creator
+        self.assertTrue(self.fluxes.flags.writeable)
+        self.assertTrue(np.shares_memory(self.lc.fluxes, self.fluxes))
+
+    def test_copy_on_write(self):
+        copy = self.lc.copy_on_write()
+        self.assertTrue(np.shares_memory(copy.fluxes, self.lc.fluxes))
+        self.assertIsNot(copy.metadata, self.lc.metadata)
+
+        fluxes = copy.writable('fluxes')
+        self.assertFalse(np.shares_memory(fluxes, self.lc.fluxes))
+        self.assertIs(copy.writable('fluxes'), fluxes)
+        self.assertIs(copy.fluxes, fluxes)
+        self.assertTrue(np.shares_memory(copy.flags, self.lc.flags))
+
+    def test_median_subtraction(self):
+        # The modification made by the bls_kovacs wrapper, which originally subtracted the median from the fluxes of
+        # the input lightcurve in place
+        window = self.lc.window(t_start=self.times[0], t_end=self.times[0] + 0.5)
+        for lc in (self.lc, window):
+            before = np.array(lc.fluxes)
+            copy = lc.copy_on_write()
+            flux = copy.writable('fluxes')
+            flux -= np.median(flux)
+            self.assertTrue(np.array_equal(flux, before - np.median(before)))
+            self.assertTrue(np.array_equal(lc.fluxes, before))
+            self.assertTrue(np.array_equal(self.lc.fluxes, self.fluxes))
+
+    def test_creator_cannot_modify_shared_arrays(self):
+        # Once a lightcurve hands out views of its arrays, they are no longer writable by anyone
+        lc = self.lc.add(other=LightcurveArbitraryRaster(times=self.times, fluxes=np.zeros_like(self.times),
+                                                         metadata={'mes': 0}))
+        self.assertTrue(lc.fluxes.flags.writeable)
+        window = lc.window(t_start=self.times[100])
+        self.assertFalse(lc.fluxes.flags.writeable)
+        self.assertFalse(window.fluxes.flags.writeable)
+
+    def test_fixed_step(self):
+        # The modification made by the qats wrapper, to the fixed-step version of the input lightcurve
+        lc_fixed_step = self.lc.to_fixed_step(verbose=False)
+        window = lc_fixed_step.window(t_end=self.times[1000])
+        before = np.array(lc_fixed_step.fluxes)
+        fluxes = window.copy_on_write().writable('fluxes')
+        fluxes -= np.median(fluxes)
+        fluxes /= np.std(fluxes)
+        self.assertTrue(np.array_equal(lc_fixed_step.fluxes, before))
+        self.assertTrue(np.array_equal(lc_fixed_step.fluxes, self.fluxes[:len(before)]))
+        with self.assertRaises(ValueError):
+            lc_fixed_step.gap_mask[0] = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# test_task_runner.py
+
+"""
+Test that the lightcurve arithmetic tasks reuse the arrays of their inputs to hold the result when nothing else can see
+them change, and never otherwise.
+"""
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+from plato_wp36.settings import settings
+
+# The task runner needs the message queue, database and transit-detection packages installed in our Docker containers
+try:
+    from plato_wp36.task_runner import TaskRunner
+except ImportError:
+    TaskRunner = None
+
+
+def example_lightcurve(seed, mes=0):
+    times = 0.3 + np.arange(2000) * 25 / 86400
+    rng = np.random.default_rng(seed)
+    return LightcurveArbitraryRaster(times=times,
+                                     fluxes=1 + 1e-3 * rng.normal(size=len(times)),
+                                     uncertainties=1e-3 * rng.random(len(times)),
+                                     flags=(rng.random(len(times)) < 0.05).astype(float),
+                                     metadata={'mes': mes})
+
+
+@unittest.skipIf(TaskRunner is None, "The task runner's dependencies are not installed")
+class TestLightcurveExpressionTask(unittest.TestCase):
+    def setUp(self):
+        self.lc_path = settings['lcPath']
+        settings['lcPath'] = tempfile.mkdtemp()
+        self.task_runner = TaskRunner(results_target="logging")
+
+    def tearDown(self):
+        shutil.rmtree(settings['lcPath'])
+        settings['lcPath'] = self.lc_path
+
+    def store(self, name, lightcurve):
+        self.task_runner.write_lightcurve(lightcurve=lightcurve, target={'filename': name})
+
+    def stored(self, name):
+        return self.task_runner.lightcurves_in_memory['test_lightcurves'][name]
+
+    def test_file_input_reused(self):
+        original = example_lightcurve(seed=0)
+        original.to_file(directory='test_lightcurves', filename='a.bin', binary=True)
+        self.store('b', example_lightcurve(seed=1))
+
+        # Keep hold of the lightcurve the task reads from the file
+        read = []
+        from_file = LightcurveArbitraryRaster.from_file
+
+        def read_and_keep(**kwargs):
+            read.append(from_file(**kwargs))
+            return read[-1]
+
+        with mock.patch.object(LightcurveArbitraryRaster, 'from_file', side_effect=read_and_keep):
+            self.task_runner.lightcurves_multiply(job_name='test', input_1={'source': 'archive', 'filename': 'a.bin'},
+                                                  input_2={'filename': 'b'}, output={'filename': 'c'})
+
+        self.assertTrue(np.shares_memory(self.stored('c').fluxes, read[0].fluxes))
+        self.assertTrue(np.allclose(self.stored('c').fluxes, original.multiply(other=self.stored('b')).fluxes,
+                                    rtol=1e-12, atol=0))
+
+    def test_memory_input_replaced(self):
+        self.store('a', example_lightcurve(seed=0).add(other=example_lightcurve(seed=1)))
+        self.store('b', example_lightcurve(seed=2))
+        a = self.stored('a')
+        expected = a.multiply(other=self.stored('b'))
+        buffers = (a.fluxes, a.uncertainties, a.flags)
+
+        self.task_runner.lightcurves_multiply(job_name='test', input_1={'filename': 'a'}, input_2={'filename': 'b'},
+                                              output={'filename': 'a'})
+        for column, buffer in zip(('fluxes', 'uncertainties', 'flags'), buffers):
+            self.assertTrue(np.shares_memory(getattr(self.stored('a'), column), buffer), column)
+            self.assertTrue(np.allclose(getattr(self.stored('a'), column), getattr(expected, column),
+                                        rtol=1e-12, atol=0), column)
+
+    def test_memory_input_kept(self):
+        # Lightcurves held in memory are not overwritten if they remain there, or are shared with other lightcurves
+        self.store('a', example_lightcurve(seed=0).add(other=example_lightcurve(seed=1)))
+        self.store('b', example_lightcurve(seed=2))
+        a = self.stored('a')
+        fluxes = np.array(a.fluxes)
+        self.task_runner.lightcurves_multiply(job_name='test', input_1={'filename': 'a'}, input_2={'filename': 'b'},
+                                              output={'filename': 'c'})
+        self.assertIs(self.stored('a'), a)
+        self.assertTrue(np.array_equal(a.fluxes, fluxes))
+        self.assertFalse(np.shares_memory(self.stored('c').fluxes, a.fluxes))
+
+        window = a.window(t_start=a.times[10])
+        self.task_runner.lightcurves_multiply(job_name='test', input_1={'filename': 'a'}, input_2={'filename': 'b'},
+                                              output={'filename': 'a'})
+        self.assertTrue(np.array_equal(window.fluxes, fluxes[10:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+#!../../../../datadir_local/virtualenv/bin/python3
+# -*- coding: utf-8 -*-
+# benchmark_lc_codecs.py
+
+"""
+Benchmark the file size, and the encoding and decoding speed, of each of the formats in which lightcurves can be stored
+in our lightcurve archive.
+"""
+
+import logging
+import os
+import shutil
+import time
+
+import argparse
+import numpy as np
+from plato_wp36 import settings
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+
+# The formats we benchmark, as dictionaries of arguments to <LightcurveArbitraryRaster.to_file>
+formats = [
+    ("text, gzip", {'binary': False, 'gzipped': True}),
+    ("columnar, explicit times", {'binary': True, 'implicit_time': False}),
+    ("columnar, implicit times", {'binary': True}),
+    ("columnar, implicit times, float32", {'binary': True, 'float32': True}),
+    ("zlib -1", {'binary': True, 'codec': 'zlib', 'codec_level': 1, 'shuffle': False}),
+    ("zlib -1, shuffle", {'binary': True, 'codec': 'zlib', 'codec_level': 1}),
+    ("zlib -6", {'binary': True, 'codec': 'zlib', 'codec_level': 6, 'shuffle': False}),
+    ("zlib -6, shuffle", {'binary': True, 'codec': 'zlib', 'codec_level': 6}),
+    ("zlib -9, shuffle", {'binary': True, 'codec': 'zlib', 'codec_level': 9}),
+    ("lzma, shuffle", {'binary': True, 'codec': 'lzma'}),
+    ("bz2, shuffle", {'binary': True, 'codec': 'bz2'}),
+    ("zlib -1, shuffle, float32", {'binary': True, 'codec': 'zlib', 'codec_level': 1, 'float32': True})
+]
+
+
+def synthesise_lightcurve(duration, cadence):
+    """
+    Synthesise a stand-in for a PSLS lightcurve, on a fixed time raster, with white noise at the PLATO noise-to-signal
+    ratio of 73 ppm/hr, plus slowly-varying red noise. Fluxes are rounded to 1e-4 ppm, as real data have finite
+    precision.
+
+    :param duration:
+        The duration of the lightcurve (days).
+    :type duration:
+        float
+    :param cadence:
+        The time step of the lightcurve (seconds).
+    :type cadence:
+        float
+    :return:
+        LightcurveArbitraryRaster
+    """
+    rng = np.random.default_rng(0)
+    times = np.arange(0, duration * 86400, cadence)
+    white_noise = rng.normal(scale=73 * np.sqrt(3600 / cadence), size=len(times))
+    red_noise = np.convolve(rng.normal(scale=20, size=len(times)), np.ones(1000) / np.sqrt(1000), mode='same')
+    fluxes_ppm = np.round(white_noise + red_noise, 4)
+
+    return LightcurveArbitraryRaster(times=times / 86400,
+                                     fluxes=1 + 1e-6 * fluxes_ppm,
+                                     uncertainties=np.zeros_like(times),
+                                     flags=np.zeros_like(times),
+                                     metadata={'duration': duration, 'cadence': cadence})
+
+
+def benchmark_codecs(lightcurve, repeats):
+    """
+    Write a lightcurve to disk in each of our formats, and read it back again, timing each operation.
+
+    :param lightcurve:
+        The lightcurve to benchmark.
+    :type lightcurve:
+        LightcurveArbitraryRaster
+    :param repeats:
+        The number of times to repeat each operation; we report the fastest.
+    :type repeats:
+        int
+    """
+    directory = "benchmark_lc_codecs"
+    filename = "lightcurve.dat"
+    file_path = os.path.join(settings.settings['lcPath'], directory, filename)
+
+    # Compression ratios are quoted relative to the size of the lightcurve's arrays in memory
+    raw_size = sum(column.nbytes for column in (lightcurve.times, lightcurve.fluxes,
+                                                lightcurve.flags, lightcurve.uncertainties))
+
+    print("| Format | Size (MB) | Compression ratio | Encode (sec) | Decode (sec) |")
+    print("|---|---|---|---|---|")
+
+    for name, arguments in formats:
+        encode_time = decode_time = np.inf
+        for repeat in range(repeats):
+            start_time = time.time()
+            lightcurve.to_file(directory=directory, filename=filename, **arguments)
+            encode_time = min(encode_time, time.time() - start_time)
+
+            # Touch every sample, so that memory-mapped files are actually read from disk
+            start_time = time.time()
+            lc = LightcurveArbitraryRaster.from_file(directory=directory, filename=filename)
+            for column in (lc.times, lc.fluxes, lc.flags, lc.uncertainties):
+                np.sum(column)
+            decode_time = min(decode_time, time.time() - start_time)
+
+        # Check the lightcurve survived the round trip (single-precision storage is lossy)
+        assert np.allclose(lc.times, lightcurve.times, rtol=0, atol=1e-9)
+        assert np.allclose(lc.fluxes, lightcurve.fluxes, rtol=0, atol=1e-6 if arguments.get('float32', False) else 0)
+
+        file_size = os.path.getsize(file_path)
+        print("| {} | {:.1f} | {:.2f} | {:.2f} | {:.2f} |".format(
+            name, file_size / 1e6, raw_size / file_size, encode_time, decode_time))
+
+    shutil.rmtree(os.path.join(settings.settings['lcPath'], directory))
+
+
+if __name__ == "__main__":
+    # Read command-line arguments
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--directory', default=None, type=str, dest='directory',
+                        help="The directory within the lightcurve archive containing a lightcurve to benchmark")
+    parser.add_argument('--filename', default=None, type=str, dest='filename',
+                        help="The filename of a lightcurve to benchmark. If not set, a synthetic lightcurve is used.")
+    parser.add_argument('--duration', default=730, type=float, dest='duration',
+                        help="The duration of the synthetic lightcurve (days)")
+    parser.add_argument('--cadence', default=25, type=float, dest='cadence',
+                        help="The time step of the synthetic lightcurve (seconds)")
+    parser.add_argument('--repeats', default=3, type=int, dest='repeats',
+                        help="The number of times to repeat each measurement")
+    args = parser.parse_args()
+
+    # Set up logging
+    log_file_path = os.path.join(settings.settings['dataPath'], 'plato_wp36.log')
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s:%(filename)s:%(message)s',
+                        datefmt='%d/%m/%Y %H:%M:%S',
+                        handlers=[
+                            logging.FileHandler(log_file_path),
+                            logging.StreamHandler()
+                        ])
+    logger = logging.getLogger(__name__)
+    logger.info(__doc__.strip())
+
+    # Fetch the lightcurve to benchmark
+    if args.filename is not None:
+        input_lc = LightcurveArbitraryRaster.from_file(directory=args.directory, filename=args.filename)
+    else:
+        input_lc = synthesise_lightcurve(duration=args.duration, cadence=args.cadence)
+
+    # Run benchmark
+    benchmark_codecs(lightcurve=input_lc, repeats=args.repeats)
@@ -0,0 +1,120 @@
+#!../../../../datadir_local/virtualenv/bin/python3
+# -*- coding: utf-8 -*-
+# benchmark_lc_operations.py
+
+"""
+Benchmark the speed of the operations which are performed on every lightcurve before a transit search.
+"""
+
+import logging
+import os
+import time
+
+import argparse
+import numpy as np
+from plato_wp36 import settings
+from plato_wp36.lightcurve import LightcurveArbitraryRaster
+
+from benchmark_lc_codecs import synthesise_lightcurve
+
+# The operations we benchmark, each a function of a lightcurve
+operations = [
+    ("estimate_sampling_interval", lambda lc: lc.estimate_sampling_interval()),
+    ("analyse_gaps", lambda lc: lc.analyse_gaps()),
+    ("check_fixed_step and check_fixed_step_v2",
+     lambda lc: (lc.check_fixed_step(verbose=False), lc.check_fixed_step_v2(verbose=False))),
+    ("to_fixed_step", lambda lc: lc.to_fixed_step(verbose=False)),
+    ("to_fixed_step, interpolated gaps", lambda lc: lc.to_fixed_step(verbose=False, fill_strategy='interpolate')),
+    ("multiply by lightcurve on same raster", lambda lc: lc * lc)
+]
+
+
+def remove_samples(lightcurve, gap_count, gap_length):
+    """
+    Remove a number of blocks of consecutive samples from a lightcurve, to simulate gaps in the data.
+
+    :param lightcurve:
+        The lightcurve to remove samples from.
+    :type lightcurve:
+        LightcurveArbitraryRaster
+    :param gap_count:
+        The number of gaps to create.
+    :type gap_count:
+        int
+    :param gap_length:
+        The number of samples in each gap.
+    :type gap_length:
+        int
+    :return:
+        LightcurveArbitraryRaster
+    """
+    rng = np.random.default_rng(1)
+    keep = np.ones(len(lightcurve.times), dtype=bool)
+    for gap_start in rng.integers(1, len(keep) - gap_length - 1, size=gap_count):
+        keep[gap_start:gap_start + gap_length] = False
+
+    return LightcurveArbitraryRaster(times=lightcurve.times[keep],
+                                     fluxes=lightcurve.fluxes[keep],
+                                     uncertainties=lightcurve.uncertainties[keep],
+                                     flags=lightcurve.flags[keep],
+                                     metadata=lightcurve.metadata)
+
+
+def benchmark_operations(lightcurve, repeats):
+    """
+    Perform each of the operations we benchmark on a lightcurve, timing each one.
+
+    :param lightcurve:
+        The lightcurve to benchmark.
+    :type lightcurve:
+        LightcurveArbitraryRaster
+    :param repeats:
+        The number of times to repeat each operation; we report the fastest.
+    :type repeats:
+        int
+    """
+
+    print("| Operation | Time (sec) |")
+    print("|---|---|")
+
+    for name, operation in operations:
+        run_time = np.inf
+        for repeat in range(repeats):
+            start_time = time.time()
+            operation(lightcurve)
+            run_time = min(run_time, time.time() - start_time)
+
+        print("| {} | {:.3f} |".format(name, run_time))
+
+
+if __name__ == "__main__":
+    # Read command-line arguments
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', default=730, type=float, dest='duration',
+                        help="The duration of the synthetic lightcurve (days)")
+    parser.add_argument('--cadence', default=25, type=float, dest='cadence',
+                        help="The time step of the synthetic lightcurve (seconds)")
+    parser.add_argument('--gaps', default=50, type=int, dest='gaps',
+                        help="The number of gaps to create in the synthetic lightcurve")
+    parser.add_argument('--repeats', default=3, type=int, dest='repeats',
+                        help="The number of times to repeat each measurement")
+    args = parser.parse_args()
+
+    # Set up logging
+    log_file_path = os.path.join(settings.settings['dataPath'], 'plato_wp36.log')
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s:%(filename)s:%(message)s',
+                        datefmt='%d/%m/%Y %H:%M:%S',
+                        handlers=[
+                            logging.FileHandler(log_file_path),
+                            logging.StreamHandler()
+                        ])
+    logger = logging.getLogger(__name__)
+    logger.info(__doc__.strip())
+
+    # Synthesise a lightcurve with some gaps in it
+    input_lc = remove_samples(lightcurve=synthesise_lightcurve(duration=args.duration, cadence=args.cadence),
+                              gap_count=args.gaps, gap_length=10)
+
+    # Run benchmark
+    benchmark_operations(lightcurve=input_lc, repeats=args.repeats)
@@ -0,0 +1,216 @@
+#!../../../../datadir_local/virtualenv/bin/python3
+# -*- coding: utf-8 -*-
+# convert_lcsg_to_shards.py
+
+"""
+Convert a directory tree of LCSG lightcurves (gzipped CSV files) into shard files in our binary lightcurve archive,
+using a pool of worker processes. Lightcurves which have already been converted, and whose source files have not
+changed since, are skipped.
+"""
+
+import fnmatch
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+
+import argparse
+from plato_wp36 import settings
+from plato_wp36.lc_archive import LightcurveArchive
+from plato_wp36.lc_reader_lcsg import read_lcsg_lightcurve
+
+# Number of lightcurves we convert before rewriting a shard's index
+batch_size = 64
+
+# The first two bytes of every gzip stream
+gzip_magic = b'\x1f\x8b'
+
+
+def shard_name(lightcurve_name, shard_count):
+    """
+    Return the filename of the shard which a particular lightcurve is stored in.
+
+    :param lightcurve_name:
+        The name of the lightcurve, i.e. its path relative to the input directory.
+    :type lightcurve_name:
+        str
+    :param shard_count:
+        The total number of shards we are spreading the lightcurves over.
+    :type shard_count:
+        int
+    :return:
+        str
+    """
+    return "lcsg_{:04d}.shard".format(zlib.crc32(lightcurve_name.encode('utf-8')) % shard_count)
+
+
+def is_gzipped(file_path):
+    """
+    Test whether a file is gzip-compressed, by looking for the gzip magic bytes at the start of the file. LCSG
+    lightcurves are gzipped regardless of their filename, so we cannot rely on their filename extension.
+
+    :param file_path:
+        The full path of the file to test.
+    :type file_path:
+        str
+    :return:
+        bool
+    """
+    with open(file_path, "rb") as f:
+        return f.read(len(gzip_magic)) == gzip_magic
+
+
+def list_lightcurves(input_directory, pattern):
+    """
+    Make a list of all the LCSG lightcurves within a directory tree.
+
+    :param input_directory:
+        The directory, within <datadir_input>, which we search for lightcurves.
+    :type input_directory:
+        str
+    :param pattern:
+        Filename pattern which lightcurves must match.
+    :type pattern:
+        str
+    :return:
+        List of lightcurve names, as paths relative to <input_directory>
+    """
+    root = os.path.join(settings.settings['lcPath'], input_directory)
+    output = []
+    for directory, subdirectories, filenames in os.walk(root):
+        for filename in fnmatch.filter(filenames, pattern):
+            output.append(os.path.relpath(os.path.join(directory, filename), root))
+    return sorted(output)
+
+
+def convert_shard(job):
+    """
+    Convert all of the lightcurves which belong in a single shard. This is run within a worker process.
+
+    :param job:
+        Tuple of (input directory, output directory, shard filename, list of lightcurve names)
+    :type job:
+        tuple
+    :return:
+        Tuple of (number of lightcurves converted, number of lightcurves skipped)
+    """
+    input_directory, output_directory, shard, lightcurve_names = job
+    archive = LightcurveArchive(directory=output_directory, shard=shard)
+
+    converted = 0
+    skipped = 0
+    batch = []
+    for name in lightcurve_names:
+        # Skip lightcurves whose source file hasn't changed since they were last converted
+        file_path = os.path.join(settings.settings['lcPath'], input_directory, name)
+        status = os.stat(file_path)
+        provenance = {
+            'source_mtime': status.st_mtime,
+            'source_size': status.st_size
+        }
+        if archive.provenance(name=name) == provenance:
+            skipped += 1
+            continue
+
+        lc = read_lcsg_lightcurve(filename=name, directory=input_directory, gzipped=is_gzipped(file_path))
+        batch.append((name, lc, provenance))
+        converted += 1
+
+        if len(batch) >= batch_size:
+            archive.write_many(items=batch)
+            batch = []
+
+    if len(batch) > 0:
+        archive.write_many(items=batch)
+
+    return converted, skipped
+
+
+def convert_lightcurves(input_directory, output_directory, pattern, shard_count, process_count):
+    """
+    Convert a directory tree of LCSG lightcurves into shard files.
+
+    :param input_directory:
+        The directory, within <datadir_input>, which we search for LCSG lightcurves.
+    :type input_directory:
+        str
+    :param output_directory:
+        The directory, within <datadir_input>, where we write shard files.
+    :type output_directory:
+        str
+    :param pattern:
+        Filename pattern which LCSG lightcurves must match.
+    :type pattern:
+        str
+    :param shard_count:
+        The number of shards to spread the lightcurves over.
+    :type shard_count:
+        int
+    :param process_count:
+        The number of worker processes to use.
+    :type process_count:
+        int
+    """
+    start_time = time.time()
+
+    # Assign each lightcurve to a shard. Each shard is converted by a single worker, so workers never contend for locks.
+    lightcurve_names = list_lightcurves(input_directory=input_directory, pattern=pattern)
+    shards = {}
+    for name in lightcurve_names:
+        shards.setdefault(shard_name(lightcurve_name=name, shard_count=shard_count), []).append(name)
+
+    logging.info("Converting {:d} lightcurves into {:d} shards using {:d} processes".format(
+        len(lightcurve_names), len(shards), process_count))
+
+    jobs = [(input_directory, output_directory, shard, names) for shard, names in sorted(shards.items())]
+
+    total_converted = 0
+    total_skipped = 0
+    with multiprocessing.Pool(processes=process_count) as pool:
+        for converted, skipped in pool.imap_unordered(convert_shard, jobs):
+            total_converted += converted
+            total_skipped += skipped
+            elapsed = time.time() - start_time
+            logging.info("{:d} converted, {:d} skipped, {:d} remaining ({:.1f} lightcurves/sec)".format(
+                total_converted, total_skipped, len(lightcurve_names) - total_converted - total_skipped,
+                total_converted / max(elapsed, 1e-6)))
+
+    elapsed = time.time() - start_time
+    logging.info("Finished: converted {:d} lightcurves in {:.1f} sec ({:.1f} lightcurves/sec); skipped {:d}".format(
+        total_converted, elapsed, total_converted / max(elapsed, 1e-6), total_skipped))
+
+
+if __name__ == "__main__":
+    # Read command-line arguments
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--input', default="lightcurves_v2/csvs/bright", type=str, dest='input_directory',
+                        help="The directory within <datadir_input> to search for LCSG lightcurves")
+    parser.add_argument('--output', default="lightcurves_v2/shards/bright", type=str, dest='output_directory',
+                        help="The directory within <datadir_input> where we write shard files")
+    parser.add_argument('--pattern', default="plato_bright*", type=str, dest='pattern',
+                        help="Filename pattern which LCSG lightcurves must match")
+    parser.add_argument('--shards', default=64, type=int, dest='shard_count',
+                        help="The number of shard files to spread the lightcurves over")
+    parser.add_argument('--processes', default=len(os.sched_getaffinity(0)), type=int, dest='process_count',
+                        help="The number of worker processes to use (default: the number of CPUs available)")
+    args = parser.parse_args()
+
+    # Set up logging
+    log_file_path = os.path.join(settings.settings['dataPath'], 'plato_wp36.log')
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s:%(filename)s:%(message)s',
+                        datefmt='%d/%m/%Y %H:%M:%S',
+                        handlers=[
+                            logging.FileHandler(log_file_path),
+                            logging.StreamHandler()
+                        ])
+    logger = logging.getLogger(__name__)
+    logger.info(__doc__.strip())
+
+    # Convert lightcurves
+    convert_lightcurves(input_directory=args.input_directory,
+                        output_directory=args.output_directory,
+                        pattern=args.pattern,
+                        shard_count=args.shard_count,
+                        process_count=args.process_count)